@@ -0,0 +1,18 @@
+"""
+Офлайн-бенчмарки бота.
+
+Реальные хендлеры и сервисы (парсинг участников, глобальный поиск групп,
+кампании инвайтов) работают с поддельным клиентом Telethon из fakes.py и
+временной SQLite, без сети и аккаунтов. Запуск: python -m benchmarks.run
+
+webhook_load.py - нагрузочный тест aiohttp-приложения вебхука с теми же
+заглушками вместо Telegram: python -m benchmarks.webhook_load
+"""
+import os
+
+# Бенчмарки работают без сети и аккаунтов; дневной лимит инвайтов не должен
+# обрывать кампанию посередине. Задаётся до импорта config.
+os.environ.setdefault("BOT_TOKEN", "42:benchmark")
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("API_HASH", "benchmark")
+os.environ.setdefault("DAILY_INVITE_LIMIT", str(10 ** 9))
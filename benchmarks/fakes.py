@@ -0,0 +1,445 @@
+"""
+Поддельные Telegram-клиенты для офлайн-бенчмарков.
+
+FakeTelegramClient отвечает на те запросы MTProto, которые делает бот
+(GetParticipantsRequest, contacts.SearchRequest, GetFullChannelRequest,
+InviteToChannelRequest, история сообщений, разрешение username), данными
+синтетических групп. Задержка ответа и FloodWait задаются параметрами,
+каждый запрос учитывается в calls по имени метода. Поддельный здесь только
+сервер: запросы идут через настоящий RateLimitedClient._call и RateLimiter,
+который пул назначает клиенту, поэтому паузы ограничителя и FloodWait
+бенчмарки видят так же, как бот в работе.
+
+FakeBot - замена aiogram.Bot для Outbox: правки сообщений только считаются.
+FakeBotSession - сессия настоящего aiogram.Bot без сети: ответы Bot API
+собираются на месте и проходят обычную проверку aiogram.
+"""
+import asyncio
+import json
+import random
+import struct
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence
+
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import ClientDecodeError
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError, UserPrivacyRestrictedError
+from telethon.tl.functions.contacts import ResolveUsernameRequest
+from telethon.tl.functions.messages import GetHistoryRequest
+from telethon.tl.types import (
+    Channel,
+    ChannelParticipant,
+    ChannelParticipantsRecent,
+    ChannelParticipantsSearch,
+    ChatPhotoEmpty,
+    InputPeerChannel,
+    InputPeerUser,
+    User,
+)
+from telethon.tl.types.channels import ChannelParticipants, ChannelParticipantsNotModified
+from telethon.tl.types.contacts import Found
+
+from config import PARSE_QUERY_CAP
+from utils.rate_limiter import RateLimitedClient
+
+LATIN = "abcdefghijklmnopqrstuvwxyz"
+CYRILLIC = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+
+USER_ID_BASE = 1_000_000
+CHAT_ID_BASE = 5_000_000
+
+# Доля участников без username и ботов
+NO_USERNAME_RATE = 0.2
+BOT_RATE = 0.01
+# Приглашение не проходит у каждого PRIVACY_MOD-го пользователя (missing_invitees),
+# а у каждого REJECT_MOD-го Telegram отклоняет весь запрос
+PRIVACY_MOD = 7
+REJECT_MOD = 97
+# Сколько последних поисковых выдач помнить (один префикс запрашивается постранично)
+SEARCH_MEMO_SIZE = 64
+
+
+def _word(rng: random.Random, alphabet: str, low: int, high: int) -> str:
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+
+def _chat_id(peer) -> int:
+    return getattr(peer, 'channel_id', None) or peer.id
+
+
+def _server_hash(ids) -> int:
+    """
+    Хэш выдачи так, как его считает сервер (алгоритм "Hash generation" из
+    документации MTProto): по ID в порядке выдачи, 64 бита с переполнением.
+    Считается здесь отдельно от кода бота, чтобы бенчмарк проверял его хэш.
+    """
+    value = 0
+    for item in ids:
+        value = (value ^ (value >> 21)) % 2 ** 64
+        value = (value ^ (value << 35)) % 2 ** 64
+        value = (value ^ (value >> 4)) % 2 ** 64
+        value = (value + item) % 2 ** 64
+    return struct.unpack("<q", struct.pack("<Q", value))[0]
+
+
+class Members:
+    """
+    Участники синтетической группы: колонки вместо объектов User, плюс
+    отсортированные ключи для поиска по префиксу username и имени.
+    """
+
+    def __init__(self, count: int, seed: int = 0, first_id: int = USER_ID_BASE):
+        self.first_id = first_id
+        self.usernames: List[Optional[str]] = []
+        self.first_names: List[str] = []
+        self.bots: List[bool] = []
+        self.join(count, seed)
+
+    def join(self, count: int, seed: int = 0):
+        """Добавляет count новых участников (в ChannelParticipantsRecent они первые)."""
+        rng = random.Random(seed)
+        first = len(self.usernames)
+        for i in range(first, first + count):
+            has_username = rng.random() >= NO_USERNAME_RATE
+            self.usernames.append(f"{_word(rng, LATIN, 3, 8)}{self.first_id + i}" if has_username else None)
+            self.first_names.append(_word(rng, rng.choice((LATIN, CYRILLIC)), 3, 8).capitalize())
+            self.bots.append(rng.random() < BOT_RATE)
+        self._reindex()
+
+    def _reindex(self):
+        self._by_username = sorted((u, i) for i, u in enumerate(self.usernames) if u)
+        self._by_name = sorted((n.lower(), i) for i, n in enumerate(self.first_names))
+        self._username_keys = [key for key, _ in self._by_username]
+        self._name_keys = [key for key, _ in self._by_name]
+        self.index = {u: i for i, u in enumerate(self.usernames) if u}
+        self._memo: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+    def user_id(self, i: int) -> int:
+        return self.first_id + i
+
+    def user(self, i: int) -> User:
+        return User(
+            id=self.user_id(i),
+            access_hash=self.user_id(i) * 31,
+            first_name=self.first_names[i],
+            username=self.usernames[i],
+            bot=self.bots[i],
+        )
+
+    @staticmethod
+    def _prefixed(keys, pairs, query) -> List[int]:
+        result = []
+        for j in range(bisect_left(keys, query), len(keys)):
+            if not keys[j].startswith(query):
+                break
+            result.append(pairs[j][1])
+        return result
+
+    def search(self, query: str) -> Sequence[int]:
+        """Индексы участников, у которых username или имя начинается с query."""
+        query = query.lower()
+        if not query:
+            return range(len(self))
+        if query in self._memo:
+            self._memo.move_to_end(query)
+            return self._memo[query]
+        found = set(self._prefixed(self._username_keys, self._by_username, query))
+        found.update(self._prefixed(self._name_keys, self._by_name, query))
+        result = self._memo[query] = sorted(found)
+        if len(self._memo) > SEARCH_MEMO_SIZE:
+            self._memo.popitem(last=False)
+        return result
+
+
+class FakeChat:
+    def __init__(self, chat_id: int, username: str, title: str, comments_enabled: bool = False,
+                 has_user_messages: bool = False, members: Optional[Members] = None):
+        self.id = chat_id
+        self.access_hash = chat_id * 17
+        self.username = username
+        self.title = title
+        self.comments_enabled = comments_enabled
+        self.has_user_messages = has_user_messages
+        self.members = members
+
+    def channel(self) -> Channel:
+        return Channel(
+            id=self.id,
+            title=self.title,
+            photo=ChatPhotoEmpty(),
+            date=datetime(2020, 1, 1, tzinfo=timezone.utc),
+            megagroup=True,
+            access_hash=self.access_hash,
+            username=self.username,
+            participants_count=len(self.members) if self.members else 0,
+        )
+
+    def input_peer(self) -> InputPeerChannel:
+        return InputPeerChannel(self.id, self.access_hash)
+
+
+class _FakeServer(TelegramClient):
+    """
+    Сервер MTProto в памяти на месте TelegramClient._call: отвечает
+    обработчиком _on_<метод>, в том числе FloodWaitError.
+
+    latency/jitter - задержка каждого запроса (секунды), flood_every - каждый
+    N-й запрос метода отвечает FloodWait на flood_seconds (0 - без FloodWait).
+    """
+
+    def __init__(self, me_id: int = 1, latency: float = 0.0, jitter: float = 0.0,
+                 flood_every: int = 0, flood_seconds: int = 1, seed: int = 0):
+        # TelegramClient.__init__ не вызываем: сессия и соединение не нужны
+        self._sender = None
+        self.me_id = me_id
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+        self.calls: Counter = Counter()
+        self.floods: Counter = Counter()
+        self.not_modified = 0
+        self.chats: Dict[int, FakeChat] = {}
+        self.by_username: Dict[str, FakeChat] = {}
+        self.search_index: Dict[str, List[int]] = {}
+        self._rng = random.Random(seed)
+
+    # --- Наполнение ---
+
+    def add_group(self, username: str, members: Members, title: Optional[str] = None) -> FakeChat:
+        chat = FakeChat(CHAT_ID_BASE + len(self.chats), username, title or username,
+                        comments_enabled=True, has_user_messages=True, members=members)
+        self._add_chat(chat)
+        return chat
+
+    def add_search_results(self, keywords: List[str], chats_per_keyword: int = 30, pool_size: int = 500,
+                           active_rate: float = 0.5):
+        """
+        Выдача поиска для ключевых слов: чаты берутся из общего набора
+        pool_size, поэтому выдачи разных слов пересекаются.
+        """
+        first = len(self.chats)
+        for i in range(pool_size):
+            chat_id = CHAT_ID_BASE + first + i
+            active = self._rng.random() < active_rate
+            self._add_chat(FakeChat(
+                chat_id,
+                username=f"chat{chat_id}" if self._rng.random() > 0.05 else None,
+                title=f"Чат {chat_id}",
+                comments_enabled=active and self._rng.random() < 0.5,
+                has_user_messages=active,
+            ))
+        ids = [CHAT_ID_BASE + first + i for i in range(pool_size)]
+        for keyword in keywords:
+            self.search_index[keyword] = self._rng.sample(ids, min(chats_per_keyword, pool_size))
+
+    def _add_chat(self, chat: FakeChat):
+        self.chats[chat.id] = chat
+        if chat.username:
+            self.by_username[chat.username.lower()] = chat
+
+    def _find_member(self, username: str):
+        for chat in self.chats.values():
+            if chat.members and username in chat.members.index:
+                return chat.members, chat.members.index[username]
+        return None, None
+
+    # --- API TelegramClient ---
+
+    async def get_me(self, input_peer: bool = False):
+        if input_peer:
+            return InputPeerUser(self.me_id, 0)
+        return User(id=self.me_id, is_self=True, first_name="Bench")
+
+    async def get_input_entity(self, username: str):
+        return await self(ResolveUsernameRequest(username.lstrip('@').lower()))
+
+    async def iter_messages(self, entity, limit: Optional[int] = None):
+        messages = await self(GetHistoryRequest(
+            peer=entity, offset_id=0, offset_date=None, add_offset=0,
+            limit=limit or 10, max_id=0, min_id=0, hash=0,
+        ))
+        for message in messages:
+            yield message
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def disconnect(self):
+        pass
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        method = type(request).__name__
+        await self._rpc(method, request)
+        handler = getattr(self, f"_on_{method}", None)
+        if handler is None:
+            raise NotImplementedError(f"FakeTelegramClient: {method} не поддерживается")
+        return handler(request)
+
+    async def _rpc(self, method: str, request):
+        self.calls[method] += 1
+        delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+        # sleep(0) тоже отдаёт управление, как настоящий сетевой запрос
+        await asyncio.sleep(delay)
+        if self.flood_every and self.calls[method] % self.flood_every == 0:
+            self.floods[method] += 1
+            raise FloodWaitError(request, capture=self.flood_seconds)
+
+    # --- Обработчики запросов ---
+
+    def _on_ResolveUsernameRequest(self, request):
+        # Сразу InputPeer: get_input_entity настоящего клиента достаёт его из ответа
+        chat = self.by_username.get(request.username)
+        if chat:
+            return chat.input_peer()
+        members, i = self._find_member(request.username)
+        if members is None:
+            raise ValueError(f'No user has "{request.username}" as username')
+        return InputPeerUser(members.user_id(i), members.user_id(i) * 31)
+
+    def _on_GetHistoryRequest(self, request):
+        chat = self.chats[_chat_id(request.peer)]
+        return [
+            SimpleNamespace(sender=SimpleNamespace(bot=not chat.has_user_messages))
+            for _ in range(request.limit)
+        ]
+
+    def _on_GetParticipantsRequest(self, request):
+        members = self.chats[_chat_id(request.channel)].members
+        if isinstance(request.filter, ChannelParticipantsSearch):
+            matches = members.search(request.filter.q)
+        elif isinstance(request.filter, ChannelParticipantsRecent):
+            # Недавно вступившие - первыми
+            matches = range(len(members) - 1, -1, -1)
+        else:
+            raise NotImplementedError(f"Фильтр {type(request.filter).__name__} не поддерживается")
+        # Как и Telegram, по одному запросу отдаём не больше PARSE_QUERY_CAP участников
+        visible = matches[:PARSE_QUERY_CAP]
+        page = visible[request.offset:request.offset + request.limit]
+        if request.hash and request.hash == _server_hash([members.user_id(i) for i in page]):
+            self.not_modified += 1
+            return ChannelParticipantsNotModified()
+        # Как у Telegram, users - справочник без повторов и без порядка выдачи,
+        # в нём бывают и пользователи не со страницы (здесь - создатель группы)
+        users = sorted(set(page) | ({0} if len(members) else set()))
+        date = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        return ChannelParticipants(
+            count=len(matches),
+            participants=[ChannelParticipant(user_id=members.user_id(i), date=date) for i in page],
+            chats=[],
+            users=[members.user(i) for i in users],
+        )
+
+    def _on_SearchRequest(self, request):
+        ids = self.search_index.get(request.q, [])[:request.limit]
+        return Found(my_results=[], results=[], chats=[self.chats[i].channel() for i in ids], users=[])
+
+    def _on_GetFullChannelRequest(self, request):
+        chat = self.chats[_chat_id(request.channel)]
+        full_chat = SimpleNamespace(
+            comments_enabled=chat.comments_enabled,
+            participants_count=len(chat.members) if chat.members else 0,
+            linked_chat_id=None,
+        )
+        return SimpleNamespace(full_chat=full_chat, chats=[chat.channel()], users=[])
+
+    def _on_InviteToChannelRequest(self, request):
+        if any(user.user_id % REJECT_MOD == 0 for user in request.users):
+            raise UserPrivacyRestrictedError(request)
+        missing = [
+            SimpleNamespace(user_id=user.user_id)
+            for user in request.users
+            if user.user_id % PRIVACY_MOD == 0
+        ]
+        return SimpleNamespace(missing_invitees=missing, updates=[])
+
+
+class FakeTelegramClient(RateLimitedClient, _FakeServer):
+    """
+    Клиент Telethon в памяти: RateLimitedClient поверх поддельного сервера.
+    Пока пул не назначил rate_limiter, запросы идут на сервер напрямую.
+    """
+
+
+class FakeBot:
+    """Вместо aiogram.Bot: считает правки сообщений, ничего не отправляя."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        self.calls["editMessageText"] += 1
+        await asyncio.sleep(self.latency)
+        return True
+
+
+class FakeCallback:
+    """CallbackQuery с тем минимумом, который нужен хендлерам."""
+
+    def __init__(self, data: str, chat_id: int = 1, message_id: int = 1):
+        self.data = data
+        self.from_user = SimpleNamespace(id=chat_id)
+        self.message = SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id)
+        self.answers: List[Optional[str]] = []
+
+    async def answer(self, text: Optional[str] = None, **kwargs):
+        self.answers.append(text)
+
+
+class FakeBotSession(BaseSession):
+    """
+    Вместо HTTP-запросов к Bot API: для каждого метода подбирается ответ
+    подходящего вида (True, Message, User, пустой список) и запоминается.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._shapes: Dict[type, str] = {}
+        self._message_id = 0
+
+    def _result(self, shape: str, method):
+        if shape == "message":
+            self._message_id += 1
+            chat_id = getattr(method, "chat_id", None)
+            return {
+                "message_id": getattr(method, "message_id", None) or self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id if isinstance(chat_id, int) else 0, "type": "private"},
+                "text": getattr(method, "text", None),
+            }
+        if shape == "user":
+            return {"id": 42, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if shape == "list":
+            return []
+        return True
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        await asyncio.sleep(self.latency)
+        known = self._shapes.get(type(method))
+        for shape in [known] if known else ["true", "message", "user", "list"]:
+            content = json.dumps({"ok": True, "result": self._result(shape, method)})
+            try:
+                response = self.check_response(bot, method, 200, content)
+            except ClientDecodeError:
+                continue
+            self._shapes[type(method)] = shape
+            return response.result
+        raise NotImplementedError(f"FakeBotSession: нет ответа для {type(method).__name__}")
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
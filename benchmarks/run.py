@@ -0,0 +1,214 @@
+"""
+Запуск офлайн-бенчмарков.
+
+    python -m benchmarks.run                      # все сценарии
+    python -m benchmarks.run parse_10k search_50  # выбранные
+    python -m benchmarks.run --list
+    python -m benchmarks.run --compare HEAD~1     # сравнить с результатами другого коммита
+    python -m benchmarks.run --latency 0.05       # задержка каждого запроса MTProto
+    python -m benchmarks.run --rate-scale 1       # реальные лимиты RateLimiter
+
+Для каждого сценария измеряются время, пропускная способность, число
+запросов MTProto по методам, FloodWait, паузы RateLimiter (ожидание токенов
+и FloodWait; лимиты ускорены в --rate-scale раз, pacing_real_s - оценка
+ожидания токенов при настоящих лимитах), число записей и чтений БД, правки
+сообщений Bot API и пиковая память Python (tracemalloc - он же немного
+замедляет прогон; --no-memory отключает). Результаты сохраняются в
+benchmarks/results/<коммит>.json, чтобы сравнивать их между коммитами.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from benchmarks.scenarios import RATE_SCALE, Scenario, environment, get, SCENARIOS
+from utils.metrics import DB_QUERY_DURATION
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+WRITE_OPS = ("execute", "executemany", "transaction")
+READ_OPS = ("fetchone", "fetchall")
+# Что показывать при сравнении: (ключ, чем меньше - тем лучше)
+COMPARED = (
+    ("wall_s", True),
+    ("throughput", False),
+    ("rpc", True),
+    ("db_writes", True),
+    ("peak_mb", True),
+)
+
+
+def _db_counts() -> Dict[str, int]:
+    return {key[0]: state[2] for key, state in DB_QUERY_DURATION._values.items()}
+
+
+def _git(*args) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(RESULTS_DIR),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def current_revision() -> str:
+    revision = _git("rev-parse", "--short", "HEAD") or "unknown"
+    if _git("status", "--porcelain", "--untracked-files=no"):
+        revision += "-dirty"
+    return revision
+
+
+async def run_scenario(scenario: Scenario, latency: float, memory: bool, rate_scale: float = RATE_SCALE) -> dict:
+    options = {"latency": latency, **scenario.client_options}
+    async with environment(rate_scale, **options) as env:
+        await scenario.setup(env)
+        limiter = env.client.rate_limiter
+        calls_before = env.client.calls.copy()
+        floods_before = sum(env.client.floods.values())
+        paced_before, blocked_before = limiter.paced_seconds, limiter.blocked_seconds
+        edits_before = sum(env.bot.calls.values())
+        db_before = _db_counts()
+
+        if memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            items = await scenario.run(env)
+            wall = time.perf_counter() - started
+        finally:
+            peak = tracemalloc.get_traced_memory()[1] if memory else 0
+            if memory:
+                tracemalloc.stop()
+
+        db_after = _db_counts()
+        db = {op: db_after.get(op, 0) - db_before.get(op, 0) for op in db_after}
+        calls = env.client.calls - calls_before
+        paced = limiter.paced_seconds - paced_before
+        writes = sum(db.get(op, 0) for op in WRITE_OPS)
+        return {
+            "description": scenario.description,
+            "unit": scenario.unit,
+            "items": items,
+            "wall_s": round(wall, 4),
+            "throughput": round(items / wall, 1) if wall else 0,
+            "rpc": sum(calls.values()),
+            "rpc_by_method": dict(calls),
+            "flood_waits": sum(env.client.floods.values()) - floods_before,
+            "pacing_s": round(paced, 4),
+            "pacing_real_s": round(paced * rate_scale, 1),
+            "flood_sleep_s": round(limiter.blocked_seconds - blocked_before, 4),
+            "db_writes": writes,
+            "db_writes_per_s": round(writes / wall, 1) if wall else 0,
+            "db_reads": sum(db.get(op, 0) for op in READ_OPS),
+            "bot_edits": sum(env.bot.calls.values()) - edits_before,
+            "peak_mb": round(peak / 2 ** 20, 2) if memory else None,
+        }
+
+
+def print_result(name: str, result: dict):
+    peak = f"{result['peak_mb']} МБ" if result["peak_mb"] is not None else "-"
+    print(
+        f"{name:<18} {result['wall_s']:>8.3f} с  {result['throughput']:>10.1f} {result['unit']}/с  "
+        f"RPC {result['rpc']:>6}  FloodWait {result['flood_waits']:>3}  "
+        f"паузы {result['pacing_s']:.3f} с (реально {result['pacing_real_s']} с) + FloodWait {result['flood_sleep_s']:.3f} с  "
+        f"БД запись {result['db_writes']:>5} ({result['db_writes_per_s']}/с)  "
+        f"правок {result['bot_edits']:>4}  память {peak}"
+    )
+
+
+def results_path(revision: str) -> str:
+    return os.path.join(RESULTS_DIR, f"{revision}.json")
+
+
+def save(report: dict) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = results_path(report["revision"])
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load(revision: str) -> dict:
+    # Принимаем и ссылки git (HEAD~1, main), и готовые имена файлов (abc1234-dirty)
+    short = _git("rev-parse", "--short", revision) or revision
+    for candidate in (short, revision):
+        path = results_path(candidate)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+    raise FileNotFoundError(f"Нет сохранённых результатов для {revision} в {RESULTS_DIR}")
+
+
+def compare(baseline: dict, report: dict):
+    print(f"\nСравнение с {baseline['revision']}:")
+    for name, result in report["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if not old:
+            print(f"{name:<18} нет в базовых результатах")
+            continue
+        parts = []
+        for key, lower_is_better in COMPARED:
+            before, after = old.get(key), result.get(key)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            better = change < 0 if lower_is_better else change > 0
+            mark = "" if abs(change) < 5 else (" ✅" if better else " ❌")
+            parts.append(f"{key} {before} → {after} ({change:+.1f}%){mark}")
+        print(f"{name:<18} " + "; ".join(parts))
+
+
+async def main(args):
+    scenarios = get(args.scenarios)
+    report = {
+        "revision": current_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "latency": args.latency,
+        "rate_scale": args.rate_scale,
+        "scenarios": {},
+    }
+    for scenario in scenarios:
+        result = await run_scenario(scenario, args.latency, memory=not args.no_memory, rate_scale=args.rate_scale)
+        report["scenarios"][scenario.name] = result
+        print_result(scenario.name, result)
+
+    if not args.no_save:
+        print(f"\nРезультаты сохранены в {save(report)}")
+    if args.compare:
+        compare(load(args.compare), report)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки бота с поддельным клиентом Telethon")
+    parser.add_argument("scenarios", nargs="*", help="имена сценариев (по умолчанию все)")
+    parser.add_argument("--list", action="store_true", help="показать сценарии и выйти")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка запроса MTProto, секунды")
+    parser.add_argument("--rate-scale", type=float, default=RATE_SCALE,
+                        help="во сколько раз ускорить лимиты RateLimiter (1 - настоящие паузы)")
+    parser.add_argument("--compare", metavar="REV", help="сравнить с сохранёнными результатами коммита")
+    parser.add_argument("--no-save", action="store_true", help="не сохранять результаты")
+    parser.add_argument("--no-memory", action="store_true", help="не измерять память (tracemalloc)")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:<18} {scenario.description}")
+        sys.exit(0)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(main(args))
+    except (KeyError, FileNotFoundError) as e:
+        sys.exit(str(e))
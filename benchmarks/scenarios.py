@@ -0,0 +1,224 @@
+"""
+Сценарии бенчмарков.
+
+Каждый сценарий готовит данные (setup, не измеряется) и прогоняет реальный
+код бота (run). run возвращает число обработанных единиц - по нему
+считается пропускная способность. Окружение на каждый сценарий своё:
+временная БД с миграциями, пул из одного поддельного аккаунта (его запросы
+идут через RateLimiter с лимитами, ускоренными в rate_scale раз), Outbox
+без пауз между правками.
+"""
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, NamedTuple
+
+from benchmarks.fakes import FakeBot, FakeCallback, FakeTelegramClient, Members
+from database import AsyncDatabase, run_migrations
+from handlers.group_parsing import iter_global_search
+from handlers.user_parsing import parse_users_callback
+from utils.campaigns import InviteCampaigns
+from utils.member_sync import MemberSync
+from utils.outbox import Outbox
+from utils.parse_jobs import ParseJobs
+from utils.search_cache import SearchCache
+from utils.session_pool import SessionPool
+from utils.tasks import TaskManager
+
+# Доля контактов кампании, чьи username уже не существуют
+UNKNOWN_CONTACT_RATE = 0.05
+# Во сколько раз лимиты RateLimiter быстрее настоящих (1 - реальные паузы)
+RATE_SCALE = 1000.0
+
+
+class Env:
+    """Окружение сценария; сценарии складывают в state свои данные."""
+
+    def __init__(self, db, client: FakeTelegramClient, pool: SessionPool, bot: FakeBot, outbox: Outbox):
+        self.db = db
+        self.client = client
+        self.pool = pool
+        self.bot = bot
+        self.outbox = outbox
+        self.state: Dict[str, object] = {}
+
+
+@asynccontextmanager
+async def environment(rate_scale: float = RATE_SCALE, **client_options):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db = AsyncDatabase(os.path.join(tmpdir, "bench.db"))
+        await db.connect()
+        await run_migrations(db)
+        client = FakeTelegramClient(**client_options)
+        pool = SessionPool(db)
+        await pool.add("bench", client)
+        client.rate_limiter.scale = rate_scale
+        bot = FakeBot()
+        # Лимиты Bot API здесь не нужны: измеряем бота, а не паузы очереди
+        outbox = Outbox(bot, chat_interval=0, global_rate=10_000)
+        outbox.start()
+        try:
+            yield Env(db, client, pool, bot, outbox)
+        finally:
+            await outbox.stop()
+            await pool.close()
+            await db.close()
+
+
+class Scenario(NamedTuple):
+    name: str
+    description: str
+    unit: str
+    setup: Callable[[Env], Awaitable[None]]
+    run: Callable[[Env], Awaitable[int]]
+    client_options: Dict[str, object] = {}
+
+
+async def _add_group(env: Env, username: str, members: int) -> int:
+    env.client.add_group(username, Members(members, seed=members))
+    cursor = await env.db.execute("INSERT INTO groups (name, username) VALUES (?, ?)", (username, username))
+    return cursor.lastrowid
+
+
+# --- Парсинг участников ---
+
+def _parse_setup(members: int):
+    async def setup(env: Env):
+        env.state["group_id"] = await _add_group(env, f"group{members}", members)
+    return setup
+
+
+async def _parse_run(env: Env) -> int:
+    group_id = env.state["group_id"]
+    callback = FakeCallback(f"parse_users_{group_id}")
+    task_manager = TaskManager()
+    await parse_users_callback(
+        callback,
+        db=env.db,
+        entity_cache=env.pool.primary.entity_cache,
+        session_pool=env.pool,
+        outbox=env.outbox,
+        task_manager=task_manager,
+        parse_jobs=ParseJobs(env.db),
+        member_sync=MemberSync(env.db, env.pool),
+        telethon_client=env.client,
+    )
+    # Хендлер только ставит задачу - ждём сам парсинг
+    for task in list(task_manager.tasks.values()):
+        await task.wait()
+    row = await env.db.fetchone("SELECT COUNT(*) FROM contacts WHERE group_id = ?", (group_id,))
+    if not row[0]:
+        raise RuntimeError("Парсинг не сохранил ни одного контакта")
+    return row[0]
+
+
+def _reparse_setup(members: int, joined: int):
+    async def setup(env: Env):
+        await _parse_setup(members)(env)
+        await _parse_run(env)
+        env.client.by_username[f"group{members}"].members.join(joined, seed=joined)
+        row = await env.db.fetchone("SELECT COUNT(*) FROM contacts WHERE group_id = ?", (env.state["group_id"],))
+        env.state["contacts"] = row[0]
+    return setup
+
+
+async def _reparse_run(env: Env) -> int:
+    """Повторный парсинг: сохраняются только вступившие после полного перебора."""
+    new = await _parse_run(env) - env.state["contacts"]
+    if not new:
+        raise RuntimeError("Повторный парсинг не нашёл новых участников")
+    return new
+
+
+async def _reparse_unchanged_run(env: Env) -> int:
+    """Повторный парсинг группы без изменений: один ответ NotModified по хэшу первой страницы."""
+    before = env.client.calls["GetParticipantsRequest"], env.client.not_modified
+    await _parse_run(env)
+    requests = env.client.calls["GetParticipantsRequest"] - before[0]
+    if requests != 1 or env.client.not_modified - before[1] != 1:
+        raise RuntimeError(f"Неизменная группа стоила {requests} запросов без ответа NotModified")
+    return 1
+
+
+# --- Глобальный поиск групп ---
+
+KEYWORDS = [f"ключ{i}" for i in range(50)]
+
+
+async def _search_setup(env: Env):
+    env.client.add_search_results(KEYWORDS)
+    env.state["cache"] = SearchCache(env.db)
+    await env.state["cache"].load()
+
+
+async def _search_cached_setup(env: Env):
+    await _search_setup(env)
+    await _search_run(env)
+
+
+async def _search_run(env: Env) -> int:
+    found = [group async for group in iter_global_search(env.client, KEYWORDS, cache=env.state["cache"])]
+    if not found:
+        raise RuntimeError("Поиск не нашёл ни одной группы")
+    return len(found)
+
+
+# --- Кампания инвайтов ---
+
+async def _campaign_setup(env: Env, contacts: int = 1000):
+    members = Members(contacts, seed=contacts)
+    env.client.add_group("source", members)
+    group_id = await _add_group(env, "target", 0)
+    usernames = [u for u in members.usernames if u]
+    unknown = int(len(usernames) * UNKNOWN_CONTACT_RATE)
+    usernames = usernames[:len(usernames) - unknown] + [f"gone{i}" for i in range(unknown)]
+    await env.db.executemany(
+        "INSERT INTO contacts (username, group_id) VALUES (?, ?)",
+        [(username, group_id) for username in usernames],
+    )
+    campaigns = InviteCampaigns(env.db, env.pool, env.outbox)
+    await campaigns.create(group_id, chat_id=1, message_id=1, daily_limit=10 ** 9)
+    env.state.update(group_id=group_id, campaigns=campaigns, contacts=len(usernames))
+
+
+async def _campaign_run(env: Env) -> int:
+    campaigns: InviteCampaigns = env.state["campaigns"]
+    # Тот же порядок, что в воркере, но без ожидания между запусками
+    while True:
+        due = await campaigns._due_campaigns()
+        if not due:
+            break
+        for campaign in due:
+            await campaigns.run_campaign(campaign)
+    if await campaigns.get_active(env.state["group_id"]):
+        raise RuntimeError("Кампания не завершилась")
+    row = await env.db.fetchone("SELECT COUNT(*) FROM invites WHERE group_id = ?", (env.state["group_id"],))
+    return row[0]
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("parse_10k", "Парсинг группы на 10 000 участников", "users",
+             _parse_setup(10_000), _parse_run),
+    Scenario("parse_100k", "Парсинг группы на 100 000 участников (перебор по префиксам)", "users",
+             _parse_setup(100_000), _parse_run),
+    Scenario("parse_10k_flood", "Парсинг 10 000 участников, FloodWait на каждый 50-й запрос", "users",
+             _parse_setup(10_000), _parse_run, {"flood_every": 50, "flood_seconds": 1}),
+    Scenario("reparse_100k", "Повторный парсинг 100 000 участников, вступило 500", "users",
+             _reparse_setup(100_000, 500), _reparse_run),
+    Scenario("reparse_100k_unchanged", "Повторный парсинг 100 000 участников без изменений", "groups",
+             _reparse_setup(100_000, 0), _reparse_unchanged_run),
+    Scenario("search_50", "Глобальный поиск по 50 ключевым словам, пустой кэш", "groups",
+             _search_setup, _search_run),
+    Scenario("search_50_cached", "Повторный поиск по тем же 50 словам из кэша", "groups",
+             _search_cached_setup, _search_run),
+    Scenario("campaign_1k", "Кампания инвайтов на 1 000 контактов", "invites",
+             _campaign_setup, _campaign_run),
+]
+
+
+def get(names: List[str]) -> List[Scenario]:
+    by_name = {scenario.name: scenario for scenario in SCENARIOS}
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise KeyError(f"Неизвестные сценарии: {', '.join(unknown)}")
+    return [by_name[name] for name in names] if names else SCENARIOS
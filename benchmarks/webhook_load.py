@@ -0,0 +1,451 @@
+"""
+Нагрузочный тест вебхука.
+
+Поднимает то же aiohttp-приложение, что и main.run_bot (диспетчер, middleware,
+роутеры, фоновые сервисы), но Bot API и Telethon заменены заглушками из
+fakes.py, а БД - временная, с синтетическими группами и контактами. Затем
+шлёт в /webhook апдейты с заданной частотой и параллельностью:
+
+    python -m benchmarks.webhook_load --rate 200 --duration 30 --concurrency 100
+    python -m benchmarks.webhook_load --rate 0 --count 5000          # без ограничения частоты
+    python -m benchmarks.webhook_load --updates recorded.jsonl        # записанные апдейты
+    python -m benchmarks.webhook_load --mix start=1,view_groups=5     # свой набор апдейтов
+
+Записанные апдейты - JSON Lines, по одному объекту Update в строке, как их
+присылает Telegram; update_id перенумеровываются. Генерируемые апдейты -
+нажатия кнопок меню и inline-кнопок от --users разных пользователей.
+
+Отчёт: задержка HTTP-ответа и полной обработки апдейта (p50/p90/p99/max),
+ошибки HTTP и хендлеров, необработанные к концу апдейты, задержка цикла
+событий сервера, число запросов Bot API и MTProto и паузы RateLimiter
+(лимиты ускорены в --rate-scale раз). Генератор нагрузки
+работает в отдельном потоке со своим циклом событий, чтобы не искажать
+задержку цикла сервера. --json сохраняет отчёт для сравнения между коммитами.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiohttp import ClientSession, ClientTimeout, web
+
+from benchmarks.fakes import USER_ID_BASE, FakeBotSession, FakeTelegramClient, Members
+from benchmarks.run import current_revision
+from benchmarks.scenarios import RATE_SCALE
+from database import AsyncDatabase, SQLiteStorage, run_migrations
+from main import WEBHOOK_PATH, attach_dispatcher, create_app, setup_dispatcher
+from utils.campaigns import InviteCampaigns
+from utils.group_meta import GroupMetaCache
+from utils.member_sync import MemberSync
+from utils.outbox import Outbox
+from utils.search_cache import SearchCache
+from utils.parse_jobs import ParseJobs
+from utils.session_pool import SessionPool
+from utils.startup import DeferredWebhook
+from utils.tasks import TaskManager
+
+# Генерируемые апдейты и их веса по умолчанию
+DEFAULT_MIX = {
+    "start": 10,
+    "menu": 5,
+    "view_groups": 20,
+    "view_groups_page": 10,
+    "parse_menu": 10,
+    "invite_menu": 10,
+    "settings": 5,
+    "parse_users": 1,
+    "invite": 1,
+    "status": 5,
+}
+LAG_INTERVAL = 0.01  # Период замера задержки цикла событий (секунды)
+
+
+class UpdateTracker(BaseMiddleware):
+    """Внешний middleware апдейтов: когда и чем закончилась обработка каждого апдейта."""
+
+    def __init__(self):
+        super().__init__()
+        self.finished: Dict[int, float] = {}
+        self.failed: Counter = Counter()
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.failed[type(e).__name__] += 1
+            raise
+        finally:
+            self.finished[event.update_id] = time.perf_counter()
+
+
+class UpdateFactory:
+    """Синтетические апдейты: сообщения и нажатия inline-кнопок."""
+
+    def __init__(self, users: int, group_ids: List[int], mix: Dict[str, int], seed: int = 0):
+        self.users = users
+        self.group_ids = group_ids
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self._rng = random.Random(seed)
+        self._message_id = itertools.count(1)
+
+    def _user(self) -> dict:
+        user_id = USER_ID_BASE * 10 + self._rng.randrange(self.users)
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+    def _message(self, user: dict, text: str) -> dict:
+        message = {
+            "message_id": next(self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return {"message": message}
+
+    def _callback(self, user: dict, data: str) -> dict:
+        bot_message = self._message({"id": 42, "is_bot": True, "first_name": "Bench"}, "menu")["message"]
+        bot_message["chat"] = {"id": user["id"], "type": "private"}
+        return {"callback_query": {
+            "id": str(next(self._message_id)),
+            "from": user,
+            "chat_instance": str(user["id"]),
+            "message": bot_message,
+            "data": data,
+        }}
+
+    def make(self, kind: str) -> dict:
+        user = self._user()
+        group_id = self._rng.choice(self.group_ids)
+        if kind == "start":
+            return self._message(user, "/start")
+        if kind == "menu":
+            return self._message(user, "/menu")
+        if kind == "view_groups":
+            return self._message(user, "📋 Просмотреть группы")
+        if kind == "view_groups_page":
+            return self._callback(user, f"view_groups_page_{self._rng.randrange(3)}")
+        if kind == "parse_menu":
+            return self._message(user, "👥 Поиск пользователей")
+        if kind == "invite_menu":
+            return self._message(user, "📨 Рассылка инвайтов")
+        if kind == "status":
+            return self._message(user, "/status")
+        if kind == "settings":
+            return self._message(user, "⚙️ Настройки")
+        if kind == "parse_users":
+            return self._callback(user, f"parse_users_{group_id}")
+        if kind == "invite":
+            return self._callback(user, f"invite_to_group_{group_id}")
+        raise ValueError(f"Неизвестный вид апдейта: {kind}")
+
+    def __iter__(self) -> Iterator[dict]:
+        while True:
+            yield self.make(self._rng.choices(self.kinds, self.weights)[0])
+
+
+def recorded_updates(path: str) -> Iterator[dict]:
+    """Записанные апдейты по кругу."""
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    if not updates:
+        raise ValueError(f"В {path} нет апдейтов")
+    return itertools.cycle(updates)
+
+
+def parse_mix(spec: Optional[str]) -> Dict[str, int]:
+    """'start=1,view_groups=5' -> {'start': 1, 'view_groups': 5}"""
+    if not spec:
+        return DEFAULT_MIX
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, weight = item.partition("=")
+        if kind.strip() not in DEFAULT_MIX:
+            raise ValueError(f"Неизвестный вид апдейта: {kind}")
+        mix[kind.strip()] = int(weight or 1)
+    return mix
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def summary(values: List[float]) -> Dict[str, Optional[float]]:
+    """Перцентили в миллисекундах."""
+    result = {f"p{p}": percentile(values, p) for p in (50, 90, 99)}
+    result["max"] = max(values) if values else None
+    return {key: round(value * 1000, 2) if value is not None else None for key, value in result.items()}
+
+
+class Stand:
+    """Приложение вебхука на заглушках и всё, что нужно для отчёта."""
+
+    async def start(self, args):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = AsyncDatabase(os.path.join(self.tmpdir.name, "load.db"))
+        await self.db.connect()
+        await run_migrations(self.db)
+
+        self.client = FakeTelegramClient(latency=args.rpc_latency)
+        self.group_ids = []
+        for i in range(args.groups):
+            username = f"loadgroup{i}"
+            members = Members(args.members, seed=i, first_id=USER_ID_BASE + i * args.members)
+            self.client.add_group(username, members)
+            cursor = await self.db.execute(
+                "INSERT INTO groups (name, username) VALUES (?, ?)", (f"Группа {i}", username)
+            )
+            self.group_ids.append(cursor.lastrowid)
+            await self.db.executemany(
+                "INSERT OR IGNORE INTO contacts (username, group_id) VALUES (?, ?)",
+                [(u, cursor.lastrowid) for u in members.usernames if u],
+            )
+
+        self.bot_session = FakeBotSession(latency=args.bot_latency)
+        bot = Bot(token=os.environ["BOT_TOKEN"], session=self.bot_session)
+        dp = Dispatcher(storage=SQLiteStorage(self.db))
+
+        self.outbox = Outbox(bot)
+        self.outbox.start()
+        self.pool = SessionPool(self.db)
+        await self.pool.add("main", self.client)
+        self.client.rate_limiter.scale = args.rate_scale
+        entity_cache = self.pool.primary.entity_cache
+        self.group_meta = GroupMetaCache(self.db, self.client, entity_cache)
+        await self.group_meta.load()
+        self.group_meta.start()
+        search_cache = SearchCache(self.db)
+        await search_cache.load()
+        self.campaigns = InviteCampaigns(self.db, self.pool, self.outbox)
+        self.campaigns.start()
+        self.task_manager = TaskManager()
+
+        setup_dispatcher(
+            dp,
+            self.client,
+            db=self.db,
+            entity_cache=entity_cache,
+            group_meta=self.group_meta,
+            search_cache=search_cache,
+            invite_campaigns=self.campaigns,
+            session_pool=self.pool,
+            outbox=self.outbox,
+            task_manager=self.task_manager,
+            parse_jobs=ParseJobs(self.db),
+            member_sync=MemberSync(self.db, self.pool),
+        )
+        self.tracker = UpdateTracker()
+        dp.update.outer_middleware(self.tracker)
+
+        webhook = DeferredWebhook()
+        attach_dispatcher(webhook, dp, bot)
+        self.runner = web.AppRunner(create_app(webhook))
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host="127.0.0.1", port=args.port).start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}{WEBHOOK_PATH}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+        await self.task_manager.stop()
+        await self.campaigns.stop()
+        await self.group_meta.stop()
+        await self.outbox.stop()
+        await self.pool.close()
+        await self.db.close()
+        self.tmpdir.cleanup()
+
+
+class LoadGenerator:
+    """
+    Открытая модель нагрузки: апдейт i отправляется в момент i / rate, но не
+    больше concurrency запросов одновременно. Если параллельность исчерпана,
+    отправка отстаёт от графика - это видно по достигнутой частоте.
+    """
+
+    def __init__(self, url: str, updates: Iterator[dict], rate: float, concurrency: int,
+                 count: Optional[int], duration: Optional[float]):
+        self.url = url
+        self.updates = updates
+        self.rate = rate
+        self.concurrency = concurrency
+        self.count = count
+        self.duration = duration
+        self.sent_at: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.elapsed = 0.0
+
+    async def _post(self, session: ClientSession, semaphore: asyncio.Semaphore, update_id: int, body: bytes):
+        started = time.perf_counter()
+        self.sent_at[update_id] = started
+        try:
+            async with session.post(self.url, data=body, headers={"Content-Type": "application/json"}) as resp:
+                await resp.read()
+                self.statuses[resp.status] += 1
+                if resp.status == 200:
+                    self.latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+        finally:
+            semaphore.release()
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        async with ClientSession(timeout=ClientTimeout(total=60)) as session:
+            started = time.perf_counter()
+            for i, update in enumerate(self.updates):
+                if self.count is not None and i >= self.count:
+                    break
+                if self.duration is not None and time.perf_counter() - started >= self.duration:
+                    break
+                if self.rate:
+                    delay = started + i / self.rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await semaphore.acquire()
+                update = {**update, "update_id": i + 1}
+                task = asyncio.create_task(self._post(session, semaphore, i + 1, json.dumps(update).encode()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            self.elapsed = time.perf_counter() - started
+
+    def run(self):
+        asyncio.run(self._run())
+
+
+async def monitor_lag(samples: List[float]):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(time.perf_counter() - started - LAG_INTERVAL)
+
+
+async def wait_processed(tracker: UpdateTracker, sent: Dict[int, float], timeout: float):
+    """Ждёт, пока фоновая обработка догонит отправленные апдейты."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if all(update_id in tracker.finished for update_id in sent):
+            return
+        await asyncio.sleep(0.1)
+
+
+async def main(args):
+    updates = recorded_updates(args.updates) if args.updates else None
+    stand = Stand()
+    await stand.start(args)
+    lag: List[float] = []
+    lag_task = asyncio.create_task(monitor_lag(lag))
+    try:
+        if updates is None:
+            updates = iter(UpdateFactory(args.users, stand.group_ids, parse_mix(args.mix), seed=args.seed))
+        generator = LoadGenerator(stand.url, updates, args.rate, args.concurrency, args.count,
+                                  None if args.count else args.duration)
+        print(f"Нагрузка на {stand.url}: частота {args.rate or 'без ограничения'}/с, "
+              f"параллельность {args.concurrency}")
+        await asyncio.to_thread(generator.run)
+        await wait_processed(stand.tracker, generator.sent_at, args.drain)
+    finally:
+        lag_task.cancel()
+
+    processed = [
+        stand.tracker.finished[update_id] - sent
+        for update_id, sent in generator.sent_at.items()
+        if update_id in stand.tracker.finished
+    ]
+    sent = len(generator.sent_at)
+    http_errors = sum(n for status, n in generator.statuses.items() if status != 200) + sum(generator.errors.values())
+    report = {
+        "revision": current_revision(),
+        "rate": args.rate,
+        "concurrency": args.concurrency,
+        "sent": sent,
+        "achieved_rate": round(sent / generator.elapsed, 1) if generator.elapsed else 0,
+        "http_latency_ms": summary(generator.latencies),
+        "http_errors": http_errors,
+        "http_error_rate": round(http_errors / sent, 4) if sent else 0,
+        "http_statuses": {str(status): n for status, n in generator.statuses.items()},
+        "client_errors": dict(generator.errors),
+        "processing_latency_ms": summary(processed),
+        "handler_errors": dict(stand.tracker.failed),
+        "unfinished": sent - len(processed),
+        "loop_lag_ms": summary(lag),
+        "bot_api_calls": dict(stand.bot_session.calls),
+        "mtproto_calls": dict(stand.client.calls),
+        "mtproto_pacing_s": round(stand.client.rate_limiter.paced_seconds, 4),
+        "mtproto_flood_sleep_s": round(stand.client.rate_limiter.blocked_seconds, 4),
+    }
+    await stand.stop()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nОтчёт сохранён в {args.json}")
+
+
+def print_report(report: dict):
+    def line(title, stats):
+        return f"{title:<24} " + "  ".join(f"{key} {value} мс" for key, value in stats.items())
+
+    print(f"\nОтправлено: {report['sent']} ({report['achieved_rate']}/с)")
+    print(line("HTTP-ответ", report["http_latency_ms"]))
+    print(line("Обработка апдейта", report["processing_latency_ms"]))
+    print(line("Задержка цикла событий", report["loop_lag_ms"]))
+    print(f"Ошибки HTTP: {report['http_errors']} ({report['http_error_rate']:.2%}) {report['client_errors'] or ''}")
+    print(f"Ошибки хендлеров: {sum(report['handler_errors'].values())} {report['handler_errors'] or ''}")
+    print(f"Не обработано к концу: {report['unfinished']}")
+    print(f"Bot API: {sum(report['bot_api_calls'].values())} {report['bot_api_calls']}")
+    print(f"MTProto: {sum(report['mtproto_calls'].values())} {report['mtproto_calls']}")
+    print(f"Паузы RateLimiter: {report['mtproto_pacing_s']:.3f} с, FloodWait {report['mtproto_flood_sleep_s']:.3f} с")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест вебхука на заглушках Telegram")
+    parser.add_argument("--rate", type=float, default=100, help="апдейтов в секунду (0 - без ограничения)")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных HTTP-запросов")
+    parser.add_argument("--duration", type=float, default=10, help="длительность, секунды")
+    parser.add_argument("--count", type=int, help="число апдейтов (вместо --duration)")
+    parser.add_argument("--updates", help="файл JSON Lines с записанными апдейтами")
+    parser.add_argument("--mix", help="веса генерируемых апдейтов: start=10,view_groups=20,...")
+    parser.add_argument("--users", type=int, default=1000, help="число разных пользователей")
+    parser.add_argument("--groups", type=int, default=20, help="групп в БД")
+    parser.add_argument("--members", type=int, default=2000, help="участников в каждой группе")
+    parser.add_argument("--rpc-latency", type=float, default=0.05, help="задержка запроса MTProto, секунды")
+    parser.add_argument("--rate-scale", type=float, default=RATE_SCALE,
+                        help="во сколько раз ускорить лимиты RateLimiter (1 - настоящие паузы)")
+    parser.add_argument("--bot-latency", type=float, default=0.03, help="задержка запроса Bot API, секунды")
+    parser.add_argument("--drain", type=float, default=30, help="сколько ждать обработки после отправки, секунды")
+    parser.add_argument("--port", type=int, default=0, help="порт сервера (0 - любой свободный)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="сохранить отчёт в файл")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(main(args))
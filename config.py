@@ -6,20 +6,97 @@ load_dotenv()
 
 # Bot settings
 TOKEN = os.getenv("BOT_TOKEN")
-API_ID = int(os.getenv("API_ID"))
+API_ID = int(os.getenv("API_ID", 0))
 API_HASH = os.getenv("API_HASH")
 
 # Database settings
 DB_PATH = "bot_database.db"
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", 4))
+# Состояние FSM, не обновлявшееся дольше этого (секунд), считается устаревшим
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", 2 * 24 * 3600))
+# Сколько последних состояний FSM держать в памяти
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 1000))
+
+# Каталог с дополнительными сессиями Telethon (*.session или *.txt со StringSession)
+SESSIONS_DIR = os.getenv("SESSIONS_DIR", "sessions")
 
 # Limits
 DAILY_INVITE_LIMIT = int(os.getenv("DAILY_INVITE_LIMIT", 50))
 INVITE_DELAY = int(os.getenv("INVITE_DELAY", 3))
+# FloodWait не дольше этого (секунд) ограничитель запросов пережидает сам
+RATE_LIMIT_MAX_SLEEP = int(os.getenv("RATE_LIMIT_MAX_SLEEP", 300))
+# Сколько пользователей приглашать одним InviteToChannelRequest
+INVITE_BATCH_SIZE = int(os.getenv("INVITE_BATCH_SIZE", 10))
 DECLINE_WAIT_DAYS = int(os.getenv("DECLINE_WAIT_DAYS", 30))
 
+# Entity cache settings (секунды)
+ENTITY_CACHE_TTL = int(os.getenv("ENTITY_CACHE_TTL", 7 * 24 * 3600))
+ENTITY_NEGATIVE_TTL = int(os.getenv("ENTITY_NEGATIVE_TTL", 24 * 3600))
+
+# Group metadata cache settings
+GROUP_META_REFRESH_INTERVAL = int(os.getenv("GROUP_META_REFRESH_INTERVAL", 3600))
+GROUP_META_CONCURRENCY = int(os.getenv("GROUP_META_CONCURRENCY", 3))
+
+# Parsing settings
+# Сколько участников Telegram отдаёт максимум на один поисковый запрос
+PARSE_QUERY_CAP = int(os.getenv("PARSE_QUERY_CAP", 10000))
+PARSE_CONCURRENCY = int(os.getenv("PARSE_CONCURRENCY", 3))
+PARSE_MAX_PREFIX_DEPTH = int(os.getenv("PARSE_MAX_PREFIX_DEPTH", 3))
+# Повторный парсинг группы берёт только новых участников; полный перебор -
+# если последний был раньше PARSE_FULL_INTERVAL секунд назад
+PARSE_FULL_INTERVAL = int(os.getenv("PARSE_FULL_INTERVAL", 7 * 24 * 3600))
+# Как часто фоном подтягивать новых участников сохранённых групп (0 - не подтягивать)
+MEMBERS_REFRESH_INTERVAL = int(os.getenv("MEMBERS_REFRESH_INTERVAL", 24 * 3600))
+
+# Bot API outbox settings
+# Не чаще одной правки в чат раз в OUTBOX_CHAT_INTERVAL секунд
+OUTBOX_CHAT_INTERVAL = float(os.getenv("OUTBOX_CHAT_INTERVAL", 1.0))
+# Общий лимит исходящих запросов бота (в секунду)
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", 25))
+# Сколько секунд при остановке бота досылать правки, оставшиеся в очереди
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv("OUTBOX_DRAIN_TIMEOUT", 5))
+# Как часто долгие задачи обновляют сообщение со статусом (секунды)
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", 3))
+
+# Inline list settings
+# Сколько элементов показывать на одной странице списка
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", 10))
+
+# Group search settings
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", 5))
+SEARCH_KEYWORD_TTL = int(os.getenv("SEARCH_KEYWORD_TTL", 6 * 3600))
+SEARCH_CHAT_TTL = int(os.getenv("SEARCH_CHAT_TTL", 24 * 3600))
+SEARCH_CACHE_MAX_KEYWORDS = int(os.getenv("SEARCH_CACHE_MAX_KEYWORDS", 5000))
+SEARCH_CACHE_MAX_CHATS = int(os.getenv("SEARCH_CACHE_MAX_CHATS", 50000))
+
+# Background task settings
+# Сколько долгих задач (парсинг, поиск) выполняется одновременно - всего и по видам
+TASKS_MAX_CONCURRENT = int(os.getenv("TASKS_MAX_CONCURRENT", 8))
+TASKS_MAX_PARSE = int(os.getenv("TASKS_MAX_PARSE", 2))
+TASKS_MAX_SEARCH = int(os.getenv("TASKS_MAX_SEARCH", 3))
+# Сколько незавершённых задач может быть у одного пользователя
+TASKS_MAX_PER_USER = int(os.getenv("TASKS_MAX_PER_USER", 3))
+# Сколько секунд при остановке бота ждать, пока задачи сохранят текущую страницу
+TASKS_DRAIN_TIMEOUT = float(os.getenv("TASKS_DRAIN_TIMEOUT", 20))
+
+# Startup settings
+# Удалять вебхук при остановке бота. При перезапусках по cron вебхук остаётся
+# зарегистрированным, и Telegram копит апдейты, пока новый процесс не готов
+WEBHOOK_DELETE_ON_SHUTDOWN = os.getenv("WEBHOOK_DELETE_ON_SHUTDOWN", "False").lower() == "true"
+
 # Debug settings
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 
+# Logging settings
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG" if DEBUG else "INFO")
+# Уровни отдельных логгеров: "telethon=WARNING,handlers.group_parsing=DEBUG"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "telethon=WARNING,aiosqlite=WARNING")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+# Не больше стольких DEBUG-записей в секунду из одного места кода
+LOG_DEBUG_RATE = float(os.getenv("LOG_DEBUG_RATE", 5))
+
 # Лимиты для пользователей
 FREE_TIER_LIMITS = {
     "groups_per_day": 5,
@@ -46,6 +123,3 @@ def check_env():
             f"Missing required environment variables: {', '.join(missing_vars)}\n"
             f"Please check your .env file"
         )
-
-# Вызываем проверку при импорте конфига
-check_env()
@@ -1,3 +1,13 @@
-from .db import Database
+from .db import AsyncDatabase
+from .migrations import run_migrations
 
-__all__ = ['Database']
+__all__ = ['AsyncDatabase', 'run_migrations', 'SQLiteStorage']
+
+
+def __getattr__(name):
+    # Хранилище FSM тянет за собой aiogram; импортируем его по первому
+    # обращению, чтобы БД можно было открыть до загрузки aiogram
+    if name == 'SQLiteStorage':
+        from .fsm_storage import SQLiteStorage
+        return SQLiteStorage
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,122 +1,111 @@
-import sqlite3
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
 
-class Database:
-    def __init__(self, db_file):
+import aiosqlite
+
+from utils.metrics import DB_QUERY_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """
+    Общий асинхронный слой доступа к БД для всего процесса.
+
+    Одно соединение на запись (записи сериализуются через lock) и небольшой
+    пул соединений на чтение. База работает в режиме WAL, поэтому чтения
+    не блокируются записью и не блокируют event loop.
+    """
+
+    def __init__(self, db_file, read_pool_size=4):
         self.db_file = db_file
-        self.conn = sqlite3.connect(db_file)
-        self.update_database_structure()
+        self.read_pool_size = read_pool_size
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._reader_conns = []
 
-    def update_database_structure(self):
-        cursor = self.conn.cursor()
-        
-        try:
-            # Создаем временную таблицу для бэкапа
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS contacts_temp (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_id INTEGER,
-                username TEXT NOT NULL,
-                FOREIGN KEY (group_id) REFERENCES groups(id),
-                UNIQUE(group_id, username)
-            )
-            ''')
-            
-            # Проверяем существует ли старая таблица contacts
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='contacts'")
-            if cursor.fetchone():
-                # Получаем список колонок в существующей таблице
-                cursor.execute("PRAGMA table_info(contacts)")
-                columns = [column[1] for column in cursor.fetchall()]
-                
-                # Если структура старая, копируем данные
-                if 'username' not in columns:
-                    print("Обновляем структуру базы данных...")
-                    
-                    # Создаем новую таблицу с правильной структурой
-                    cursor.execute('''
-                    CREATE TABLE contacts_new (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        group_id INTEGER,
-                        username TEXT NOT NULL,
-                        FOREIGN KEY (group_id) REFERENCES groups(id),
-                        UNIQUE(group_id, username)
-                    )
-                    ''')
-                    
-                    # Копируем существующие данные если они есть
-                    try:
-                        cursor.execute("INSERT INTO contacts_new (group_id, username) SELECT group_id, username FROM contacts")
-                    except:
-                        print("Не удалось скопировать старые данные")
-                    
-                    # Удаляем старую таблицу
-                    cursor.execute("DROP TABLE contacts")
-                    
-                    # Переименовываем новую таблицу
-                    cursor.execute("ALTER TABLE contacts_new RENAME TO contacts")
-                    
-                    print("Структура базы данных обновлена")
-            else:
-                # Если таблицы нет, создаем с нужной структурой
-                cursor.execute('''
-                CREATE TABLE contacts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER,
-                    username TEXT NOT NULL,
-                    FOREIGN KEY (group_id) REFERENCES groups(id),
-                    UNIQUE(group_id, username)
-                )
-                ''')
-                
-            # Создаем таблицу для групп, если её нет
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS groups (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                username TEXT UNIQUE
-            )
-            ''')
-            
-            # Добавляем таблицу пользователей
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    phone TEXT,
-                    session_file TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Добавляем таблицу invites
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invites (
-                username TEXT,
-                group_id INTEGER,
-                status TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (username, group_id),
-                FOREIGN KEY (group_id) REFERENCES groups(id)
-            )
-            ''')
-            
-            self.conn.commit()
-            print("Проверка структуры базы данных завершена")
-            
-        except Exception as e:
-            print(f"Ошибка при обновлении структуры базы данных: {e}")
-            self.conn.rollback()
-            raise e
-
-    def execute(self, query, params=None):
-        cursor = self.conn.cursor()
-        if params:
-            cursor.execute(query, params)
+    async def _open(self, readonly=False):
+        # isolation_level=None: автокоммит, транзакции открываем явно
+        conn = await aiosqlite.connect(self.db_file, isolation_level=None)
+        await conn.execute("PRAGMA busy_timeout = 5000")
+        if readonly:
+            await conn.execute("PRAGMA query_only = ON")
         else:
-            cursor.execute(query)
-        return cursor
+            await conn.execute("PRAGMA journal_mode = WAL")
+            await conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    async def connect(self):
+        """Открывает соединение на запись и пул соединений на чтение."""
+        self._writer = await self._open()
+        for _ in range(self.read_pool_size):
+            conn = await self._open(readonly=True)
+            self._reader_conns.append(conn)
+            self._readers.put_nowait(conn)
+        logger.info(f"БД {self.db_file} открыта (WAL, читателей: {self.read_pool_size})")
 
-    def commit(self):
-        self.conn.commit()
+    @asynccontextmanager
+    async def _reader(self):
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    # Время запросов включает ожидание свободного соединения / lock записи
+
+    async def fetchone(self, query, params=()):
+        with DB_QUERY_DURATION.time(op="fetchone"):
+            async with self._reader() as conn:
+                async with conn.execute(query, params) as cursor:
+                    return await cursor.fetchone()
+
+    async def fetchall(self, query, params=()):
+        with DB_QUERY_DURATION.time(op="fetchall"):
+            async with self._reader() as conn:
+                async with conn.execute(query, params) as cursor:
+                    return await cursor.fetchall()
+
+    async def execute(self, query, params=()):
+        """Выполняет один запрос на запись (автокоммит). Возвращает курсор."""
+        with DB_QUERY_DURATION.time(op="execute"):
+            async with self._write_lock:
+                return await self._writer.execute(query, params)
+
+    async def executemany(self, query, seq_of_params):
+        """Пакетная запись одной транзакцией. Возвращает число изменённых строк."""
+        async with self.transaction(op="executemany") as conn:
+            cursor = await conn.executemany(query, seq_of_params)
+            return cursor.rowcount
+
+    @asynccontextmanager
+    async def transaction(self, op="transaction"):
+        """
+        Транзакция на соединении записи:
+
+            async with db.transaction() as conn:
+                await conn.execute(...)
+        """
+        started = time.perf_counter()
+        async with self._write_lock:
+            await self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.execute("ROLLBACK")
+                raise
+            else:
+                await self._writer.execute("COMMIT")
+            finally:
+                DB_QUERY_DURATION.observe(time.perf_counter() - started, op=op)
 
-    def close(self):
-        self.conn.close()
+    async def close(self):
+        for conn in self._reader_conns:
+            await conn.close()
+        self._reader_conns.clear()
+        if self._writer:
+            await self._writer.close()
+            self._writer = None
@@ -0,0 +1,177 @@
+"""
+Хранилище состояний FSM aiogram в SQLite.
+
+Состояние и данные каждого ключа лежат одной строкой в fsm_state и
+переживают перезапуск бота. Последние FSM_CACHE_SIZE ключей держатся в
+памяти в сериализованном виде, поэтому get_data/update_data обычно не
+читают БД, а каждое изменение - это одна запись (UPSERT).
+
+Изменения одного ключа (чтение, слияние, запись) выполняются под его lock:
+иначе фоновая задача и хендлер, обновляющие данные одновременно, затирали
+бы записи друг друга.
+
+Данные сериализуются компактно: списки однотипных словарей (found_groups и
+т.п.) хранятся по столбцам - имена ключей один раз, дальше только значения.
+Состояния, не менявшиеся дольше FSM_STATE_TTL, считаются пустыми и
+периодически удаляются.
+"""
+import asyncio
+import json
+import logging
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from config import FSM_CACHE_SIZE, FSM_STATE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Как часто удалять устаревшие состояния (секунды)
+PURGE_INTERVAL = 3600
+
+COLUMNS = "$cols"
+ROWS = "$rows"
+
+
+def _pack(value):
+    if isinstance(value, list):
+        if len(value) > 1 and all(isinstance(item, dict) for item in value):
+            keys = list(value[0])
+            if all(list(item) == keys for item in value):
+                return {COLUMNS: keys, ROWS: [[_pack(item[k]) for k in keys] for item in value]}
+        return [_pack(item) for item in value]
+    if isinstance(value, dict):
+        return {k: _pack(v) for k, v in value.items()}
+    return value
+
+
+def _unpack(value):
+    if isinstance(value, dict):
+        if len(value) == 2 and COLUMNS in value and ROWS in value:
+            keys = value[COLUMNS]
+            return [dict(zip(keys, map(_unpack, row))) for row in value[ROWS]]
+        return {k: _unpack(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_unpack(item) for item in value]
+    return value
+
+
+def dumps(data: Dict[str, Any]) -> Optional[str]:
+    if not data:
+        return None
+    return json.dumps(_pack(data), ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(text: Optional[str]) -> Dict[str, Any]:
+    return _unpack(json.loads(text)) if text else {}
+
+
+class _Record(NamedTuple):
+    state: Optional[str]
+    data: Optional[str]
+    updated_at: float
+
+
+EMPTY = _Record(None, None, 0.0)
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, db, ttl: int = FSM_STATE_TTL, cache_size: int = FSM_CACHE_SIZE):
+        self.db = db
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, _Record]" = OrderedDict()
+        # Lock живёт, пока кто-то изменяет ключ
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _lock(self, k: str) -> asyncio.Lock:
+        lock = self._locks.get(k)
+        if lock is None:
+            lock = self._locks[k] = asyncio.Lock()
+        return lock
+
+    def _remember(self, k: str, record: _Record):
+        self._cache[k] = record
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _expired(self, record: _Record) -> bool:
+        return record.updated_at < time.time() - self.ttl
+
+    async def _load(self, k: str) -> _Record:
+        record = self._cache.get(k)
+        if record is None:
+            row = await self.db.fetchone(
+                "SELECT state, data, updated_at FROM fsm_state WHERE key = ?", (k,)
+            )
+            record = _Record(*row) if row else EMPTY
+            self._remember(k, record)
+        else:
+            self._cache.move_to_end(k)
+        return EMPTY if self._expired(record) else record
+
+    async def _write(self, k: str, record: _Record):
+        if record.state is None and record.data is None:
+            # Пустое состояние (после state.clear()) не храним
+            await self.db.execute("DELETE FROM fsm_state WHERE key = ?", (k,))
+        else:
+            await self.db.execute(
+                "INSERT INTO fsm_state (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "state = excluded.state, data = excluded.data, updated_at = excluded.updated_at",
+                (k, record.state, record.data, record.updated_at),
+            )
+        self._remember(k, record)
+        if record.updated_at - self._last_purge > PURGE_INTERVAL:
+            await self.purge()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self._key(key)
+        state = state.state if isinstance(state, State) else state
+        async with self._lock(k):
+            record = await self._load(k)
+            await self._write(k, record._replace(state=state, updated_at=time.time()))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self._key(key))).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = self._key(key)
+        async with self._lock(k):
+            record = await self._load(k)
+            await self._write(k, record._replace(data=dumps(data), updated_at=time.time()))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return loads((await self._load(self._key(key))).data)
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        k = self._key(key)
+        async with self._lock(k):
+            record = await self._load(k)
+            current = loads(record.data)
+            current.update(data)
+            await self._write(k, record._replace(data=dumps(current), updated_at=time.time()))
+        return current
+
+    async def purge(self):
+        """Удаляет состояния, не обновлявшиеся дольше ttl."""
+        self._last_purge = time.time()
+        cursor = await self.db.execute(
+            "DELETE FROM fsm_state WHERE updated_at < ?", (self._last_purge - self.ttl,)
+        )
+        if cursor.rowcount:
+            logger.info(f"Удалено устаревших состояний FSM: {cursor.rowcount}")
+
+    async def close(self) -> None:
+        # Соединение с БД закрывает main.py
+        self._cache.clear()
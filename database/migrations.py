@@ -0,0 +1,447 @@
+"""
+Версионные миграции схемы БД.
+
+Текущая версия схемы хранится в PRAGMA user_version. Каждая миграция имеет
+номер и выполняется ровно один раз; все ожидающие миграции применяются при
+запуске бота одной транзакцией. Новую миграцию добавляем в конец MIGRATIONS,
+уже выпущенные миграции не меняем.
+"""
+import logging
+
+from config import DECLINE_WAIT_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+CONTACTS_TABLE = '''
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_id INTEGER,
+        username TEXT NOT NULL,
+        FOREIGN KEY (group_id) REFERENCES groups(id),
+        UNIQUE(group_id, username)
+    )
+'''
+
+
+async def _table_columns(conn, table):
+    async with conn.execute(f"PRAGMA table_info({table})") as cursor:
+        return [row[1] for row in await cursor.fetchall()]
+
+
+async def _baseline(conn):
+    """Исходная схема. Учитывает базы, созданные до появления миграций."""
+    columns = await _table_columns(conn, "contacts")
+    if not columns:
+        await conn.execute(CONTACTS_TABLE.format(name="contacts"))
+    elif 'username' not in columns:
+        # Старая структура contacts: переносим данные в новую таблицу
+        logger.info("Обновляем структуру таблицы contacts...")
+        await conn.execute(CONTACTS_TABLE.format(name="contacts_new"))
+        try:
+            await conn.execute(
+                "INSERT INTO contacts_new (group_id, username) SELECT group_id, username FROM contacts"
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось скопировать старые данные contacts: {e}")
+        await conn.execute("DROP TABLE contacts")
+        await conn.execute("ALTER TABLE contacts_new RENAME TO contacts")
+
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS groups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            username TEXT UNIQUE
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            phone TEXT,
+            session_file TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS invites (
+            username TEXT,
+            group_id INTEGER,
+            status TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (username, group_id),
+            FOREIGN KEY (group_id) REFERENCES groups(id)
+        )
+    ''')
+    # Временная таблица из старой версии больше не используется
+    await conn.execute("DROP TABLE IF EXISTS contacts_temp")
+
+
+ENTITY_CACHE = [
+    '''
+    CREATE TABLE IF NOT EXISTS entity_cache (
+        owner_id INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        entity_id INTEGER,
+        access_hash INTEGER,
+        type TEXT,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY (owner_id, username)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_entity_cache_id ON entity_cache(owner_id, entity_id)",
+]
+
+
+GROUP_META = [
+    '''
+    CREATE TABLE IF NOT EXISTS group_meta (
+        group_id INTEGER PRIMARY KEY,
+        title TEXT,
+        participants_count INTEGER,
+        comments_enabled INTEGER NOT NULL DEFAULT 0,
+        is_dead INTEGER NOT NULL DEFAULT 0,
+        refreshed_at REAL NOT NULL
+    )
+    ''',
+]
+
+
+SEARCH_CACHE = [
+    '''
+    CREATE TABLE IF NOT EXISTS search_cache (
+        keyword TEXT PRIMARY KEY,
+        chat_ids TEXT NOT NULL,
+        cached_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS chat_classification (
+        chat_id INTEGER PRIMARY KEY,
+        title TEXT,
+        username TEXT,
+        comments_enabled INTEGER NOT NULL,
+        has_user_messages INTEGER NOT NULL,
+        checked_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_search_cache_last_used ON search_cache(last_used)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_classification_last_used ON chat_classification(last_used)",
+]
+
+
+INVITE_CAMPAIGNS = [
+    '''
+    CREATE TABLE IF NOT EXISTS invite_campaigns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        message_id INTEGER,
+        status TEXT NOT NULL DEFAULT 'active',
+        cursor INTEGER NOT NULL DEFAULT 0,
+        daily_limit INTEGER NOT NULL,
+        sent_today INTEGER NOT NULL DEFAULT 0,
+        day TEXT,
+        invited INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        next_run_at REAL NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        FOREIGN KEY (group_id) REFERENCES groups(id)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_invite_campaigns_due ON invite_campaigns(status, next_run_at)",
+    # Не больше одной активной кампании на группу
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_invite_campaigns_active "
+    "ON invite_campaigns(group_id) WHERE status = 'active'",
+]
+
+
+TELETHON_SESSIONS = [
+    '''
+    CREATE TABLE IF NOT EXISTS telethon_sessions (
+        name TEXT PRIMARY KEY,
+        flood_until REAL NOT NULL DEFAULT 0,
+        banned INTEGER NOT NULL DEFAULT 0,
+        day TEXT,
+        invites_today INTEGER NOT NULL DEFAULT 0,
+        parse_pages_today INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+]
+
+
+RATE_LIMITS = [
+    '''
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        account TEXT NOT NULL,
+        method TEXT NOT NULL,
+        rate REAL NOT NULL,
+        blocked_until REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (account, method)
+    )
+    ''',
+]
+
+
+FSM_STATE = [
+    '''
+    CREATE TABLE IF NOT EXISTS fsm_state (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        updated_at REAL NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state(updated_at)",
+]
+
+
+# Счётчики по группам для списков: поддерживаются триггерами, поэтому списки
+# читают их за O(групп) независимо от размера contacts и invites.
+# invites обновляется через UPSERT: INSERT OR REPLACE удалял бы строку
+# без срабатывания триггеров на удаление.
+GROUP_STATS = [
+    '''
+    CREATE TABLE IF NOT EXISTS group_stats (
+        group_id INTEGER PRIMARY KEY,
+        contacts INTEGER NOT NULL DEFAULT 0,
+        invited INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_invites_group_status ON invites(group_id, status)",
+    '''
+    INSERT OR REPLACE INTO group_stats (group_id, contacts, invited)
+    SELECT g.id,
+           (SELECT COUNT(*) FROM contacts WHERE group_id = g.id),
+           (SELECT COUNT(*) FROM invites WHERE group_id = g.id AND status = 'success')
+    FROM groups g
+    ''',
+    # Группа может вернуться под тем же id: подхватываем оставшиеся строки
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_groups_insert_stats AFTER INSERT ON groups
+    BEGIN
+        INSERT OR REPLACE INTO group_stats (group_id, contacts, invited)
+        VALUES (
+            NEW.id,
+            (SELECT COUNT(*) FROM contacts WHERE group_id = NEW.id),
+            (SELECT COUNT(*) FROM invites WHERE group_id = NEW.id AND status = 'success')
+        );
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_groups_delete_stats AFTER DELETE ON groups
+    BEGIN
+        DELETE FROM group_stats WHERE group_id = OLD.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_contacts_insert_stats AFTER INSERT ON contacts
+    BEGIN
+        UPDATE group_stats SET contacts = contacts + 1 WHERE group_id = NEW.group_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_contacts_delete_stats AFTER DELETE ON contacts
+    BEGIN
+        UPDATE group_stats SET contacts = contacts - 1 WHERE group_id = OLD.group_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_invites_insert_stats AFTER INSERT ON invites
+    WHEN NEW.status = 'success'
+    BEGIN
+        UPDATE group_stats SET invited = invited + 1 WHERE group_id = NEW.group_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_invites_delete_stats AFTER DELETE ON invites
+    WHEN OLD.status = 'success'
+    BEGIN
+        UPDATE group_stats SET invited = invited - 1 WHERE group_id = OLD.group_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_invites_update_stats AFTER UPDATE OF status, group_id ON invites
+    WHEN (OLD.status = 'success') != (NEW.status = 'success') OR OLD.group_id != NEW.group_id
+    BEGIN
+        UPDATE group_stats SET invited = invited - 1
+        WHERE group_id = OLD.group_id AND OLD.status = 'success';
+        UPDATE group_stats SET invited = invited + 1
+        WHERE group_id = NEW.group_id AND NEW.status = 'success';
+    END
+    ''',
+]
+
+
+async def _contact_status(conn):
+    """
+    Статус приглашения прямо в contacts: new - ещё не приглашали, invited -
+    приглашён, failed - не удалось, повтор не раньше next_attempt_at.
+    Покрывающий индекс позволяет брать следующую пачку кандидатов по
+    keyset-курсору за одно и то же время при любом размере contacts.
+    """
+    columns = await _table_columns(conn, "contacts")
+    if 'status' not in columns:
+        await conn.execute("ALTER TABLE contacts ADD COLUMN status TEXT NOT NULL DEFAULT 'new'")
+    if 'next_attempt_at' not in columns:
+        await conn.execute("ALTER TABLE contacts ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+
+    # Переносим уже известные результаты из invites
+    await conn.execute('''
+        UPDATE contacts SET status = 'invited'
+        WHERE EXISTS (
+            SELECT 1 FROM invites i
+            WHERE i.username = contacts.username AND i.group_id = contacts.group_id AND i.status = 'success'
+        )
+    ''')
+    await conn.execute('''
+        UPDATE contacts SET
+            status = 'failed',
+            next_attempt_at = (
+                SELECT CAST(strftime('%s', i.timestamp) AS REAL) + ?
+                FROM invites i
+                WHERE i.username = contacts.username AND i.group_id = contacts.group_id
+            )
+        WHERE status = 'new' AND EXISTS (
+            SELECT 1 FROM invites i
+            WHERE i.username = contacts.username AND i.group_id = contacts.group_id AND i.status = 'failed'
+        )
+    ''', (DECLINE_WAIT_DAYS * 24 * 3600,))
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_contacts_candidates "
+        "ON contacts(group_id, status, next_attempt_at, id, username)"
+    )
+
+
+# Служебные значения бота: отпечатки зарегистрированных в Telegram вебхука
+# и команд, чтобы при перезапуске не регистрировать их повторно
+BOT_STATE = [
+    '''
+    CREATE TABLE IF NOT EXISTS bot_state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''',
+]
+
+
+# Задания парсинга участников: курсор перебора и счётчики сохраняются после
+# каждой страницы, прерванное задание продолжается после перезапуска
+PARSE_JOBS = [
+    '''
+    CREATE TABLE IF NOT EXISTS parse_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        cursor TEXT,
+        total INTEGER NOT NULL DEFAULT 0,
+        saved INTEGER NOT NULL DEFAULT 0,
+        new INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        FOREIGN KEY (group_id) REFERENCES groups(id)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_parse_jobs_status ON parse_jobs(status, group_id)",
+]
+
+
+# Снимки состава групп для повторного парсинга только новых участников:
+# верх списка ChannelParticipantsRecent и его хэш; изменения между обновлениями
+MEMBER_SYNC = [
+    '''
+    CREATE TABLE IF NOT EXISTS group_member_state (
+        group_id INTEGER PRIMARY KEY,
+        participants_count INTEGER NOT NULL,
+        top_ids TEXT NOT NULL,
+        top_hash INTEGER NOT NULL,
+        full_scan_at REAL NOT NULL,
+        refreshed_at REAL NOT NULL,
+        FOREIGN KEY (group_id) REFERENCES groups(id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS member_deltas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_id INTEGER NOT NULL,
+        joined INTEGER NOT NULL,
+        left_count INTEGER,
+        participants_count INTEGER,
+        saved INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        FOREIGN KEY (group_id) REFERENCES groups(id)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_member_deltas_group ON member_deltas(group_id, created_at)",
+]
+
+
+# Пользователи, уже учтённые заданием парсинга: задание, продолженное с курсора,
+# не считает их повторно
+PARSE_JOB_USERS = [
+    '''
+    CREATE TABLE IF NOT EXISTS parse_job_users (
+        job_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (job_id, user_id),
+        FOREIGN KEY (job_id) REFERENCES parse_jobs(id)
+    ) WITHOUT ROWID
+    ''',
+]
+
+
+# (версия, описание, шаг). Шаг - список SQL-запросов или async-функция(conn).
+MIGRATIONS = [
+    (1, "исходная схема", _baseline),
+    (2, "кэш сущностей Telegram", ENTITY_CACHE),
+    (3, "кэш метаданных групп", GROUP_META),
+    (4, "кэш глобального поиска", SEARCH_CACHE),
+    (5, "фоновые кампании инвайтов", INVITE_CAMPAIGNS),
+    (6, "пул аккаунтов Telethon", TELETHON_SESSIONS),
+    (7, "адаптивные лимиты запросов", RATE_LIMITS),
+    (8, "хранилище состояний FSM", FSM_STATE),
+    (9, "счётчики групп на триггерах", GROUP_STATS),
+    (10, "статус приглашения в contacts", _contact_status),
+    (11, "служебные значения бота", BOT_STATE),
+    (12, "задания парсинга с контрольными точками", PARSE_JOBS),
+    (13, "снимки состава групп", MEMBER_SYNC),
+    (14, "учтённые пользователи заданий парсинга", PARSE_JOB_USERS),
+]
+
+
+async def _apply(conn, step):
+    if callable(step):
+        await step(conn)
+    else:
+        for statement in step:
+            await conn.execute(statement)
+
+
+async def run_migrations(db):
+    """Применяет все ожидающие миграции одной транзакцией."""
+    async with db.transaction() as conn:
+        async with conn.execute("PRAGMA user_version") as cursor:
+            current = (await cursor.fetchone())[0]
+
+        pending = [m for m in MIGRATIONS if m[0] > current]
+        if not pending:
+            logger.info(f"Схема БД актуальна (версия {current})")
+            return current
+
+        for version, description, step in pending:
+            logger.info(f"Миграция БД {version}: {description}")
+            await _apply(conn, step)
+
+        latest = pending[-1][0]
+        # PRAGMA не принимает параметры, версия - целое число из MIGRATIONS
+        await conn.execute(f"PRAGMA user_version = {int(latest)}")
+
+    logger.info(f"Схема БД обновлена: {current} -> {latest}")
+    return latest
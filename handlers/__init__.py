@@ -2,10 +2,12 @@ from .base import router as base_router
 from .group_parsing import router as group_parsing_router
 from .group_management import router as group_management_router
 from .user_parsing import router as user_parsing_router
+from .tasks import router as tasks_router
 
 __all__ = [
     'base_router',
     'group_parsing_router',
     'group_management_router',
     'user_parsing_router',
+    'tasks_router',
 ]
@@ -1,82 +1,124 @@
 import logging
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.fsm.context import FSMContext
-from aiogram.utils.keyboard import InlineKeyboardBuilder
 from telethon import TelegramClient
-from telethon.tl.functions.channels import GetFullChannelRequest
-from database.db import Database
+from database.db import AsyncDatabase
 from states.states import BotStates
+from utils.entity_cache import EntityCache
+from utils.group_meta import GroupMetaCache
+from utils.helpers import format_participants
+from utils.outbox import Outbox
+from utils.paginated_list import (
+    PaginatedList,
+    nav_row,
+    new_list_id,
+    page_count,
+    selected_indices,
+)
+from config import LIST_PAGE_SIZE
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 router = Router()
 
+GROUPS_VIEW_PREFIX = "view_groups"
+
+DELETE_LIST = PaginatedList(
+    "delete_group",
+    lambda group: f"{group['title']} " + (f"(@{group['username']})" if group['username'] else "(без username)"),
+    actions=[("🗑️ Подтвердить удаление ({count})", "delete_group_confirm")],
+)
+DELETE_TITLE = "📋 Выберите группы для удаления:"
+
+
+async def render_groups_page(db: AsyncDatabase, group_meta: GroupMetaCache, page: int):
+    """Одна страница списка групп: текст и кнопки листания. None, если групп нет."""
+    total = (await db.fetchone("SELECT COUNT(*) FROM groups"))[0]
+    if not total:
+        return None
+    pages = page_count(total)
+    page = min(max(page, 0), pages - 1)
+
+    groups = await db.fetchall("""
+        SELECT 
+            g.id,
+            g.name,
+            g.username,
+            s.contacts as parsed_users,
+            s.invited as invited_users
+        FROM groups g
+        LEFT JOIN group_stats s ON s.group_id = g.id
+        ORDER BY g.id
+        LIMIT ? OFFSET ?
+    """, (LIST_PAGE_SIZE, page * LIST_PAGE_SIZE))
+
+    groups_text = []
+
+    for group in groups:
+        parsed_users = group[3] or 0
+        invited_users = group[4] or 0
+        # Число подписчиков берём из кэша, его обновляет фоновая задача
+        meta = group_meta.get(group[0])
+        if meta is None:
+            group_meta.request_refresh()
+
+        groups_text.append(
+            f"📱 {group[1]} (@{group[2]})\n"
+            f"👥 ID: {group[0]}\n"
+            f"👥 Подписчиков: {format_participants(meta)}\n"
+            f"📥 Спарсено пользователей: {parsed_users}\n"
+            f"📨 Успешно приглашено: {invited_users}"
+        )
+
+    header = "📋 Список сохраненных групп"
+    if pages > 1:
+        header += f" (страница {page + 1}/{pages})"
+    navigation = nav_row(GROUPS_VIEW_PREFIX, page, pages)
+    markup = InlineKeyboardMarkup(inline_keyboard=[navigation]) if navigation else None
+    return f"{header}:\n\n" + "\n\n".join(groups_text), markup
+
+
 @router.message(F.text == "📋 Просмотреть группы")
-async def view_groups(message: Message, telethon_client: TelegramClient):
+async def view_groups(message: Message, db: AsyncDatabase, group_meta: GroupMetaCache):
     """Показать список групп с количеством пользователей и статистикой приглашений."""
     try:
-        if not telethon_client or not await telethon_client.is_user_authorized():
-            logger.error("Telethon client not found or not authorized")
-            await message.answer("❌ Ошибка: клиент Telethon не найден или не авторизован")
-            return
-
-        db = Database("bot_database.db")
-        cursor = db.execute("""
-            SELECT 
-                g.id,
-                g.name,
-                g.username,
-                (SELECT COUNT(*) FROM contacts WHERE group_id = g.id) as parsed_users,
-                (SELECT COUNT(*) FROM invites WHERE group_id = g.id AND status = 'success') as invited_users
-            FROM groups g
-        """)
-        groups = cursor.fetchall()
-        
-        if not groups:
+        result = await render_groups_page(db, group_meta, 0)
+        if result is None:
             logger.warning("No groups stored in the database")
             await message.answer("❌ В базе данных нет сохраненных групп")
             return
-            
-        groups_text = []
-        
-        for group in groups:
-            parsed_users = group[3] or 0
-            invited_users = group[4] or 0
-            try:
-                group_entity = await telethon_client.get_entity(f"t.me/{group[2]}")
-                full_chat = await telethon_client(GetFullChannelRequest(group_entity))
-                participants_count = full_chat.full_chat.participants_count
-                
-                groups_text.append(
-                    f"📱 {group[1]} (@{group[2]})\n"
-                    f"👥 ID: {group[0]}\n"
-                    f"👥 Подписчиков: {participants_count}\n"
-                    f"📥 Спарсено пользователей: {parsed_users}\n"
-                    f"📨 Успешно приглашено: {invited_users}"
-                )
-            except Exception as e:
-                logger.error(f"Error retrieving group info for {group[2]}: {e}")
-                groups_text.append(
-                    f"📱 {group[1]} (@{group[2]})\n"
-                    f"👥 ID: {group[0]}\n"
-                    f"👥 Подписчиков: Нет данных\n"
-                    f"📥 Спарсено пользователей: {parsed_users}\n"
-                    f"📨 Успешно приглашено: {invited_users}"
-                )
 
-        await message.answer(
-            "📋 Список сохраненных групп:\n\n" + "\n\n".join(groups_text)
-        )
+        text, markup = result
+        await message.answer(text, reply_markup=markup)
         
     except Exception as e:
         logger.error(f"Error showing group list: {e}")
         await message.answer("❌ Произошла ошибка при получении списка групп")
 
+
+@router.callback_query(lambda c: c.data.startswith(f"{GROUPS_VIEW_PREFIX}_page_"))
+async def view_groups_page(callback: CallbackQuery, db: AsyncDatabase, group_meta: GroupMetaCache, outbox: Outbox):
+    """Листание списка групп."""
+    try:
+        page = int(callback.data.rsplit("_", 1)[1])
+        await callback.answer()
+        result = await render_groups_page(db, group_meta, page)
+        if result is None:
+            await outbox.edit(callback.message.chat.id, callback.message.message_id,
+                              "❌ В базе данных нет сохраненных групп")
+            return
+
+        text, markup = result
+        await outbox.edit(callback.message.chat.id, callback.message.message_id, text, reply_markup=markup)
+
+    except Exception as e:
+        logger.error(f"Error showing group list page: {e}")
+        await callback.answer("❌ Произошла ошибка при получении списка групп")
+
 @router.message(F.text == "❌ Удалить группу")
-async def delete_group_start(message: Message, state: FSMContext, telethon_client: TelegramClient):
+async def delete_group_start(message: Message, state: FSMContext, db: AsyncDatabase, telethon_client: TelegramClient):
     """Начать процесс удаления групп с чекбоксами."""
     try:
         if not telethon_client:
@@ -84,8 +126,7 @@ async def delete_group_start(message: Message, state: FSMContext, telethon_clien
             await message.answer("❌ Ошибка: клиент Telethon не найден")
             return
 
-        db = Database("bot_database.db")
-        groups = db.execute("SELECT * FROM groups").fetchall()
+        groups = await db.fetchall("SELECT * FROM groups")
         
         if not groups:
             logger.warning("No groups stored in the database for deletion")
@@ -98,84 +139,38 @@ async def delete_group_start(message: Message, state: FSMContext, telethon_clien
             "title": group[1],
             "username": group[2]
         } for group in groups]
-            
-        await state.update_data(found_groups=formatted_groups)
-        
-        builder = InlineKeyboardBuilder()
-        for i, group in enumerate(formatted_groups):
-            username_part = f"(@{group['username']})" if group['username'] else "(без username)"
-            builder.button(
-                text=f"⬜️ {group['title']} {username_part}",
-                callback_data=f"delete_group_select_{i}"
-            )
-        
-        builder.button(text="✅ Выбрать все", callback_data="delete_group_select_all")
-        builder.button(text="❌ Снять выбор", callback_data="delete_group_deselect_all")
-        builder.button(text="🗑️ Подтвердить удаление", callback_data="delete_group_confirm")
-        
-        builder.adjust(1)
-        
+
+        list_id = new_list_id()
+        await state.set_state(BotStates.deleting_groups)
+        await state.update_data(found_groups=formatted_groups, selection=0, page=0, list_id=list_id)
+
         await message.answer(
-            "📋 Выберите группы для удаления:",
-            reply_markup=builder.as_markup()
+            DELETE_LIST.page_text(DELETE_TITLE, 0, len(formatted_groups), 0),
+            reply_markup=DELETE_LIST.markup(list_id, formatted_groups, 0, 0)
         )
         
-        await state.set_state(BotStates.deleting_groups)
-        await state.update_data(selected_groups=[])
-        
     except Exception as e:
         logger.error(f"Error showing groups for deletion: {e}")
         await message.answer("❌ Произошла ошибка при получении списка групп")
 
-@router.callback_query(lambda c: c.data.startswith("delete_group_select_") or c.data in ["delete_group_select_all", "delete_group_deselect_all"])
-async def toggle_group_selection(callback: CallbackQuery, state: FSMContext):
-    """Обработка выбора групп для удаления."""
+@router.callback_query(lambda c: DELETE_LIST.owns(c.data))
+async def toggle_group_selection(callback: CallbackQuery, state: FSMContext, outbox: Outbox):
+    """Обработка выбора и листания групп для удаления."""
     try:
-        callback_data = callback.data
         state_data = await state.get_data()
         found_groups = state_data.get("found_groups", [])
-        selected_groups = state_data.get("selected_groups", [])
-
-        if callback_data == "delete_group_select_all":
-            # Выбираем все группы
-            selected_groups = list(range(len(found_groups)))
-            await callback.answer("Все группы выбраны")
-        elif callback_data == "delete_group_deselect_all":
-            # Снимаем выбор со всех групп
-            selected_groups = []
-            await callback.answer("Выбор снят")
-        else:
-            # Обрабатываем выбор конкретной группы
-            index = int(callback_data.split("_")[3])
-            if index in selected_groups:
-                selected_groups.remove(index)
-            else:
-                selected_groups.append(index)
-
-        # Обновляем состояние
-        await state.update_data(selected_groups=selected_groups)
-
-        # Обновляем клавиатуру
-        builder = InlineKeyboardBuilder()
-        for i, group in enumerate(found_groups):
-            checkbox = "✅" if i in selected_groups else "⬜️"
-            username_part = f"(@{group['username']})" if group['username'] else "(без username)"
-            builder.button(
-                text=f"{checkbox} {group['title']} {username_part}",
-                callback_data=f"delete_group_select_{i}"
-            )
-
-        # Добавляем кнопки управления
-        builder.button(text="✅ Выбрать все", callback_data="delete_group_select_all")
-        builder.button(text="❌ Снять выбор", callback_data="delete_group_deselect_all")
-        builder.button(text="🗑️ Подтвердить удаление", callback_data="delete_group_confirm")
-
-        builder.adjust(1)
+        selection, page = DELETE_LIST.handle(
+            callback.data, state_data.get("selection", 0), state_data.get("page", 0), len(found_groups)
+        )
+        await state.update_data(selection=selection, page=page)
+        await callback.answer()
 
-        # Редактируем сообщение с обновленной клавиатурой
-        await callback.message.edit_text(
-            "📋 Выберите группы для удаления:",
-            reply_markup=builder.as_markup()
+        # Перерисовывается только текущая страница; частые нажатия схлопываются в одну правку
+        await outbox.edit(
+            callback.message.chat.id,
+            callback.message.message_id,
+            DELETE_LIST.page_text(DELETE_TITLE, page, len(found_groups), selection),
+            reply_markup=DELETE_LIST.markup(state_data.get("list_id", ""), found_groups, page, selection)
         )
 
     except Exception as e:
@@ -183,30 +178,27 @@ async def toggle_group_selection(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Ошибка при выборе группы")
 
 @router.callback_query(lambda c: c.data == "delete_group_confirm")
-async def handle_confirm_deletion(callback: CallbackQuery, state: FSMContext):
+async def handle_confirm_deletion(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase, outbox: Outbox):
     """Подтверждение и выполнение удаления выбранных групп."""
     try:
         state_data = await state.get_data()
         found_groups = state_data.get("found_groups", [])
-        selected_groups = state_data.get("selected_groups", [])
+        selected_groups = selected_indices(state_data.get("selection", 0), len(found_groups))
         
         if not selected_groups:
             await callback.answer("❌ Не выбрано ни одной группы")
             return
         
-        db = Database("bot_database.db")
-        deleted_count = 0
-        
-        for index in selected_groups:
-            group = found_groups[index]
-            db.execute("DELETE FROM groups WHERE id = ?", (group['id'],))
-            deleted_count += 1
-        
-        db.commit()
+        group_ids = [(found_groups[index]['id'],) for index in selected_groups]
+        await db.executemany("DELETE FROM groups WHERE id = ?", group_ids)
+        deleted_count = len(group_ids)
         
-        await callback.message.edit_text(
+        await outbox.edit(
+            callback.message.chat.id,
+            callback.message.message_id,
             f"✅ Удалено групп: {deleted_count}\n\n"
-            f"🗑️ Выбранные группы были успешно удалены."
+            f"🗑️ Выбранные группы были успешно удалены.",
+            wait=True,
         )
         
         await state.clear()
@@ -235,7 +227,14 @@ async def add_group_manually(message: Message, state: FSMContext):
     await state.set_state(BotStates.waiting_for_group_name)
 
 @router.message(BotStates.waiting_for_group_name)
-async def process_group_name(message: Message, state: FSMContext, telethon_client: TelegramClient):
+async def process_group_name(
+    message: Message,
+    state: FSMContext,
+    db: AsyncDatabase,
+    entity_cache: EntityCache,
+    group_meta: GroupMetaCache,
+    telethon_client: TelegramClient,
+):
     """Обработка введенного username группы для ручного добавления."""
     try:
         if not telethon_client:
@@ -251,13 +250,13 @@ async def process_group_name(message: Message, state: FSMContext, telethon_clien
             
         try:
             group_entity = await telethon_client.get_entity(f"t.me/{group_username}")
+            await entity_cache.remember(group_username, group_entity)
             
-            db = Database("bot_database.db")
-            db.execute(
+            await db.execute(
                 "INSERT OR IGNORE INTO groups (id, name, username) VALUES (?, ?, ?)",
                 (group_entity.id, group_entity.title, group_username)
             )
-            db.commit()
+            group_meta.request_refresh()
             
             await message.answer(
                 f"✅ Группа успешно добавлена!\n\n"
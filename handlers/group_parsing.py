@@ -1,21 +1,35 @@
 import asyncio
 import logging
+from typing import AsyncIterator, Optional
 from aiogram import Router, F
+from telethon.errors import FloodWaitError
 from telethon.sync import TelegramClient
 from telethon.tl.functions.contacts import SearchRequest
 from telethon.tl.functions.channels import GetFullChannelRequest
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from states.states import BotStates
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from database.db import Database
+from database.db import AsyncDatabase
+from utils.group_meta import GroupMetaCache
 from aiogram.exceptions import TelegramBadRequest
+from config import SEARCH_CONCURRENCY
+from utils.search_cache import SearchCache
+from utils.outbox import Outbox
+from utils.metrics import JOBS_IN_FLIGHT
+from utils.paginated_list import PaginatedList, new_list_id, selected_indices
+from utils.tasks import DuplicateTask, Task, TaskManager, TooManyTasks
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+async def call_limited(semaphore: asyncio.Semaphore, func, *args):
+    """Вызов с ограничением параллельности. Темп и FloodWait - забота ограничителя запросов клиента."""
+    async with semaphore:
+        return await func(*args)
+
+
 async def is_comments_enabled(client: TelegramClient, chat) -> bool:
     """Проверка, разрешены ли комментарии в канале."""
     try:
@@ -23,6 +37,8 @@ async def is_comments_enabled(client: TelegramClient, chat) -> bool:
         is_enabled = full_chat.full_chat.comments_enabled
         logger.debug(f"Комментарии в канале {chat.title} ({chat.id}) {'включены' if is_enabled else 'выключены'}")
         return is_enabled
+    except FloodWaitError:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при проверке комментариев в канале {chat}: {e}", exc_info=True)
         return False
@@ -37,62 +53,174 @@ async def has_user_messages(client: TelegramClient, chat) -> bool:
                 break  # Прекращаем после первого сообщения пользователя
         logger.debug(f"Наличие сообщений от пользователей в канале {chat.title} ({chat.id}): {'есть' if user_messages else 'нет'}")
         return user_messages
+    except FloodWaitError:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при проверке сообщений в канале {chat}: {e}", exc_info=True)
         return False
 
-async def global_search(client: TelegramClient, keywords: list[str]) -> list[dict]:
-    """Поиск групп через поиск Telegram с фильтрацией."""
-    results = []
-    unique_groups = set()  # Для хранения уникальных групп
+async def search_chats(client: TelegramClient, keyword: str) -> list:
+    """Поиск чатов по одному ключевому слову."""
+    search_result = await client(SearchRequest(
+        q=keyword,
+        limit=100
+    ))
+    return search_result.chats if hasattr(search_result, 'chats') else []
+
+def is_active_group(group: dict) -> bool:
+    return group["comments_enabled"] or group["has_user_messages"]
+
+async def classify_chat(
+    client: TelegramClient,
+    chat,
+    semaphore: asyncio.Semaphore,
+    cache: Optional[SearchCache] = None,
+) -> Optional[dict]:
+    """Проверяет чат; возвращает данные группы, если в ней есть активность."""
+    comments_enabled, has_messages = await asyncio.gather(
+        call_limited(semaphore, is_comments_enabled, client, chat),
+        call_limited(semaphore, has_user_messages, client, chat),
+    )
+    if cache:
+        cache.put_chat(chat, comments_enabled, has_messages)
+    if not (comments_enabled or has_messages):
+        logger.debug(f"Группа {chat.title} (@{chat.username}), ID: {chat.id} пропущена, т.к. комментарии отключены и нет сообщений от пользователей.")
+        return None
+
+    logger.info(f"✅ Найдена и добавлена группа: {chat.title} (@{chat.username}), ID: {chat.id}")
+    return {
+        "id": chat.id,
+        "title": chat.title,
+        "username": chat.username,
+        "comments_enabled": comments_enabled,
+        "has_user_messages": has_messages
+    }
+
+async def iter_global_search(
+    client: TelegramClient,
+    keywords: list[str],
+    concurrency: int = SEARCH_CONCURRENCY,
+    cache: Optional[SearchCache] = None,
+) -> AsyncIterator[dict]:
+    """
+    Поиск групп через поиск Telegram с фильтрацией.
+
+    Поиск по ключевым словам и проверка чатов идут параллельно (не больше
+    `concurrency` запросов одновременно). Чаты дедуплицируются по ID до
+    проверки, найденные группы отдаются по мере готовности. Если передан
+    `cache`, повторные запросы и проверки берутся из него без обращения к Telegram.
+    """
     total_keywords = len(keywords)
     logger.info(f"Начинается глобальный поиск по {total_keywords} ключевым словам.")
 
-    for i, keyword in enumerate(keywords):
-        logger.info(f"[{i+1}/{total_keywords}] 🔍 Поиск по ключевому слову: {keyword}")
-        try:
-            search_result = await client(SearchRequest(
-                q=keyword,
-                limit=100
-            ))
-
-            chats = search_result.chats if hasattr(search_result, 'chats') else []
-            num_chats = len(chats)
-            logger.info(f"[{i+1}/{total_keywords}] Получен результат поиска для '{keyword}'. Найдено {num_chats} чатов.")
-
-            for j, chat in enumerate(chats):
-                if hasattr(chat, 'username') and chat.username:
-                    logger.debug(f"[{i+1}/{total_keywords}] [{j+1}/{num_chats}] Обработка чата: {chat.title} (@{chat.username})")
-
-                    comments_enabled = await is_comments_enabled(client, chat)
-                    has_messages = await has_user_messages(client, chat)
-
-                    if comments_enabled or has_messages:
-                        group_data = (chat.id, chat.title, chat.username)  # Используем кортеж для уникальности
-                        if group_data not in unique_groups:
-                            unique_groups.add(group_data)
-                            group_info = {
-                                "id": chat.id,
-                                "title": chat.title,
-                                "username": chat.username,
-                                "comments_enabled": comments_enabled,
-                                "has_user_messages": has_messages
-                            }
-                            results.append(group_info)
-                            logger.info(f"[{i+1}/{total_keywords}] [{j+1}/{num_chats}]  ✅ Найдена и добавлена группа: {chat.title} (@{chat.username}), ID: {chat.id}")
-                        else:
-                             logger.debug(f"[{i+1}/{total_keywords}] [{j+1}/{num_chats}] Группа {chat.title} (@{chat.username}), ID: {chat.id} уже существует в unique_groups, пропущена.")
-                    else:
-                        logger.debug(f"[{i+1}/{total_keywords}] [{j+1}/{num_chats}] Группа {chat.title} (@{chat.username}), ID: {chat.id} пропущена, т.к. комментарии отключены и нет сообщений от пользователей.")
-                else:
-                     logger.warning(f"[{i+1}/{total_keywords}] [{j+1}/{num_chats}] Чат {chat.title} ({chat.id}) пропущен, нет username.")
+    semaphore = asyncio.Semaphore(concurrency)
+    results = asyncio.Queue()
+    seen_ids = set()
+    tasks = set()
+
+    def spawn(coro):
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(lambda t: results.put_nowait(t))
+
+    def add_cached(group):
+        # Готовый результат из кэша кладётся в ту же очередь, что и задачи
+        if group["id"] not in seen_ids:
+            seen_ids.add(group["id"])
+            if is_active_group(group):
+                results.put_nowait(group)
+
+    async def search_keyword(i, keyword):
+        cached_groups = cache.get_keyword(keyword) if cache else None
+        if cached_groups is not None:
+            logger.info(f"[{i+1}/{total_keywords}] Результат для '{keyword}' взят из кэша ({len(cached_groups)} чатов).")
+            for group in cached_groups:
+                add_cached(group)
+            return None
 
+        try:
+            chats = await call_limited(semaphore, search_chats, client, keyword)
         except Exception as e:
             logger.error(f"[{i+1}/{total_keywords}] ❌ Ошибка при поиске по '{keyword}': {str(e)}", exc_info=True)
+            return None
 
-    total_found = len(results)
-    logger.info(f"Глобальный поиск завершен. Всего найдено уникальных групп: {total_found}")
-    return results
+        logger.info(f"[{i+1}/{total_keywords}] Получен результат поиска для '{keyword}'. Найдено {len(chats)} чатов.")
+        chat_ids = []
+        for chat in chats:
+            if not getattr(chat, 'username', None):
+                logger.debug(f"Чат {chat.title} ({chat.id}) пропущен, нет username.")
+                continue
+            chat_ids.append(chat.id)
+            cached_group = cache.get_chat(chat.id) if cache else None
+            if cached_group is not None:
+                add_cached(cached_group)
+                continue
+            if chat.id in seen_ids:
+                continue
+            seen_ids.add(chat.id)
+            spawn(classify_chat(client, chat, semaphore, cache))
+        if cache:
+            cache.put_keyword(keyword, chat_ids)
+        return None
+
+    for i, keyword in enumerate(keywords):
+        spawn(search_keyword(i, keyword))
+
+    found = 0
+    try:
+        while tasks:
+            item = await results.get()
+            if isinstance(item, dict):
+                group = item
+            else:
+                tasks.discard(item)
+                if item.cancelled():
+                    continue
+                if item.exception():
+                    logger.error(f"Ошибка при проверке чата: {item.exception()}")
+                    continue
+                group = item.result()
+            if group:
+                found += 1
+                yield {key: group[key] for key in ("id", "title", "username", "comments_enabled", "has_user_messages")}
+    finally:
+        for task in tasks:
+            task.cancel()
+        if cache:
+            await cache.flush()
+            logger.info(f"Статистика кэша поиска: {cache.stats()}")
+
+    logger.info(f"Глобальный поиск завершен. Всего найдено уникальных групп: {found}")
+
+async def global_search(
+    client: TelegramClient,
+    keywords: list[str],
+    cache: Optional[SearchCache] = None,
+) -> list[dict]:
+    """Поиск групп целиком, без потоковой выдачи."""
+    return [group async for group in iter_global_search(client, keywords, cache=cache)]
+
+
+SEARCH_LIST = PaginatedList(
+    "search_group",
+    lambda group: " ".join(filter(None, [
+        group['title'],
+        f"(@{group['username']})" if group['username'] else "(без username)",
+        "💬" if group['comments_enabled'] else "",
+        "📨" if group['has_user_messages'] else "",
+    ])),
+    actions=[("💾 Сохранить выбранные ({count})", "save_selected")],
+)
+SEARCH_TITLE = "📋 Выберите группы для сохранения:"
+
+
+def search_page(state_data: dict, groups: list[dict], title: str = SEARCH_TITLE):
+    """Текст и клавиатура текущей страницы найденных групп."""
+    selection, page = state_data.get("selection", 0), state_data.get("page", 0)
+    return (
+        SEARCH_LIST.page_text(title, page, len(groups), selection),
+        SEARCH_LIST.markup(state_data.get("list_id", ""), groups, page, selection),
+    )
 
 
 # --- Обработчики Aiogram ---
@@ -105,48 +233,39 @@ async def text_parse_groups(message: Message, state: FSMContext):
 
 
 @router.message(BotStates.waiting_for_keywords)
-async def search_groups_handler(message: Message, state: FSMContext, telethon_client: TelegramClient = None):
-    """Обработчик для поиска групп по ключевым словам."""
+async def search_groups_handler(
+    message: Message,
+    state: FSMContext,
+    search_cache: SearchCache,
+    outbox: Outbox,
+    task_manager: TaskManager,
+    telethon_client: TelegramClient = None,
+):
+    """Обработчик для поиска групп по ключевым словам: сам поиск идёт фоновой задачей."""
     try:
         if not telethon_client:
             await message.answer(" Ошибка: клиент Telethon не найден")
             return
 
         keywords = [k.strip() for k in message.text.split(',')]
-        await message.answer(f"🔍 Начинаю поиск групп по ключевым словам: {keywords}")
-
-        groups = await global_search(telethon_client, keywords)
-
-        if not groups:
-            await message.answer("❌ Группы не найдены")
-            await state.clear()
-            return
 
-        await state.update_data(found_groups=groups)
+        async def job(task: Task):
+            await search_groups(task, message, state, keywords, search_cache, outbox, telethon_client)
 
-        builder = InlineKeyboardBuilder()
-        for i, group in enumerate(groups):
-            username_part = f"(@{group['username']})" if group['username'] else "(без username)"
-            comments_info = "💬" if group['comments_enabled'] else ""
-            messages_info = "📨" if group['has_user_messages'] else ""
-            builder.button(
-                text=f"⬜️ {group['title']} {username_part} {comments_info} {messages_info}",
-                callback_data=f"select_group_{i}"
+        try:
+            # Один поиск на пользователя: выбор групп хранится в его состоянии FSM
+            task = task_manager.submit(
+                "search", message.from_user.id, f"Поиск групп: {', '.join(keywords)}", job,
+                key=("search", message.from_user.id),
             )
+        except DuplicateTask as e:
+            await message.answer(f"⏳ Поиск уже идёт (задача #{e.task.id}). Отмена: /cancel {e.task.id}")
+            return
+        except TooManyTasks as e:
+            await message.answer(f"❌ {e}. Статус: /status")
+            return
 
-        builder.button(text="✅ Выбрать все", callback_data="select_all")
-        builder.button(text="❌ Снять выбор", callback_data="deselect_all")
-        builder.button(text="💾 Сохранить выбранные", callback_data="save_selected")
-
-        builder.adjust(1)
-
-        await message.answer(
-            "📋 Выберите группы для сохранения:",
-            reply_markup=builder.as_markup()
-        )
-
-        await state.set_state(BotStates.selecting_groups)
-        await state.update_data(selected_groups=[])
+        logger.info(f"Поиск групп по {keywords} поставлен в очередь (задача #{task.id})")
 
     except Exception as e:
         logger.error(f"❌ Ошибка при поиске групп: {e}", exc_info=True)
@@ -154,44 +273,81 @@ async def search_groups_handler(message: Message, state: FSMContext, telethon_cl
         await state.clear()
 
 
-@router.callback_query(lambda c: c.data.startswith("select_group_"))
-async def toggle_group_selection(callback: CallbackQuery, state: FSMContext):
-    """Обработчик для переключения выбора группы."""
+async def search_groups(
+    task: Task,
+    message: Message,
+    state: FSMContext,
+    keywords: list[str],
+    search_cache: SearchCache,
+    outbox: Outbox,
+    telethon_client: TelegramClient,
+):
+    """Глобальный поиск с потоковой выдачей в сообщение - тело фоновой задачи."""
+    status_message = await message.answer(
+        f"🔍 Начинаю поиск групп по ключевым словам: {keywords}\nОтмена: /cancel {task.id}"
+    )
+    progress = outbox.progress(status_message.chat.id, status_message.message_id)
+
+    # Выбор доступен сразу: клавиатура пополняется по мере поиска
+    await state.set_state(BotStates.selecting_groups)
+    await state.update_data(found_groups=[], selection=0, page=0, list_id=new_list_id())
+
+    groups = []
     try:
-        index = int(callback.data.split("_")[2])
-        state_data = await state.get_data()
-        found_groups = state_data.get("found_groups", [])
-        selected_groups = state_data.get("selected_groups", [])
-
-        if index in selected_groups:
-            selected_groups.remove(index)
+        with JOBS_IN_FLIGHT.track(kind="search"):
+            async for group in iter_global_search(telethon_client, keywords, cache=search_cache):
+                groups.append(group)
+                task.progress = f"Найдено групп: {len(groups)}"
+                # Клавиатуру собираем только когда её действительно пора отправлять
+                if progress.due:
+                    await state.update_data(found_groups=groups)
+                    text, markup = search_page(
+                        await state.get_data(), groups,
+                        f"🔍 Поиск продолжается... Найдено групп: {len(groups)}\n{SEARCH_TITLE}",
+                    )
+                    await progress.update(text, reply_markup=markup)
+    except asyncio.CancelledError:
+        # Найденное до отмены остаётся доступным для выбора
+        if groups:
+            await state.update_data(found_groups=groups)
+            text, markup = search_page(await state.get_data(), groups, f"⛔ Поиск остановлен\n{SEARCH_TITLE}")
+            await progress.finish(text, reply_markup=markup, wait=False)
         else:
-            selected_groups.append(index)
-
-        await state.update_data(selected_groups=selected_groups)
-
-        # Обновляем клавиатуру
-        builder = InlineKeyboardBuilder()
-        for i, group in enumerate(found_groups):
-            checkbox = "✅" if i in selected_groups else "⬜️"
-            username_part = f"(@{group['username']})" if group['username'] else "(без username)"
-            comments_info = "💬" if group['comments_enabled'] else ""
-            messages_info = "📨" if group['has_user_messages'] else ""
-            builder.button(
-                text=f"{checkbox} {group['title']} {username_part} {comments_info} {messages_info}",
-                callback_data=f"select_group_{i}"
-            )
+            await progress.finish("⛔ Поиск остановлен", wait=False)
+            await state.clear()
+        raise
+    except Exception as e:
+        logger.error(f"❌ Ошибка при поиске групп: {e}", exc_info=True)
+        await progress.finish(f"❌ Произошла ошибка при поиске: {str(e)}")
+        await state.clear()
+        return
+
+    if not groups:
+        await progress.finish("❌ Группы не найдены")
+        await state.clear()
+        return
 
-        builder.button(text="✅ Выбрать все", callback_data="select_all")
-        builder.button(text="❌ Снять выбор", callback_data="deselect_all")
-        builder.button(text="💾 Сохранить выбранные", callback_data="save_selected")
+    await state.update_data(found_groups=groups)
+    text, markup = search_page(await state.get_data(), groups)
+    await progress.finish(text, reply_markup=markup)
 
-        builder.adjust(1)
 
-        await callback.message.edit_text(
-            "📋 Выберите группы для сохранения:",
-            reply_markup=builder.as_markup()
+@router.callback_query(lambda c: SEARCH_LIST.owns(c.data))
+async def toggle_group_selection(callback: CallbackQuery, state: FSMContext, outbox: Outbox):
+    """Обработчик выбора групп, кнопок 'Выбрать все' / 'Снять выбор' и листания."""
+    try:
+        state_data = await state.get_data()
+        found_groups = state_data.get("found_groups", [])
+        selection, page = SEARCH_LIST.handle(
+            callback.data, state_data.get("selection", 0), state_data.get("page", 0), len(found_groups)
         )
+        await state.update_data(selection=selection, page=page)
+        state_data.update(selection=selection, page=page)
+
+        await callback.answer()
+        # Перерисовывается только текущая страница; частые нажатия схлопываются в одну правку
+        text, markup = search_page(state_data, found_groups)
+        await outbox.edit(callback.message.chat.id, callback.message.message_id, text, reply_markup=markup)
 
     except TelegramBadRequest as e:
         if "query is too old" in str(e):
@@ -200,135 +356,72 @@ async def toggle_group_selection(callback: CallbackQuery, state: FSMContext):
         else:
             logger.error(f"Ошибка при выборе группы: {e}", exc_info=True)
             await callback.answer("❌ Ошибка при выборе группы")
-
-
-@router.callback_query(lambda c: c.data == "select_all")
-async def handle_select_all(callback: CallbackQuery, state: FSMContext):
-    """Обработчик для выбора всех групп."""
-    try:
-        state_data = await state.get_data()
-        found_groups = state_data.get("found_groups", [])
-
-        # Выбираем все группы
-        selected_groups = list(range(len(found_groups)))
-        await state.update_data(selected_groups=selected_groups)
-
-        # Обновляем клавиатуру
-        builder = InlineKeyboardBuilder()
-        for i, group in enumerate(found_groups):
-            username_part = f"(@{group['username']})" if group['username'] else "(без username)"
-            comments_info = "💬" if group['comments_enabled'] else ""
-            messages_info = "📨" if group['has_user_messages'] else ""
-            builder.button(
-                text=f"✅ {group['title']} {username_part} {comments_info} {messages_info}",
-                callback_data=f"select_group_{i}"
-            )
-
-        builder.button(text="✅ Выбрать все", callback_data="select_all")
-        builder.button(text="❌ Снять выбор", callback_data="deselect_all")
-        builder.button(text="💾 Сохранить выбранные", callback_data="save_selected")
-
-        builder.adjust(1)
-
-        await callback.message.edit_text(
-            "📋 Выберите группы для сохранения:",
-            reply_markup=builder.as_markup()
-        )
-
     except Exception as e:
-        logger.error(f"Ошибка при выборе всех групп: {e}", exc_info=True)
-        await callback.answer("❌ Ошибка при выборе всех групп")
-
-
-@router.callback_query(lambda c: c.data == "deselect_all")
-async def handle_deselect_all(callback: CallbackQuery, state: FSMContext):
-    """Обработчик для снятия выбора со всех групп."""
-    try:
-        state_data = await state.get_data()
-        found_groups = state_data.get("found_groups", [])
-
-        # Очищаем выбор
-        await state.update_data(selected_groups=[])
-
-        # Обновляем клавиатуру
-        builder = InlineKeyboardBuilder()
-        for i, group in enumerate(found_groups):
-            username_part = f"(@{group['username']})" if group['username'] else "(без username)"
-            comments_info = "💬" if group['comments_enabled'] else ""
-            messages_info = "📨" if group['has_user_messages'] else ""
-            builder.button(
-                text=f"⬜️ {group['title']} {username_part} {comments_info} {messages_info}",
-                callback_data=f"select_group_{i}"
-            )
-
-        builder.button(text="✅ Выбрать все", callback_data="select_all")
-        builder.button(text="❌ Снять выбор", callback_data="deselect_all")
-        builder.button(text="💾 Сохранить выбранные", callback_data="save_selected")
-
-        builder.adjust(1)
-
-        await callback.message.edit_text(
-            "📋 Выберите группы для сохранения:",
-            reply_markup=builder.as_markup()
-        )
-
-    except Exception as e:
-        logger.error(f"Ошибка при снятии выбора: {e}", exc_info=True)
-        await callback.answer("❌ Ошибка при снятии выбора")
+        logger.error(f"Ошибка при выборе группы: {e}", exc_info=True)
+        await callback.answer("❌ Ошибка при выборе группы")
 
 
 @router.callback_query(lambda c: c.data == "save_selected")
-async def save_selected_groups(callback: CallbackQuery, state: FSMContext):
+async def save_selected_groups(
+    callback: CallbackQuery,
+    state: FSMContext,
+    db: AsyncDatabase,
+    group_meta: GroupMetaCache,
+    outbox: Outbox,
+):
     """Обработчик для сохранения выбранных групп."""
     try:
         state_data = await state.get_data()
         found_groups = state_data.get("found_groups", [])
-        selected_indices = state_data.get("selected_groups", [])
+        selected = selected_indices(state_data.get("selection", 0), len(found_groups))
 
-        if not selected_indices:
+        if not selected:
             await callback.answer("❌ Не выбрано ни одной группы")
             return
 
-        selected_groups = [found_groups[i] for i in selected_indices]
+        selected_groups = [found_groups[i] for i in selected]
         logger.info(f"Сохранение групп: {selected_groups}")
 
         # Сохраняем группы в базу данных
-        db = Database("bot_database.db") #  Получите путь к БД из конфига, а не хардкодом
         saved_count = 0
         already_exists = 0
 
-        for group in selected_groups:
-            try:
-                # Проверяем, существует ли группа уже в базе
-                cursor = db.execute("SELECT id FROM groups WHERE username = ?", (group['username'],))
-                existing_group = cursor.fetchone()
-
-                if existing_group:
-                    already_exists += 1
+        async with db.transaction() as conn:
+            for group in selected_groups:
+                try:
+                    # Проверяем, существует ли группа уже в базе
+                    async with conn.execute("SELECT id FROM groups WHERE username = ?", (group['username'],)) as cursor:
+                        existing_group = await cursor.fetchone()
+
+                    if existing_group:
+                        already_exists += 1
+                        continue
+
+                    # Сохраняем новую группу
+                    await conn.execute(
+                        "INSERT INTO groups (id, name, username) VALUES (?, ?, ?)",
+                        (group['id'], group['title'], group['username'])
+                    )
+                    saved_count += 1
+
+                except Exception as e:
+                    logger.error(f"Ошибка при сохранении группы {group['title']}: {e}", exc_info=True)
                     continue
 
-                # Сохраняем новую группу
-                db.execute(
-                    "INSERT INTO groups (id, name, username) VALUES (?, ?, ?)",
-                    (group['id'], group['title'], group['username'])
-                )
-                saved_count += 1
-
-            except Exception as e:
-                logger.error(f"Ошибка при сохранении группы {group['title']}: {e}", exc_info=True)
-                continue
-
-        db.commit()
+        if saved_count:
+            group_meta.request_refresh()
 
         # Формируем сообщение о результатах
         result_message = (
             f"✅ Результаты сохранения:\n\n"
             f"📥 Сохранено новых групп: {saved_count}\n"
             f"📝 Уже существующих: {already_exists}\n"
-            f"📊 Всего выбрано: {len(selected_indices)}"
+            f"📊 Всего выбрано: {len(selected)}"
         )
 
-        await callback.message.edit_text(result_message)
+        await callback.answer(f"✅ Сохранено групп: {saved_count}")
+        # Через очередь, чтобы итог не перезаписала отставшая правка клавиатуры
+        await outbox.edit(callback.message.chat.id, callback.message.message_id, result_message, wait=True)
         await state.clear()
 
     except Exception as e:
@@ -1,30 +1,29 @@
+import time
+import logging
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
-from database.db import Database
-from telethon.tl.functions.channels import InviteToChannelRequest
-from telethon.errors import FloodWaitError, UserPrivacyRestrictedError, UserNotMutualContactError
-import asyncio
-from config import INVITE_DELAY
+from database.db import AsyncDatabase
+from utils.campaigns import InviteCampaigns
+from utils.outbox import Outbox
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
 @router.message(F.text == "📨 Рассылка инвайтов")
-async def start_invite_mailing(message: Message, state: FSMContext):
+async def start_invite_mailing(message: Message, state: FSMContext, db: AsyncDatabase):
     try:
-        db = Database("bot_database.db")
-        cursor = db.execute("""
+        groups = await db.fetchall("""
             SELECT 
                 g.id,
                 g.name,
                 g.username,
-                COUNT(DISTINCT c.username) as users_count
+                s.contacts as users_count
             FROM groups g
-            LEFT JOIN contacts c ON g.id = c.group_id
-            GROUP BY g.id
+            LEFT JOIN group_stats s ON s.group_id = g.id
         """)
-        groups = cursor.fetchall()
         
         if not groups:
             await message.answer("❌ В базе данных нет сохраненных групп")
@@ -46,114 +45,62 @@ async def start_invite_mailing(message: Message, state: FSMContext):
         )
         
     except Exception as e:
-        print(f"Ошибка при показе групп для рассылки: {e}")
+        logger.error(f"Ошибка при показе групп для рассылки: {e}", exc_info=True)
         await message.answer("❌ Произошла ошибка при получении списка групп")
 
 @router.callback_query(lambda c: c.data.startswith("invite_to_group_"))
-async def handle_invite_to_group(callback: CallbackQuery, state: FSMContext, telethon_client=None):
+async def handle_invite_to_group(
+    callback: CallbackQuery,
+    state: FSMContext,
+    db: AsyncDatabase,
+    invite_campaigns: InviteCampaigns,
+    outbox: Outbox,
+):
+    """Ставит рассылку инвайтов в очередь; саму рассылку ведёт фоновый воркер."""
+    chat_id, message_id = callback.message.chat.id, callback.message.message_id
     try:
-        if not telethon_client:
-            await callback.answer("❌ Ошибка: клиент Telethon не найден")
-            return
-
         group_id = int(callback.data.split("_")[3])
-        db = Database("bot_database.db")
         
         # Получаем информацию о группе
-        cursor = db.execute("SELECT * FROM groups WHERE id = ?", (group_id,))
-        group = cursor.fetchone()
+        group = await db.fetchone("SELECT * FROM groups WHERE id = ?", (group_id,))
         if not group:
             await callback.answer("❌ Группа не найдена")
             return
 
-        # Получаем список пользователей для приглашения
-        cursor = db.execute("""
-            SELECT c.username 
-            FROM contacts c
-            LEFT JOIN invites i ON c.username = i.username AND c.group_id = i.group_id
-            WHERE c.group_id = ? AND (i.status IS NULL OR i.status = 'failed')
-            LIMIT 50
-        """, (group_id,))
-        users = cursor.fetchall()
+        campaign = await invite_campaigns.get_active(group_id)
+        if campaign:
+            await outbox.edit(
+                chat_id,
+                message_id,
+                f"🔄 Рассылка в группу {group[1]} уже идёт\n\n"
+                f"✅ Успешно приглашено: {campaign.invited}\n"
+                f"❌ Ошибок: {campaign.failed}\n"
+                f"📅 Сегодня: {campaign.sent_today}/{campaign.daily_limit}"
+            )
+            return
+
+        # Есть ли кому отправлять приглашения (по индексу кандидатов)
+        has_users = await db.fetchone("""
+            SELECT 1
+            FROM contacts
+            WHERE group_id = ? AND status IN ('new', 'failed') AND next_attempt_at <= ?
+            LIMIT 1
+        """, (group_id, time.time()))
 
-        if not users:
-            await callback.message.edit_text("❌ Нет пользователей для приглашения")
+        if not has_users:
+            await outbox.edit(chat_id, message_id, "❌ Нет пользователей для приглашения")
             return
 
-        status_message = await callback.message.edit_text(
-            f"🔄 Начинаю рассылку инвайтов в группу {group[1]}...\n"
-            f"👥 Всего пользователей для приглашения: {len(users)}"
+        await callback.answer()
+        # Дальше это сообщение обновляет кампания через ту же очередь
+        await outbox.edit(
+            chat_id,
+            message_id,
+            f"📨 Рассылка инвайтов в группу {group[1]} поставлена в очередь.\n"
+            f"Приглашения отправляются в фоне, прогресс будет обновляться в этом сообщении."
         )
-
-        success_count = 0
-        error_count = 0
-        
-        try:
-            group_entity = await telethon_client.get_entity(f"t.me/{group[2]}")
-            
-            for i, user in enumerate(users, 1):
-                try:
-                    user_entity = await telethon_client.get_entity(f"@{user[0]}")
-                    await telethon_client(InviteToChannelRequest(group_entity, [user_entity]))
-                    
-                    # Записываем успешное приглашение
-                    db.execute(
-                        "INSERT OR REPLACE INTO invites (username, group_id, status) VALUES (?, ?, ?)",
-                        (user[0], group_id, 'success')
-                    )
-                    db.commit()
-                    
-                    success_count += 1
-                    
-                except (UserPrivacyRestrictedError, UserNotMutualContactError):
-                    # Пользователь запретил приглашения
-                    db.execute(
-                        "INSERT OR REPLACE INTO invites (username, group_id, status) VALUES (?, ?, ?)",
-                        (user[0], group_id, 'failed')
-                    )
-                    db.commit()
-                    error_count += 1
-                    
-                except FloodWaitError as e:
-                    await status_message.edit_text(
-                        f"⚠️ Достигнут лимит приглашений. Нужно подождать {e.seconds} секунд.\n\n"
-                        f"✅ Успешно приглашено: {success_count}\n"
-                        f"❌ Ошибок: {error_count}"
-                    )
-                    break
-                    
-                except Exception as e:
-                    print(f"Ошибка при приглашении пользователя {user[0]}: {e}")
-                    error_count += 1
-                
-                # Обновляем статус каждые 5 пользователей
-                if i % 5 == 0:
-                    await status_message.edit_text(
-                        f"🔄 Рассылка инвайтов в группу {group[1]}...\n"
-                        f"✅ Успешно приглашено: {success_count}\n"
-                        f"❌ Ошибок: {error_count}\n"
-                        f"📊 Прогресс: {i}/{len(users)}"
-                    )
-                
-                await asyncio.sleep(INVITE_DELAY)  # Задержка между приглашениями
-            
-            # Финальное сообщение
-            await status_message.edit_text(
-                f"✅ Рассылка инвайтов завершена!\n\n"
-                f"📊 Статистика:\n"
-                f"👥 Всего обработано: {len(users)}\n"
-                f"✅ Успешно приглашено: {success_count}\n"
-                f"❌ Ошибок: {error_count}"
-            )
-            
-        except Exception as e:
-            await status_message.edit_text(
-                f"❌ Ошибка при рассылке инвайтов:\n{str(e)}\n\n"
-                f"📊 Статистика:\n"
-                f"✅ Успешно приглашено: {success_count}\n"
-                f"❌ Ошибок: {error_count}"
-            )
+        await invite_campaigns.create(group_id, chat_id=chat_id, message_id=message_id)
             
     except Exception as e:
-        print(f"Ошибка в обработчике рассылки: {e}")
-        await callback.message.edit_text(f"❌ Произошла ошибка: {str(e)}") 
\ No newline at end of file
+        logger.error(f"Ошибка в обработчике рассылки: {e}", exc_info=True)
+        await outbox.edit(chat_id, message_id, f"❌ Произошла ошибка: {str(e)}")
@@ -0,0 +1,81 @@
+import logging
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from utils.campaigns import InviteCampaigns
+from utils.tasks import TaskManager
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+# Сколько последних завершённых задач показывать в /status
+STATUS_RECENT = 5
+
+
+@router.message(Command("status"))
+async def cmd_status(message: Message, task_manager: TaskManager, invite_campaigns: InviteCampaigns):
+    """Фоновые задачи пользователя и его активные рассылки."""
+    tasks = task_manager.user_tasks(message.from_user.id)
+    active = [task for task in tasks if task.active]
+    finished = [task for task in tasks if not task.active][-STATUS_RECENT:]
+    campaigns = await invite_campaigns.active_for_chat(message.chat.id)
+
+    if not (active or finished or campaigns):
+        await message.answer("📋 У вас нет фоновых задач")
+        return
+
+    lines = []
+    if active:
+        lines.append("📋 Текущие задачи:")
+        lines.extend(task.describe() for task in active)
+    if campaigns:
+        lines.append("\n📨 Рассылки инвайтов:")
+        lines.extend(
+            f"{campaign.group_name}: приглашено {campaign.invited}, ошибок {campaign.failed}, "
+            f"сегодня {campaign.sent_today}/{campaign.daily_limit}"
+            for campaign in campaigns
+        )
+    if finished:
+        lines.append("\n🕓 Недавно завершённые:")
+        lines.extend(task.describe() for task in reversed(finished))
+    if active or campaigns:
+        lines.append("\nОтменить: /cancel (всё) или /cancel <номер задачи>")
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("cancel"))
+async def cmd_cancel(
+    message: Message,
+    command: CommandObject,
+    task_manager: TaskManager,
+    invite_campaigns: InviteCampaigns,
+):
+    """/cancel - отменить все задачи и рассылки пользователя, /cancel N - одну задачу."""
+    task_id = None
+    if command.args:
+        try:
+            task_id = int(command.args.strip().lstrip("#"))
+        except ValueError:
+            await message.answer("❌ Укажите номер задачи: /cancel 3")
+            return
+
+    cancelled = task_manager.cancel(message.from_user.id, task_id)
+    campaigns = [] if task_id is not None else await invite_campaigns.active_for_chat(message.chat.id)
+    for campaign in campaigns:
+        await invite_campaigns.cancel(campaign)
+
+    if not (cancelled or campaigns):
+        await message.answer(
+            f"❌ Задача #{task_id} не найдена или уже завершена" if task_id is not None
+            else "📋 Нечего отменять"
+        )
+        return
+
+    logger.info(
+        f"Пользователь {message.from_user.id} отменил задачи {[task.id for task in cancelled]} "
+        f"и рассылки {[campaign.id for campaign in campaigns]}"
+    )
+    lines = [f"⛔ Отменено: #{task.id} {task.title}" for task in cancelled]
+    lines.extend(f"⛔ Остановлена рассылка в группу {campaign.group_name}" for campaign in campaigns)
+    await message.answer("\n".join(lines))
@@ -1,27 +1,35 @@
+import logging
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from states.states import BotStates
-from database.db import Database
+from database.db import AsyncDatabase
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from telethon.tl.functions.channels import (
-    GetFullChannelRequest,
-    GetParticipantsRequest,
-    JoinChannelRequest,
-)
-from telethon.tl.types import (
-    ChannelParticipantsSearch,
-    ChannelParticipantsRecent,
-    Channel,
-)
-from telethon.errors import FloodWaitError, ChatAdminRequiredError
-import asyncio
+from telethon.errors import ChatAdminRequiredError
+from utils.participants import iter_participant_pages
+from utils.session_pool import SessionPool
+from utils.entity_cache import EntityCache
+from utils.group_meta import GroupMetaCache
+from utils.helpers import format_participants
+from utils.outbox import Outbox, ProgressReporter
+from utils.parse_jobs import ParseJob, ParseJobs
+from utils.member_sync import MemberSync
+from utils.tasks import DuplicateTask, Task, TaskManager, TooManyTasks
+from utils.metrics import JOBS_IN_FLIGHT, PARSED_USERS, PARSE_PAGES
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
 
 @router.message(F.text == "👥 Поиск пользователей")
-async def start_parse_users(message: Message, state: FSMContext, telethon_client=None):
+async def start_parse_users(
+    message: Message,
+    state: FSMContext,
+    db: AsyncDatabase,
+    group_meta: GroupMetaCache,
+    telethon_client=None,
+):
     """
     Начало парсинга пользователей. Показывает список групп для выбора.
     """
@@ -30,9 +38,7 @@ async def start_parse_users(message: Message, state: FSMContext, telethon_client
             await message.answer("❌ Ошибка: клиент Telethon не найден")
             return
 
-        db = Database("bot_database.db")
-        cursor = db.execute("SELECT * FROM groups")
-        groups = cursor.fetchall()
+        groups = await db.fetchall("SELECT * FROM groups")
 
         if not groups:
             await message.answer("❌ В базе данных нет сохраненных групп")
@@ -40,21 +46,14 @@ async def start_parse_users(message: Message, state: FSMContext, telethon_client
 
         builder = InlineKeyboardBuilder()
         for group in groups:
-            try:
-                # Получаем информацию о группе
-                group_entity = await telethon_client.get_entity(f"t.me/{group[2]}")
-                full_chat = await telethon_client(GetFullChannelRequest(group_entity))
-                participants_count = full_chat.full_chat.participants_count
-                builder.button(
-                    text=f"👥 {group[1]} (@{group[2]}) | {participants_count} подписчиков",
-                    callback_data=f"parse_users_{group[0]}",
-                )
-            except Exception as e:
-                builder.button(
-                    text=f"👥 {group[1]} (@{group[2]}) | Ошибка",
-                    callback_data=f"parse_users_{group[0]}",
-                )
-                print(f"Ошибка при получении информации о группе {group[2]}: {e}")
+            # Информация о группе из кэша метаданных
+            meta = group_meta.get(group[0])
+            if meta is None:
+                group_meta.request_refresh()
+            builder.button(
+                text=f"👥 {group[1]} (@{group[2]}) | подписчиков: {format_participants(meta)}",
+                callback_data=f"parse_users_{group[0]}",
+            )
 
         builder.adjust(1)
 
@@ -64,167 +63,312 @@ async def start_parse_users(message: Message, state: FSMContext, telethon_client
         )
 
     except Exception as e:
-        print(f"Ошибка при показе групп для парсинга: {e}")
+        logger.error(f"Ошибка при показе групп для парсинга: {e}", exc_info=True)
         await message.answer("❌ Произошла ошибка при получении списка групп")
 
 
-async def parse_all_users(client, entity, status_message):
-    """
-    Парсинг всех пользователей группы (без ботов и администраторов).
-    """
-    all_participants = []
-
-    # Используем только нужные фильтры
-    filters = [
-        ChannelParticipantsSearch(''),  # Все пользователи
-        ChannelParticipantsRecent(),    # Недавние пользователи
-    ]
-
-    for filter_type in filters:
-        offset = 0
-        limit = 200  # Лимит на количество пользователей за один запрос
-
-        while True:
-            try:
-                participants = await client(GetParticipantsRequest(
-                    channel=entity,
-                    filter=filter_type,
-                    offset=offset,
-                    limit=limit,
-                    hash=0
-                ))
-
-                if not participants.users:
-                    break
-
-                # Фильтруем ботов и администраторов
-                for user in participants.users:
-                    if not user.bot and not getattr(user, 'admin_rights', None):
-                        all_participants.append(user)
-
-                # Обновляем статус
-                await status_message.edit_text(
-                    f"🔄 Парсинг пользователей...\n"
-                    f"Найдено: {len(all_participants)}\n"
-                    f"Фильтр: {filter_type.__class__.__name__}"
-                )
-
-                offset += len(participants.users)
-                await asyncio.sleep(1)  # Задержка для избежания ограничений
-
-            except FloodWaitError as e:
-                print(f"Необходимо подождать {e.seconds} секунд.")
-                await asyncio.sleep(e.seconds)
-                continue
-            except ChatAdminRequiredError as e:
-                print(f"Ошибка: недостаточно прав администратора. {e}")
-                await status_message.edit_text(
-                    "❌ Парсинг остановлен!\n\n"
-                    "Причина: недостаточно прав администратора.\n"
-                    "Для парсинга участников группы или канала "
-                    "ваш аккаунт должен быть администратором."
-                )
-                return None  # Останавливаем парсинг
-            except Exception as e:
-                print(f"Ошибка при парсинге с фильтром {filter_type.__class__.__name__}: {e}")
-                continue
-
-    return all_participants
-
-
 @router.callback_query(lambda c: c.data.startswith("parse_users_"))
-async def parse_users_callback(callback: CallbackQuery, telethon_client=None):
+async def parse_users_callback(
+    callback: CallbackQuery,
+    db: AsyncDatabase,
+    entity_cache: EntityCache,
+    session_pool: SessionPool,
+    outbox: Outbox,
+    task_manager: TaskManager,
+    parse_jobs: ParseJobs,
+    member_sync: MemberSync,
+    telethon_client=None,
+):
     """
     Обработка выбора группы для парсинга пользователей.
+
+    Сам парсинг идёт фоновой задачей: апдейт обрабатывается сразу, а
+    прогресс обновляется в сообщении со списком групп. Уже спарсенная группа
+    обновляется только по новым участникам, полный перебор - раз в
+    PARSE_FULL_INTERVAL.
     """
+    # Все правки статуса идут через общую очередь с троттлингом
+    progress = outbox.progress(callback.message.chat.id, callback.message.message_id)
     try:
         if not telethon_client:
             await callback.answer("❌ Ошибка: клиент Telethon не найден")
             return
 
         group_id = int(callback.data.split("_")[2])
-        db = Database("bot_database.db")
 
         # Получаем информацию о группе
-        cursor = db.execute("SELECT * FROM groups WHERE id = ?", (group_id,))
-        group = cursor.fetchone()
+        group = await db.fetchone("SELECT * FROM groups WHERE id = ?", (group_id,))
         if not group:
             await callback.answer("❌ Группа не найдена")
             return
 
-        await callback.message.edit_text(f"🔄 Начинаю парсинг пользователей группы {group[1]}...")
-
+        # Полный перебор сохраняется в БД до постановки в очередь - переживает перезапуск.
+        # Без задания (parse_job=None) задача сначала ищет только новых участников.
+        snapshot = await member_sync.get(group_id)
+        parse_job = None
+        if snapshot is None or snapshot.needs_full_scan:
+            parse_job = await parse_jobs.create(
+                group_id, callback.from_user.id, callback.message.chat.id, callback.message.message_id
+            )
         try:
-            # Получаем сущность группы
-            group_entity = await telethon_client.get_entity(f"t.me/{group[2]}")
+            task = submit_parse(
+                task_manager, callback.from_user.id, group, parse_job, parse_jobs, member_sync,
+                entity_cache, session_pool, progress, telethon_client,
+            )
+        except (DuplicateTask, TooManyTasks) as e:
+            if parse_job:
+                await parse_jobs.discard(parse_job)
+            if isinstance(e, DuplicateTask):
+                await callback.answer(f"⏳ Парсинг этой группы уже идёт (задача #{e.task.id})", show_alert=True)
+            else:
+                await callback.answer(f"❌ {e}. Статус: /status", show_alert=True)
+            return
 
-            # Проверяем, является ли группа каналом или супергруппой
-            if not isinstance(group_entity, Channel):
-                await callback.message.edit_text("❌ Парсинг доступен только для каналов и супергрупп.")
-                return
+        await callback.answer()
+        await progress.update(
+            f"⏳ Парсинг пользователей группы {group[1]} поставлен в очередь (задача #{task.id}).\n"
+            f"Статус: /status, отмена: /cancel {task.id}"
+        )
 
-            # Парсим всех пользователей
-            participants = await parse_all_users(telethon_client, group_entity, callback.message)
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике парсинга: {e}", exc_info=True)
+        await progress.finish(
+            f"❌ Произошла ошибка при парсинге пользователей\n\n"
+            f"Причина: {str(e)}"
+        )
 
-            # Если парсинг остановлен из-за ошибки
-            if participants is None:
+
+def submit_parse(
+    task_manager: TaskManager,
+    user_id: int,
+    group,
+    parse_job: Optional[ParseJob],
+    parse_jobs: ParseJobs,
+    member_sync: MemberSync,
+    entity_cache: EntityCache,
+    session_pool: SessionPool,
+    progress: ProgressReporter,
+    telethon_client,
+) -> Task:
+    """
+    Ставит парсинг группы в очередь задач пользователя: задание parse_job -
+    полный перебор, None - только новые участники (если их слишком много,
+    в той же задаче начинается полный перебор).
+    """
+    current = {"job": parse_job}
+
+    async def job(task: Task):
+        if current["job"] is None:
+            if await refresh_group(task, group, member_sync, progress):
                 return
+            current["job"] = await parse_jobs.create(group[0], user_id, progress.chat_id, progress.message_id)
+        await parse_group(
+            task, current["job"], group, parse_jobs, member_sync, entity_cache, session_pool, progress,
+            telethon_client,
+        )
+
+    async def cancelled(task: Task):
+        parse_job = current["job"]
+        if parse_job is None:
+            await progress.finish(f"⛔ Обновление участников группы {group[1]} отменено", wait=False)
+            return
+        # Сохранённые страницы остаются в БД, но задание больше не продолжается
+        await parse_jobs.finish(parse_job, 'cancelled')
+        await progress.finish(
+            f"⛔ Парсинг группы {group[1]} отменён\n\n"
+            f"👥 Обработано пользователей: {parse_job.total}\n"
+            f"🆕 Сохранено новых: {parse_job.new}",
+            wait=False,
+        )
+
+    if parse_job is None:
+        title = f"Новые участники группы {group[1]}"
+    else:
+        title = f"Парсинг группы {group[1]}" + (" (продолжение)" if parse_job.resumed else "")
+    return task_manager.submit(
+        "parse", user_id, title, job, key=("parse", group[0]), on_cancel=cancelled
+    )
 
-            # Счетчики для статистики
-            total_users = len(participants)
-            saved_users = 0
-
-            # Сохраняем пользователей в базу данных
-            for participant in participants:
-                if participant.username:  # Сохраняем только пользователей с username
-                    try:
-                        db.execute(
-                            "INSERT OR IGNORE INTO contacts (username, group_id) VALUES (?, ?)",
-                            (participant.username, group_id),
+
+async def refresh_group(task: Task, group, member_sync: MemberSync, progress: ProgressReporter) -> bool:
+    """Только новые участники уже спарсенной группы. False - нужен полный перебор."""
+    await progress.update(f"🔄 Ищу новых участников группы {group[1]}...")
+    try:
+        result = await member_sync.refresh(group[0], group[2])
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении участников группы {group[2]}: {e}", exc_info=True)
+        await progress.finish(
+            f"❌ Не удалось обновить участников группы {group[1]}\n\n"
+            f"Причина: {str(e)}"
+        )
+        return True
+
+    if result is None:
+        await progress.update(f"🔄 Новых участников группы {group[1]} слишком много, запускаю полный парсинг...")
+        return False
+
+    task.progress = f"Вступило: {result.joined}, новых контактов: {result.new}"
+    if result.not_modified:
+        await progress.finish(f"✅ Новых участников в группе {group[1]} нет")
+    else:
+        await progress.finish(
+            f"✅ Участники группы {group[1]} обновлены\n\n"
+            f"📊 С прошлого парсинга:\n"
+            f"🆕 Вступило: {result.joined}\n"
+            f"👋 Вышло: {result.left}\n"
+            f"📥 Сохранено новых пользователей: {result.new}\n"
+            f"⚡ Запросов к Telegram: {result.requests}"
+        )
+    return True
+
+
+async def resume_parse_jobs(
+    parse_jobs: ParseJobs,
+    member_sync: MemberSync,
+    task_manager: TaskManager,
+    db: AsyncDatabase,
+    entity_cache: EntityCache,
+    session_pool: SessionPool,
+    outbox: Outbox,
+    telethon_client,
+):
+    """Продолжает задания парсинга, прерванные остановкой бота."""
+    resumed = 0
+    for parse_job in await parse_jobs.unfinished():
+        group = await db.fetchone("SELECT * FROM groups WHERE id = ?", (parse_job.group_id,))
+        if not group:
+            await parse_jobs.finish(parse_job, 'failed', "Группа удалена")
+            continue
+        progress = outbox.progress(parse_job.chat_id, parse_job.message_id)
+        try:
+            submit_parse(
+                task_manager, parse_job.user_id, group, parse_job, parse_jobs, member_sync,
+                entity_cache, session_pool, progress, telethon_client,
+            )
+        except (DuplicateTask, TooManyTasks) as e:
+            logger.warning(f"Задание парсинга #{parse_job.id} не возобновлено: {e}")
+            continue
+        resumed += 1
+    if resumed:
+        logger.info(f"Возобновлено заданий парсинга: {resumed}")
+
+
+async def parse_group(
+    task: Task,
+    parse_job: ParseJob,
+    group,
+    parse_jobs: ParseJobs,
+    member_sync: MemberSync,
+    entity_cache: EntityCache,
+    session_pool: SessionPool,
+    progress: ProgressReporter,
+    telethon_client,
+):
+    """
+    Парсинг участников группы - тело фоновой задачи. Каждая страница
+    сохраняется вместе с курсором, поэтому прерванный парсинг продолжается
+    с последней сохранённой страницы. После полного перебора сохраняется
+    снимок для следующего парсинга только по новым участникам.
+    """
+    action = "Продолжаю" if parse_job.resumed else "Начинаю"
+    await progress.update(f"🔄 {action} парсинг пользователей группы {group[1]}...")
+
+    try:
+        # Получаем сущность группы (из кэша, без ResolveUsername)
+        cached_group = await entity_cache.resolve(telethon_client, group[2])
+
+        # Проверяем, является ли группа каналом или супергруппой
+        if cached_group.type != 'channel':
+            await parse_jobs.finish(parse_job, 'failed', "не канал и не супергруппа")
+            await progress.finish("❌ Парсинг доступен только для каналов и супергрупп.")
+            return
+
+        # Страницы участников распределяются между аккаунтами пула
+        fetcher = session_pool.page_fetcher(group[2])
+
+        # Парсим пользователей постранично, сразу сохраняя каждую страницу
+        try:
+            with JOBS_IN_FLIGHT.track(kind="parse"):
+                # Продолженное задание не считает повторно уже учтённых пользователей
+                seen = await parse_jobs.seen(parse_job) if parse_job.resumed else set()
+                async for page in iter_participant_pages(fetcher, cursor=parse_job.cursor, seen=seen):
+                    rows = [
+                        (username, group[0])
+                        for _, username in page.records
+                        if username  # Сохраняем только пользователей с username
+                    ]
+                    # Страница и курсор перебора - одной транзакцией
+                    user_ids = [user_id for user_id, _ in page.records]
+                    await parse_jobs.checkpoint(parse_job, rows, user_ids, page.cursor)
+                    PARSED_USERS.inc(len(page.records))
+                    PARSE_PAGES.inc(filter=page.filter_name)
+                    task.progress = f"Найдено: {parse_job.total}, новых: {parse_job.new}"
+
+                    if task.stopping:
+                        # Бот останавливается: страница сохранена, задание продолжится после запуска
+                        await progress.finish(
+                            f"⏸ Парсинг группы {group[1]} приостановлен на время перезапуска бота "
+                            f"и продолжится автоматически\n\n"
+                            f"👥 Обработано пользователей: {parse_job.total}"
                         )
-                        saved_users += 1
-                    except Exception as e:
-                        print(f"Ошибка при сохранении пользователя {participant.username}: {e}")
-
-            db.commit()
-
-            if saved_users == 0:
-                error_message = (
-                    f"❌ Парсинг не удался!\n\n"
-                    f"Причина: не удалось сохранить ни одного пользователя\n"
-                    f"Всего найдено пользователей: {total_users}\n"
-                    f"Возможные причины:\n"
-                    f"- У пользователей нет username\n"
-                    f"- Нет доступа к участникам группы\n"
-                    f"- Группа закрыта или требует подписки"
-                )
-                await callback.message.edit_text(error_message)
-            else:
-                # Формируем сообщение о результатах
-                success_message = (
-                    f"✅ Парсинг успешно завершен!\n\n"
-                    f"📊 Статистика:\n"
-                    f"👥 Всего пользователей: {total_users}\n"
-                    f"📥 Сохранено пользователей: {saved_users}\n"
-                    f"💡 Пропущено пользователей без username: {total_users - saved_users}"
-                )
-                await callback.message.edit_text(success_message)
+                        return
+
+                    # Обновляем статус (не чаще раза в PROGRESS_INTERVAL)
+                    await progress.update(
+                        f"🔄 Парсинг пользователей...\n"
+                        f"Найдено: {parse_job.total}\n"
+                        f"Фильтр: {page.filter_name}"
+                    )
+        except ChatAdminRequiredError as e:
+            logger.warning(f"Недостаточно прав администратора для парсинга группы {group[2]}: {e}")
+            await parse_jobs.finish(parse_job, 'failed', "недостаточно прав администратора")
+            await progress.finish(
+                "❌ Парсинг остановлен!\n\n"
+                "Причина: недостаточно прав администратора.\n"
+                "Для парсинга участников группы или канала "
+                "ваш аккаунт должен быть администратором."
+            )
+            return
 
+        await parse_jobs.finish(parse_job, 'done')
+        try:
+            await member_sync.baseline(group[0], group[2])
         except Exception as e:
+            logger.warning(f"Не удалось сохранить снимок участников группы {group[2]}: {e}")
+        total_users, saved_users, new_users = parse_job.total, parse_job.saved, parse_job.new
+        if saved_users == 0:
             error_message = (
                 f"❌ Парсинг не удался!\n\n"
-                f"Причина: {str(e)}\n\n"
-                f"Возможные решения:\n"
-                f"- Проверьте доступ к группе\n"
-                f"- Убедитесь, что группа публичная\n"
-                f"- Попробуйте позже"
+                f"Причина: не удалось сохранить ни одного пользователя\n"
+                f"Всего найдено пользователей: {total_users}\n"
+                f"Возможные причины:\n"
+                f"- У пользователей нет username\n"
+                f"- Нет доступа к участникам группы\n"
+                f"- Группа закрыта или требует подписки"
+            )
+            await progress.finish(error_message)
+        else:
+            # Формируем сообщение о результатах
+            success_message = (
+                f"✅ Парсинг успешно завершен!\n\n"
+                f"📊 Статистика:\n"
+                f"👥 Всего пользователей: {total_users}\n"
+                f"📥 Сохранено пользователей: {saved_users}\n"
+                f"🆕 Из них новых: {new_users}\n"
+                f"💡 Пропущено пользователей без username: {total_users - saved_users}"
             )
-            await callback.message.edit_text(error_message)
-            print(f"Ошибка при парсинге группы {group[2]}: {e}")
+            await progress.finish(success_message)
 
     except Exception as e:
-        print(f"Ошибка в обработчике парсинга: {e}")
-        await callback.message.edit_text(
-            f"❌ Произошла ошибка при парсинге пользователей\n\n"
-            f"Причина: {str(e)}"
-        )
\ No newline at end of file
+        # Курсор сохранён: повторный запрос парсинга продолжит с того же места
+        await parse_jobs.finish(parse_job, 'failed', str(e))
+        error_message = (
+            f"❌ Парсинг не удался!\n\n"
+            f"Причина: {str(e)}\n\n"
+            f"Возможные решения:\n"
+            f"- Проверьте доступ к группе\n"
+            f"- Убедитесь, что группа публичная\n"
+            f"- Попробуйте позже (парсинг продолжится с места остановки)"
+        )
+        await progress.finish(error_message)
+        logger.error(f"Ошибка при парсинге группы {group[2]}: {e}", exc_info=True)
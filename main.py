@@ -1,41 +1,61 @@
+import time
+
+# Отсчёт времени запуска - до импорта остальных модулей
+STARTED = time.perf_counter()
+
 import asyncio
 import logging
 import os
-from aiogram import Bot, Dispatcher
-from aiogram.types import BotCommand
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
-from aiohttp import web, ClientSession
-from config import TOKEN, API_ID, API_HASH
-from database.db import Database
-from handlers import (
-    base_router,
-    group_parsing_router,
-    group_management_router,
-    user_parsing_router,
-)
-from telethon import TelegramClient
-from middleware.client_middleware import TelethonClientMiddleware
-from handlers.invite_management import router as invite_router
-from telethon.sessions import StringSession
-
-# Настройка логирования
-logging.basicConfig(
-    filename='bot.log',  # Имя файла для записи логов
-    filemode='w',         # Режим записи файла ('w' - перезаписывать, 'a' - добавлять в конец)
-    encoding='utf-8',     # Кодировка файла
-    level=logging.DEBUG,  # Уровень логирования
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+import signal
+from aiohttp import web
+from config import TOKEN, API_ID, API_HASH, DB_PATH, DB_READ_POOL_SIZE, WEBHOOK_DELETE_ON_SHUTDOWN, check_env
+from database.db import AsyncDatabase
+from database.migrations import run_migrations
+from utils.logging_setup import setup_logging
+from utils.metrics import metrics_handler
+from utils.startup import DeferredWebhook, StartupTimer, import_modules, sync_commands, sync_webhook
+
+# aiogram, Telethon и хендлеры импортируются при запуске в отдельном потоке
+# (import_modules), пока слушается порт и открывается БД; в функциях ниже
+# они импортируются локально
+HEAVY_MODULES = (
+    "telethon",
+    "aiogram",
+    "aiogram.webhook.aiohttp_server",
+    "database.fsm_storage",
+    "handlers",
+    "handlers.invite_management",
+    "middleware.client_middleware",
+    "middleware.services_middleware",
+    "middleware.metrics_middleware",
+    "utils.session_pool",
+    "utils.group_meta",
+    "utils.search_cache",
+    "utils.campaigns",
+    "utils.outbox",
+    "utils.parse_jobs",
+    "utils.member_sync",
+    "utils.tasks",
 )
+
 logger = logging.getLogger(__name__)
 
 # Глобальные переменные
 bot = None
 client = None
 db = None
+session_pool = None
+group_meta = None
+invite_campaigns = None
+member_sync = None
+outbox = None
+task_manager = None
+runner = None
 
 # Конфигурация вебхука
 WEBHOOK_PATH = "/webhook"
 WEBHOOK_URL = "https://bot.crimea-tour.site" + WEBHOOK_PATH
+WEBHOOK_CERT = "/etc/letsencrypt/live/bot.crimea-tour.site/fullchain.pem"
 WEB_SERVER_HOST = "0.0.0.0"
 WEB_SERVER_PORT = 8000
 
@@ -44,26 +64,30 @@ api_id = int(os.getenv('API_ID', API_ID))
 api_hash = os.getenv('API_HASH', API_HASH)
 string_session = os.getenv('STRING_SESSION')
 
-async def main():
-    session = ClientSession(timeout=60) # Увеличиваем таймаут до 60 секунд
+async def set_commands(bot) -> None:
+    """Установка команд бота (если список изменился с прошлого запуска)"""
+    from aiogram.types import BotCommand
 
-async def set_commands(bot: Bot) -> None:
-    """Установка команд бота"""
     commands = [
         BotCommand(command="start", description="Запустить бота"),
         BotCommand(command="menu", description="Открыть главное меню"),
-        BotCommand(command="help", description="Помощь")
+        BotCommand(command="help", description="Помощь"),
+        BotCommand(command="status", description="Фоновые задачи"),
+        BotCommand(command="cancel", description="Отменить фоновые задачи"),
     ]
-    await bot.set_my_commands(commands)
+    await sync_commands(bot, db, commands)
 
 async def setup_telethon():
     """Настройка и авторизация Telethon клиента через сессию"""
     global client
+    from telethon.sessions import StringSession
+    from utils.rate_limiter import RateLimitedClient
+
     if not string_session:
         logger.error("Требуется STRING_SESSION. Создайте новую сессию и укажите её в переменных окружения.")
         exit(1)
 
-    client = TelegramClient(StringSession(string_session), api_id, api_hash)
+    client = RateLimitedClient(StringSession(string_session), api_id, api_hash)
     await client.connect()
 
     if not await client.is_user_authorized():
@@ -75,6 +99,9 @@ async def setup_telethon():
 
 async def generate_new_session():
     """Генерация новой сессии при первом запуске"""
+    from telethon import TelegramClient
+    from telethon.sessions import StringSession
+
     temp_client = TelegramClient(StringSession(), api_id, api_hash)
     await temp_client.connect()
     
@@ -92,22 +119,86 @@ async def ensure_client_connected():
     if client is None or not client.is_connected():
         await setup_telethon()
 
-async def on_startup(bot: Bot) -> None:
-    """Действия при запуске"""
-    await bot.set_webhook(
-        url=WEBHOOK_URL,
-        drop_pending_updates=True,
-        ssl_certificate=open('/etc/letsencrypt/live/bot.crimea-tour.site/fullchain.pem', 'r') # Добавьте эту строку
+async def on_startup(bot) -> None:
+    """Регистрация вебхука и команд; ожидающие апдейты не сбрасываются"""
+    try:
+        await asyncio.gather(sync_webhook(bot, db, WEBHOOK_URL, WEBHOOK_CERT), set_commands(bot))
+    except Exception as e:
+        # Вебхук, скорее всего, остался с прошлого запуска - сервер продолжает работу
+        logger.error(f"Не удалось обновить вебхук или команды бота: {e}")
+
+def setup_dispatcher(dp, client, **services) -> None:
+    """Middleware и роутеры бота; services передаются в хендлеры через data."""
+    from handlers import (
+        base_router,
+        group_parsing_router,
+        group_management_router,
+        user_parsing_router,
+        tasks_router,
     )
-    await set_commands(bot)
+    from handlers.invite_management import router as invite_router
+    from middleware.client_middleware import TelethonClientMiddleware
+    from middleware.services_middleware import ServicesMiddleware
+    from middleware.metrics_middleware import MetricsMiddleware
+
+    services_middleware = ServicesMiddleware(**services)
+    dp.message.middleware(TelethonClientMiddleware(client))
+    dp.callback_query.middleware(TelethonClientMiddleware(client))
+    dp.message.middleware(services_middleware)
+    dp.callback_query.middleware(services_middleware)
+    # Время обработки апдейтов по хендлерам - без правок самих хендлеров
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+
+    # Подключение роутеров; /status и /cancel - раньше хендлеров состояний,
+    # иначе, например, в ожидании ключевых слов команда ушла бы в поиск
+    dp.include_router(tasks_router)
+    dp.include_router(base_router)
+    dp.include_router(group_parsing_router)
+    dp.include_router(group_management_router)
+    dp.include_router(user_parsing_router)
+    dp.include_router(invite_router)
+    logger.info("Роутеры подключены")
+
+def create_app(webhook: DeferredWebhook) -> web.Application:
+    """aiohttp-приложение: вебхук и /metrics. Диспетчер подключается к вебхуку позже."""
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, webhook.handle)
+    app.router.add_get("/metrics", metrics_handler)
+    return app
+
+def attach_dispatcher(webhook: DeferredWebhook, dp, bot) -> None:
+    """Передаёт апдейты вебхука диспетчеру; Telegram получает ответ сразу, обработка идёт в фоне."""
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+    webhook.attach(SimpleRequestHandler(dispatcher=dp, bot=bot).handle)
+
+async def start_server(app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEB_SERVER_HOST, port=WEB_SERVER_PORT)
+    await site.start()
+    logger.info(f"Вебхук сервер запущен на {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
+    return runner
+
+async def open_database():
+    global db
+    db = AsyncDatabase(DB_PATH, read_pool_size=DB_READ_POOL_SIZE)
+    await db.connect()
+    # Миграции схемы применяются один раз при запуске
+    await run_migrations(db)
+    logger.info("База данных инициализирована")
 
 async def run_bot():
     """Основная функция для запуска бота"""
-    global bot, client, db
-    
+    global bot, client, db, session_pool, group_meta, invite_campaigns, member_sync, outbox, task_manager, runner
+    timer = StartupTimer(STARTED)
+
     # Проверка наличия обязательных переменных
-    if not all([API_ID, API_HASH]):
-        logger.error("Требуются API_ID и API_HASH в конфигурации")
+    try:
+        check_env()
+    except ValueError as e:
+        logger.error(str(e))
         exit(1)
 
     # Генерация новой сессии если нет существующей
@@ -116,62 +207,141 @@ async def run_bot():
 
     logger.info("Запуск бота...")
 
-    # Инициализация базы данных
-    db = Database("bot_database.db")
-    logger.info("База данных инициализирована")
+    # Порт слушается сразу: апдейты Telegram ждут готовности диспетчера
+    webhook = DeferredWebhook()
+    with timer.phase("server"):
+        runner = await start_server(create_app(webhook))
+    logger.info(f"Порт вебхука открыт через {timer.elapsed() * 1000:.0f} мс после старта")
+
+    # Пока импортируются aiogram и Telethon, открывается БД
+    await asyncio.gather(
+        timer.measure("imports", asyncio.to_thread(import_modules, HEAVY_MODULES)),
+        timer.measure("db", open_database()),
+    )
+
+    from aiogram import Bot, Dispatcher
+    from database.fsm_storage import SQLiteStorage
+    from utils.session_pool import SessionPool
+    from utils.group_meta import GroupMetaCache
+    from utils.search_cache import SearchCache
+    from utils.campaigns import InviteCampaigns
+    from utils.outbox import Outbox
+    from utils.parse_jobs import ParseJobs
+    from utils.member_sync import MemberSync
+    from utils.tasks import TaskManager
+    from handlers.user_parsing import resume_parse_jobs
 
-    # Инициализация бота и диспетчера
+    # Инициализация бота; подключение Telethon и регистрация вебхука - параллельно
     bot = Bot(token=TOKEN)
-    dp = Dispatcher()
+    await asyncio.gather(
+        timer.measure("telethon", ensure_client_connected()),
+        timer.measure("bot_api", on_startup(bot)),
+    )
 
-    # Убедиться, что клиент Telethon подключен
-    await ensure_client_connected()
+    with timer.phase("services"):
+        # Состояния FSM хранятся в БД и переживают перезапуск
+        storage = SQLiteStorage(db)
+        await storage.purge()
+        dp = Dispatcher(storage=storage)
 
-    # Регистрируем middleware
-    dp.message.middleware(TelethonClientMiddleware(client))
-    dp.callback_query.middleware(TelethonClientMiddleware(client))
+        # Все правки сообщений идут через общую очередь с лимитами Bot API
+        outbox = Outbox(bot)
+        outbox.start()
 
-    # Подключение роутеров
-    dp.include_router(base_router)
-    dp.include_router(group_parsing_router)
-    dp.include_router(group_management_router)
-    dp.include_router(user_parsing_router)
-    dp.include_router(invite_router)
-    logger.info("Роутеры подключены")
+        # Пул аккаунтов: основной клиент плюс дополнительные сессии.
+        # У каждого аккаунта свой кэш сущностей, прогретый из БД.
+        session_pool = SessionPool(db)
+        await session_pool.add("main", client)
+        await session_pool.load()
+        entity_cache = session_pool.primary.entity_cache
 
-    # Настройка вебхука
-    dp.startup.register(on_startup)
-    
-    # Создаем aiohttp приложение
-    app = web.Application()
-    webhook_requests_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
-    webhook_requests_handler.register(app, path=WEBHOOK_PATH)
-    setup_application(app, dp, bot=bot)
+        # Метаданные групп для меню обновляются в фоне
+        group_meta = GroupMetaCache(db, client, entity_cache)
+        await group_meta.load()
+        group_meta.start()
 
-    # Запуск сервера
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(runner, host=WEB_SERVER_HOST, port=WEB_SERVER_PORT)
-    await site.start()
+        # Кэш результатов глобального поиска групп
+        search_cache = SearchCache(db)
+        await search_cache.load()
 
-    logger.info(f"Вебхук сервер запущен на {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
-    await asyncio.Event().wait()
+        # Рассылка инвайтов идёт фоновыми кампаниями и продолжается после перезапуска
+        invite_campaigns = InviteCampaigns(db, session_pool, outbox)
+        invite_campaigns.start()
+
+        # Долгие операции пользователей выполняются фоновыми задачами;
+        # задания парсинга сохраняются постранично и продолжаются после перезапуска
+        task_manager = TaskManager()
+        parse_jobs = ParseJobs(db)
+
+        # Спарсенные группы дополняются новыми участниками без полного перебора
+        member_sync = MemberSync(db, session_pool)
+        member_sync.start()
+
+        # Регистрируем middleware и роутеры
+        setup_dispatcher(
+            dp,
+            client,
+            db=db,
+            entity_cache=entity_cache,
+            group_meta=group_meta,
+            search_cache=search_cache,
+            invite_campaigns=invite_campaigns,
+            session_pool=session_pool,
+            outbox=outbox,
+            task_manager=task_manager,
+            parse_jobs=parse_jobs,
+            member_sync=member_sync,
+        )
+        await resume_parse_jobs(parse_jobs, member_sync, task_manager, db, entity_cache, session_pool, outbox, client)
+
+    # С этого момента вебхук обрабатывает апдейты, в том числе ожидавшие запуска
+    attach_dispatcher(webhook, dp, bot)
+    timer.finish()
+
+    # Остановка по SIGINT/SIGTERM идёт в том же цикле событий, чтобы фоновые
+    # задачи успели сохранить текущую страницу
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    logger.info("Получен сигнал остановки")
+    await shutdown()
 
 async def shutdown():
     """Корректное завершение работы"""
-    global bot, client, db
-    logger.info("Удаление вебхука...")
-    await bot.delete_webhook()
-    logger.info("Вебхук удален")
-    
+    global bot, client, db, session_pool, group_meta, invite_campaigns, member_sync, outbox, task_manager, runner
+    # При перезапуске по cron вебхук не удаляем: Telegram придержит апдейты
+    # до запуска нового процесса
+    if bot and WEBHOOK_DELETE_ON_SHUTDOWN:
+        logger.info("Удаление вебхука...")
+        await bot.delete_webhook()
+        logger.info("Вебхук удален")
+
+    if runner:
+        await runner.cleanup()
+    if task_manager:
+        await task_manager.stop()
+    if invite_campaigns:
+        await invite_campaigns.stop()
+    if member_sync:
+        await member_sync.stop()
+    if group_meta:
+        await group_meta.stop()
+    if outbox:
+        await outbox.stop()
     if bot:
         await bot.session.close()
+    if session_pool:
+        await session_pool.close()
     if client:
         await client.disconnect()
     if db:
-        db.close()
+        await db.close()
 
 if __name__ == "__main__":
+    # Настройка логирования: запись в файл идёт в отдельном потоке
+    setup_logging()
     try:
         asyncio.run(run_bot())
     except KeyboardInterrupt:
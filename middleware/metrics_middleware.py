@@ -0,0 +1,32 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from utils.metrics import UPDATE_DURATION, UPDATES
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Время обработки и исход каждого апдейта по роутеру (модулю) и хендлеру."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        router = getattr(callback, "__module__", "unknown")
+        name = getattr(callback, "__name__", "unknown")
+
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            UPDATE_DURATION.observe(time.perf_counter() - started, router=router, handler=name)
+            UPDATES.inc(router=router, handler=name, status=status)
@@ -0,0 +1,20 @@
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class ServicesMiddleware(BaseMiddleware):
+    """Передаёт общие сервисы процесса (БД и т.п.) в хендлеры через data."""
+
+    def __init__(self, **services: Any):
+        super().__init__()
+        self.services = services
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        data.update(self.services)
+        return await handler(event, data)
@@ -0,0 +1,51 @@
+"""
+Общие заготовки тестов.
+
+Тесты запускаются из корня репозитория: python -m pytest -q tests.
+Асинхронный код прогоняется через asyncio.run, без плагинов pytest.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+
+from database import AsyncDatabase, run_migrations  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "test.db")
+
+
+async def open_db(path: str, migrate: bool = True) -> AsyncDatabase:
+    db = AsyncDatabase(path, read_pool_size=2)
+    await db.connect()
+    if migrate:
+        await run_migrations(db)
+    return db
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class RecordingBot:
+    """Вместо aiogram.Bot для Outbox: запоминает доставленные правки; before_send(attempt) - перед каждой."""
+
+    def __init__(self, before_send=None):
+        self.before_send = before_send
+        self.attempts = 0
+        self.delivered = []
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        self.attempts += 1
+        if self.before_send:
+            await self.before_send(self.attempts)
+        self.delivered.append((message_id, text))
+        return True
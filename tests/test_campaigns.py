@@ -0,0 +1,69 @@
+import time
+
+from benchmarks import scenarios
+from conftest import run
+
+CONTACTS = 200
+
+
+async def _run_once(env, campaigns):
+    # Дневной лимит аккаунта здесь не проверяем
+    env.pool.primary.counters["invites"] = 0
+    due = await campaigns._due_campaigns()
+    assert due, "Активная кампания не запланирована"
+    for campaign in due:
+        await campaigns.run_campaign(campaign)
+
+
+def test_cursor_walks_new_contacts_once():
+    async def scenario():
+        async with scenarios.environment() as env:
+            await scenarios._campaign_setup(env, contacts=CONTACTS)
+            campaigns, group_id = env.state["campaigns"], env.state["group_id"]
+
+            cursors = []
+            while await campaigns.get_active(group_id):
+                campaign = await campaigns.get_active(group_id)
+                # Следующие кандидаты - строго после курсора, по возрастанию id
+                ids = [row[0] for row in await campaigns._candidates(group_id, 'new', campaign.cursor, 50)]
+                assert ids == sorted(ids) and all(i > campaign.cursor for i in ids)
+                cursors.append(campaign.cursor)
+                await _run_once(env, campaigns)
+
+            invites = await env.db.fetchone("SELECT COUNT(*) FROM invites WHERE group_id = ?", (group_id,))
+            statuses = dict(await env.db.fetchall(
+                "SELECT status, COUNT(*) FROM contacts WHERE group_id = ? GROUP BY status", (group_id,)
+            ))
+            last_id = await env.db.fetchone("SELECT MAX(id) FROM contacts WHERE group_id = ?", (group_id,))
+            final = await env.db.fetchone("SELECT cursor, status FROM invite_campaigns")
+            return env.state["contacts"], cursors, invites[0], statuses, last_id[0], final
+
+    contacts, cursors, invites, statuses, last_id, final = run(scenario())
+    assert cursors == sorted(cursors)
+    assert invites == contacts
+    assert 'new' not in statuses
+    assert statuses['invited'] + statuses['failed'] == contacts
+    assert final == (last_id, 'done')
+
+
+def test_failed_contacts_retry_after_new_ones():
+    async def scenario():
+        async with scenarios.environment() as env:
+            await scenarios._campaign_setup(env, contacts=CONTACTS)
+            campaigns, group_id = env.state["campaigns"], env.state["group_id"]
+            await env.db.execute(
+                "UPDATE contacts SET status = 'failed', next_attempt_at = ? WHERE id IN (1, 2)",
+                (time.time() - 1,),
+            )
+            await env.db.execute(
+                "UPDATE contacts SET status = 'failed', next_attempt_at = ? WHERE id = 3", (time.time() + 3600,)
+            )
+            campaign = await campaigns.get_active(group_id)
+            head = await campaigns._next_candidates(campaign, 5)
+            campaign = campaign._replace(cursor=CONTACTS)
+            tail = await campaigns._next_candidates(campaign, 5)
+            return head, tail
+
+    head, tail = run(scenario())
+    assert [row[0] for row in head] == [4, 5, 6, 7, 8]
+    assert [(row[0], row[2]) for row in tail] == [(1, 'failed'), (2, 'failed')]
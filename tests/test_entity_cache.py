@@ -0,0 +1,73 @@
+import asyncio
+
+from telethon.tl.types import InputPeerChannel
+
+from conftest import open_db, run
+from utils.entity_cache import EntityCache
+
+
+class ResolvingClient:
+    """Клиент, который разрешает любой username, считая запросы."""
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.calls = 0
+
+    async def get_input_entity(self, username):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if username.startswith("missing"):
+            raise ValueError(f'No user has "{username}" as username')
+        return InputPeerChannel(100 + self.calls, 1000 + self.calls)
+
+
+def test_concurrent_resolves_share_one_request(db_path):
+    async def scenario():
+        db = await open_db(db_path)
+        try:
+            cache, client = EntityCache(db, owner_id=1), ResolvingClient()
+            entries = await asyncio.gather(*(cache.resolve(client, "@Group") for _ in range(10)))
+            return client.calls, {entry.id for entry in entries}, cache._inflight
+        finally:
+            await db.close()
+
+    calls, ids, inflight = run(scenario())
+    assert calls == 1
+    assert len(ids) == 1
+    assert not inflight
+
+
+def test_concurrent_misses_share_the_error(db_path):
+    async def scenario():
+        db = await open_db(db_path)
+        try:
+            cache, client = EntityCache(db, owner_id=1), ResolvingClient()
+            results = await asyncio.gather(
+                *(cache.resolve(client, "missing") for _ in range(3)), return_exceptions=True
+            )
+            return client.calls, results
+        finally:
+            await db.close()
+
+    calls, results = run(scenario())
+    assert calls == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_invalidate_forces_new_resolve(db_path):
+    async def scenario():
+        db = await open_db(db_path)
+        try:
+            cache, client = EntityCache(db, owner_id=1), ResolvingClient(delay=0)
+            first = await cache.resolve(client, "group")
+            await cache.invalidate("group")
+            stored = await db.fetchone("SELECT COUNT(*) FROM entity_cache WHERE username = 'group'")
+            second = await cache.resolve(client, "group")
+            return first, second, stored, client.calls
+        finally:
+            await db.close()
+
+    first, second, stored, calls = run(scenario())
+    assert stored == (0,)
+    assert calls == 2
+    assert first.access_hash != second.access_hash
@@ -0,0 +1,68 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from conftest import open_db, run
+from database.fsm_storage import SQLiteStorage, dumps, loads
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+def test_concurrent_updates_keep_both_keys(db_path):
+    async def scenario():
+        db = await open_db(db_path)
+        try:
+            storage = SQLiteStorage(db)
+            await asyncio.gather(
+                storage.update_data(KEY, {"found_groups": [{"id": 1, "title": "Группа"}]}),
+                storage.update_data(KEY, {"selection": 5}),
+                storage.set_state(KEY, "BotStates:waiting"),
+            )
+            cached = await storage.get_data(KEY)
+            # Новый экземпляр читает из БД, а не из кэша
+            stored = await SQLiteStorage(db).get_data(KEY)
+            state = await SQLiteStorage(db).get_state(KEY)
+            return cached, stored, state
+        finally:
+            await db.close()
+
+    cached, stored, state = run(scenario())
+    expected = {"found_groups": [{"id": 1, "title": "Группа"}], "selection": 5}
+    assert cached == expected
+    assert stored == expected
+    assert state == "BotStates:waiting"
+
+
+def test_many_concurrent_updates(db_path):
+    async def scenario():
+        db = await open_db(db_path)
+        try:
+            storage = SQLiteStorage(db)
+            await asyncio.gather(*(storage.update_data(KEY, {f"k{i}": i}) for i in range(20)))
+            return await SQLiteStorage(db).get_data(KEY)
+        finally:
+            await db.close()
+
+    assert run(scenario()) == {f"k{i}": i for i in range(20)}
+
+
+def test_clear_removes_row(db_path):
+    async def scenario():
+        db = await open_db(db_path)
+        try:
+            storage = SQLiteStorage(db)
+            await storage.set_data(KEY, {"a": 1})
+            await storage.set_state(KEY, None)
+            await storage.set_data(KEY, {})
+            return await db.fetchone("SELECT COUNT(*) FROM fsm_state")
+        finally:
+            await db.close()
+
+    assert run(scenario()) == (0,)
+
+
+def test_lists_of_dicts_round_trip_by_columns():
+    data = {"found_groups": [{"id": i, "title": f"Группа {i}", "username": None} for i in range(3)]}
+    text = dumps(data)
+    assert text.count('"title"') == 1
+    assert loads(text) == data
@@ -0,0 +1,30 @@
+import asyncio
+
+from conftest import run
+from utils.group_meta import GroupMetaCache
+
+
+class CountingCache(GroupMetaCache):
+    """Вместо обновления из Telegram - только счётчик проходов."""
+
+    def __init__(self):
+        super().__init__(db=None, client=None, entity_cache=None)
+        self.passes = 0
+
+    async def refresh_stale(self):
+        self.passes += 1
+        if self.passes == 1:
+            # Группу добавили, пока идёт обновление
+            self.request_refresh()
+            await asyncio.sleep(0.01)
+
+
+def test_refresh_requested_during_refresh_is_not_lost():
+    async def scenario():
+        cache = CountingCache()
+        cache.start()
+        await asyncio.sleep(0.1)
+        await cache.stop()
+        return cache.passes
+
+    assert run(scenario()) == 2
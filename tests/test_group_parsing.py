@@ -0,0 +1,48 @@
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from benchmarks.fakes import FakeCallback
+from conftest import RecordingBot, open_db, run
+from handlers.group_parsing import save_selected_groups
+from utils.outbox import Outbox
+
+
+class RefreshCounter:
+    def __init__(self):
+        self.requests = 0
+
+    def request_refresh(self):
+        self.requests += 1
+
+
+def test_save_selected_groups_answers_callback(db_path):
+    async def scenario():
+        db = await open_db(db_path)
+        outbox = Outbox(RecordingBot(), chat_interval=0, global_rate=1000)
+        outbox.start()
+        try:
+            await db.execute("INSERT INTO groups (id, name, username) VALUES (1, 'Старая', 'old')")
+            state = FSMContext(MemoryStorage(), StorageKey(bot_id=1, chat_id=1, user_id=1))
+            await state.set_data({
+                "found_groups": [
+                    {"id": 1, "title": "Старая", "username": "old"},
+                    {"id": 2, "title": "Новая", "username": "new"},
+                    {"id": 3, "title": "Не выбрана", "username": "skipped"},
+                ],
+                "selection": 0b011,
+            })
+            callback = FakeCallback("save_selected")
+            group_meta = RefreshCounter()
+            await save_selected_groups(callback, state, db=db, group_meta=group_meta, outbox=outbox)
+            groups = await db.fetchall("SELECT username FROM groups ORDER BY id")
+            return callback.answers, groups, group_meta.requests, await state.get_data()
+        finally:
+            await outbox.stop()
+            await db.close()
+
+    answers, groups, refreshes, data = run(scenario())
+    assert answers == ["✅ Сохранено групп: 1"]
+    assert groups == [("old",), ("new",)]
+    assert refreshes == 1
+    assert data == {}
@@ -0,0 +1,91 @@
+import sqlite3
+
+from conftest import open_db, run
+from database.migrations import MIGRATIONS
+
+# Схема, которую создавал Database до появления миграций (user_version = 0)
+LEGACY_SCHEMA = [
+    '''CREATE TABLE contacts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_id INTEGER,
+        username TEXT NOT NULL,
+        FOREIGN KEY (group_id) REFERENCES groups(id),
+        UNIQUE(group_id, username)
+    )''',
+    '''CREATE TABLE groups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        username TEXT UNIQUE
+    )''',
+    '''CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY,
+        phone TEXT,
+        session_file TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    '''CREATE TABLE invites (
+        username TEXT,
+        group_id INTEGER,
+        status TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (username, group_id),
+        FOREIGN KEY (group_id) REFERENCES groups(id)
+    )''',
+]
+
+
+def _legacy_db(path):
+    conn = sqlite3.connect(path)
+    for statement in LEGACY_SCHEMA:
+        conn.execute(statement)
+    conn.execute("INSERT INTO groups (name, username) VALUES ('Группа', 'group')")
+    conn.executemany(
+        "INSERT INTO contacts (group_id, username) VALUES (1, ?)", [("alice",), ("bob",), ("carol",)]
+    )
+    conn.execute("INSERT INTO invites (username, group_id, status) VALUES ('alice', 1, 'success')")
+    conn.commit()
+    conn.close()
+
+
+def _user_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_legacy_database_is_migrated_with_data(db_path):
+    _legacy_db(db_path)
+
+    async def scenario():
+        db = await open_db(db_path)
+        try:
+            contacts = await db.fetchall("SELECT username, status FROM contacts ORDER BY username")
+            stats = await db.fetchone("SELECT contacts, invited FROM group_stats WHERE group_id = 1")
+            return contacts, stats
+        finally:
+            await db.close()
+
+    contacts, stats = run(scenario())
+    assert contacts == [("alice", "invited"), ("bob", "new"), ("carol", "new")]
+    assert stats == (3, 1)
+    assert _user_version(db_path) == MIGRATIONS[-1][0]
+
+
+def test_migrations_run_once(db_path):
+    async def scenario():
+        db = await open_db(db_path)
+        await db.close()
+        db = await open_db(db_path)
+        try:
+            return await db.fetchone("SELECT COUNT(*) FROM contacts")
+        finally:
+            await db.close()
+
+    assert run(scenario()) == (0,)
+    assert _user_version(db_path) == MIGRATIONS[-1][0]
+
+
+def test_versions_are_sequential():
+    assert [version for version, _, _ in MIGRATIONS] == list(range(1, len(MIGRATIONS) + 1))
@@ -0,0 +1,101 @@
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from conftest import RecordingBot, run
+from utils.outbox import Outbox
+
+
+def _retry_after(seconds: int = 0) -> TelegramRetryAfter:
+    method = EditMessageText(text="", chat_id=1, message_id=1)
+    return TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=seconds)
+
+
+def test_pending_edits_coalesce_and_duplicates_are_skipped():
+    async def scenario():
+        bot = RecordingBot()
+        outbox = Outbox(bot, chat_interval=0, global_rate=1000)
+        for i in range(5):
+            await outbox.edit(1, 1, f"прогресс {i}")
+        await outbox.edit(1, 2, "другое сообщение")
+        outbox.start()
+        await outbox.edit(1, 1, "прогресс 4", wait=False)
+        await outbox.stop()
+        await outbox.edit(1, 1, "прогресс 4")
+        return bot.delivered, outbox.coalesced, outbox.skipped
+
+    delivered, coalesced, skipped = run(scenario())
+    assert sorted(delivered) == [(1, "прогресс 4"), (2, "другое сообщение")]
+    assert coalesced == 5
+    assert skipped == 1
+
+
+def test_progress_does_not_replace_pending_final_edit():
+    async def scenario():
+        bot = RecordingBot()
+        outbox = Outbox(bot, chat_interval=0, global_rate=1000)
+        progress = outbox.progress(1, 1, interval=0)
+        await progress.finish("✅ Готово", wait=False)
+        await progress.update("🔄 Обработано 100")
+        outbox.start()
+        await outbox.stop()
+        return bot.delivered
+
+    assert run(scenario()) == [(1, "✅ Готово")]
+
+
+def test_retry_after_keeps_final_edit_and_its_waiter():
+    async def scenario():
+        outbox = None
+
+        async def before_send(attempt):
+            if attempt == 1:
+                # Пока шёл запрос, пришёл запоздалый прогресс
+                await outbox.edit(1, 1, "🔄 Обработано 100", progress=True)
+                raise _retry_after()
+
+        bot = RecordingBot(before_send)
+        outbox = Outbox(bot, chat_interval=0, global_rate=1000)
+        outbox.start()
+        try:
+            await asyncio.wait_for(outbox.edit(1, 1, "✅ Готово", wait=True), timeout=2)
+        finally:
+            await outbox.stop()
+        return bot.delivered
+
+    assert run(scenario()) == [(1, "✅ Готово")]
+
+
+def test_retry_after_waiters_follow_newer_edit():
+    async def scenario():
+        outbox = None
+
+        async def before_send(attempt):
+            if attempt == 1:
+                await outbox.edit(1, 1, "✅ Новый итог")
+                raise _retry_after()
+
+        bot = RecordingBot(before_send)
+        outbox = Outbox(bot, chat_interval=0, global_rate=1000)
+        outbox.start()
+        try:
+            await asyncio.wait_for(outbox.edit(1, 1, "✅ Старый итог", wait=True), timeout=2)
+        finally:
+            await outbox.stop()
+        return bot.delivered
+
+    assert run(scenario()) == [(1, "✅ Новый итог")]
+
+
+def test_stop_drains_pending_edits():
+    async def scenario():
+        bot = RecordingBot()
+        outbox = Outbox(bot, chat_interval=0.05, global_rate=1000)
+        outbox.start()
+        for i in range(4):
+            await outbox.edit(1, i, f"⏸ Задача {i} приостановлена")
+        await outbox.stop(timeout=2)
+        return bot.delivered
+
+    assert len(run(scenario())) == 4
@@ -0,0 +1,74 @@
+import pytest
+
+from benchmarks import scenarios
+from conftest import run
+from handlers.user_parsing import parse_group
+from utils.member_sync import MemberSync
+from utils.parse_jobs import ParseJobs
+
+
+class StoppingTask:
+    """Задача, которую останавливают после pages сохранённых страниц (None - не останавливают)."""
+
+    def __init__(self, pages=None):
+        self.pages = pages
+        self.saved = 0
+        self.stopping = False
+
+    @property
+    def progress(self):
+        return None
+
+    @progress.setter
+    def progress(self, value):
+        # parse_group обновляет progress после каждой сохранённой страницы
+        self.saved += 1
+        if self.pages is not None and self.saved >= self.pages:
+            self.stopping = True
+
+
+async def _parse(env, parse_jobs, parse_job, task):
+    await parse_group(
+        task, parse_job, await env.db.fetchone("SELECT * FROM groups WHERE id = ?", (parse_job.group_id,)),
+        parse_jobs, MemberSync(env.db, env.pool), env.pool.primary.entity_cache, env.pool,
+        env.outbox.progress(1, 1), env.client,
+    )
+
+
+async def _job(env, job_id):
+    return await env.db.fetchone("SELECT status, total, saved, new FROM parse_jobs WHERE id = ?", (job_id,))
+
+
+def _parse_group(members, stop_after=None):
+    async def scenario():
+        async with scenarios.environment() as env:
+            await scenarios._parse_setup(members)(env)
+            parse_jobs = ParseJobs(env.db)
+            parse_job = await parse_jobs.create(env.state["group_id"], 1, 1, 1)
+            await _parse(env, parse_jobs, parse_job, StoppingTask(stop_after))
+            if stop_after is not None:
+                # Как после перезапуска: задание продолжается с сохранённого курсора
+                assert (await _job(env, parse_job.id))[0] == "running"
+                [parse_job] = await parse_jobs.unfinished()
+                assert parse_job.resumed
+                await _parse(env, parse_jobs, parse_job, StoppingTask())
+            contacts = await env.db.fetchone(
+                "SELECT COUNT(*) FROM contacts WHERE group_id = ?", (env.state["group_id"],)
+            )
+            seen = await env.db.fetchone("SELECT COUNT(*) FROM parse_job_users")
+            return await _job(env, parse_job.id), contacts[0], seen[0]
+
+    return run(scenario())
+
+
+@pytest.mark.parametrize("members", [1_000, 12_000])
+def test_resumed_job_counts_like_uninterrupted(members):
+    """Перебор по фильтрам и, для 12 000 участников, по префиксам."""
+    expected = _parse_group(members)
+    resumed = _parse_group(members, stop_after=2)
+    status, total, saved, new = resumed[0]
+    assert status == "done"
+    assert (total, saved, new) == expected[0][1:]
+    assert saved == new == resumed[1] == expected[1]
+    # После завершения учтённые пользователи задания не хранятся
+    assert resumed[2] == 0
@@ -0,0 +1,375 @@
+"""
+Фоновые кампании рассылки инвайтов.
+
+Хендлер только создаёт запись в invite_campaigns и сразу отвечает. Рассылку
+ведёт воркер: берёт кампании, у которых подошло next_run_at, приглашает
+пользователей (темп задаёт ограничитель запросов), соблюдает дневной лимит кампании и
+аккаунта. Каждая пачка уходит с наименее загруженного аккаунта из пула; при
+FloodWait аккаунт выводится из ротации, а кампания продолжается на другом
+или откладывается до окончания ожидания. Состояние
+(курсор по contacts.id, счётчики) хранится в БД, поэтому после перезапуска
+рассылка продолжается с того же места. Неудачные приглашения повторяются
+не раньше чем через DECLINE_WAIT_DAYS.
+"""
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+from telethon.errors import (
+    InputUserDeactivatedError,
+    UserBotError,
+    UserChannelsTooMuchError,
+    UserIdInvalidError,
+    UserKickedError,
+    UserNotMutualContactError,
+    UserPrivacyRestrictedError,
+)
+from telethon.tl.functions.channels import InviteToChannelRequest
+
+from config import DAILY_INVITE_LIMIT, DECLINE_WAIT_DAYS, FREE_TIER_LIMITS, INVITE_BATCH_SIZE
+from utils.entity_cache import STALE_ERRORS
+from utils.metrics import INVITES, JOBS_IN_FLIGHT
+from utils.outbox import Outbox
+from utils.session_pool import NoSessionAvailable, SessionPool
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 20  # Сколько кандидатов обрабатывать за один запуск кампании
+IDLE_INTERVAL = 60  # Как часто проверять кампании, если ближайших нет
+RETRY_DELAY = DECLINE_WAIT_DAYS * 24 * 3600  # Через сколько повторять неудачное приглашение
+
+# Ошибки, которыми Telegram отклоняет весь запрос из-за одного пользователя
+USER_ERRORS = (
+    InputUserDeactivatedError,
+    UserBotError,
+    UserChannelsTooMuchError,
+    UserIdInvalidError,
+    UserKickedError,
+    UserNotMutualContactError,
+    UserPrivacyRestrictedError,
+)
+
+
+class Campaign(NamedTuple):
+    id: int
+    group_id: int
+    group_name: str
+    group_username: str
+    chat_id: int
+    message_id: Optional[int]
+    cursor: int
+    daily_limit: int
+    sent_today: int
+    day: Optional[str]
+    invited: int
+    failed: int
+
+
+CAMPAIGN_COLUMNS = (
+    "c.id, c.group_id, g.name, g.username, c.chat_id, c.message_id, c.cursor, "
+    "c.daily_limit, c.sent_today, c.day, c.invited, c.failed"
+)
+
+
+async def invite_users(client, channel, users) -> List[bool]:
+    """
+    Приглашает пользователей одним InviteToChannelRequest.
+
+    Возвращает результат для каждого пользователя: кого Telegram не смог
+    пригласить, он перечисляет в missing_invitees. Если весь запрос отклонён
+    из-за одного пользователя, пачка делится пополам и отправляется заново.
+    Ошибки аккаунта (FloodWait и т.п.) пробрасываются.
+    """
+    try:
+        result = await client(InviteToChannelRequest(channel, users))
+    except USER_ERRORS:
+        if len(users) == 1:
+            return [False]
+        middle = len(users) // 2
+        return (
+            await invite_users(client, channel, users[:middle])
+            + await invite_users(client, channel, users[middle:])
+        )
+
+    missing = {invitee.user_id for invitee in getattr(result, 'missing_invitees', None) or []}
+    return [user.user_id not in missing for user in users]
+
+
+def default_daily_limit() -> int:
+    return min(DAILY_INVITE_LIMIT, FREE_TIER_LIMITS["invites_per_day"])
+
+
+def next_day_start() -> float:
+    tomorrow = date.today() + timedelta(days=1)
+    return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+
+class InviteCampaigns:
+    def __init__(self, db, pool: SessionPool, outbox: Outbox):
+        self.db = db
+        self.pool = pool
+        self.outbox = outbox
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def get_active(self, group_id: int) -> Optional[Campaign]:
+        row = await self.db.fetchone(
+            f"SELECT {CAMPAIGN_COLUMNS} FROM invite_campaigns c JOIN groups g ON g.id = c.group_id "
+            f"WHERE c.group_id = ? AND c.status = 'active'",
+            (group_id,),
+        )
+        return Campaign(*row) if row else None
+
+    async def active_for_chat(self, chat_id: int) -> List[Campaign]:
+        rows = await self.db.fetchall(
+            f"SELECT {CAMPAIGN_COLUMNS} FROM invite_campaigns c JOIN groups g ON g.id = c.group_id "
+            f"WHERE c.chat_id = ? AND c.status = 'active' ORDER BY c.id",
+            (chat_id,),
+        )
+        return [Campaign(*row) for row in rows]
+
+    async def cancel(self, campaign: Campaign):
+        """Останавливает кампанию; уже идущая пачка доотправляется, но следующей не будет."""
+        await self.db.execute(
+            "UPDATE invite_campaigns SET status = 'cancelled' WHERE id = ? AND status = 'active'",
+            (campaign.id,),
+        )
+        await self._notify(campaign, self._status_text(campaign, "⛔ Рассылка инвайтов отменена"))
+
+    async def create(self, group_id: int, chat_id: int, message_id: Optional[int] = None,
+                     daily_limit: Optional[int] = None) -> int:
+        """Ставит кампанию в очередь. Если для группы уже есть активная - возвращает её."""
+        existing = await self.get_active(group_id)
+        if existing:
+            return existing.id
+        cursor = await self.db.execute(
+            "INSERT INTO invite_campaigns (group_id, chat_id, message_id, daily_limit, next_run_at, created_at) "
+            "VALUES (?, ?, ?, ?, 0, ?)",
+            (group_id, chat_id, message_id, daily_limit or default_daily_limit(), time.time()),
+        )
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    async def _candidates(self, group_id: int, status: str, after_id: int, limit: int):
+        # Keyset по покрывающему индексу (group_id, status, next_attempt_at, id, username):
+        # стоимость не зависит от того, сколько контактов уже пройдено
+        return await self.db.fetchall("""
+            SELECT id, username, status
+            FROM contacts
+            WHERE group_id = ? AND status = ? AND next_attempt_at <= ?
+              AND (next_attempt_at, id) > (0, ?)
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+        """, (group_id, status, time.time(), after_id, limit))
+
+    async def _next_candidates(self, campaign: Campaign, limit: int):
+        """
+        Сначала новые контакты после курсора кампании, затем те, у кого подошёл
+        срок повторной попытки. Обработанные контакты уходят из этих диапазонов
+        индекса, поэтому повторы начинаются с начала диапазона.
+        """
+        users = await self._candidates(campaign.group_id, 'new', campaign.cursor, limit)
+        if len(users) < limit:
+            users += await self._candidates(campaign.group_id, 'failed', 0, limit - len(users))
+        return users
+
+    async def _save_progress(self, campaign: Campaign):
+        await self.db.execute(
+            "UPDATE invite_campaigns SET cursor = ?, sent_today = ?, day = ?, invited = ?, failed = ? WHERE id = ?",
+            (campaign.cursor, campaign.sent_today, campaign.day, campaign.invited, campaign.failed, campaign.id),
+        )
+
+    async def _schedule(self, campaign: Campaign, next_run_at: float, status: str = 'active',
+                        error: Optional[str] = None) -> bool:
+        """False - кампанию отменили во время запуска, возобновлять её нельзя."""
+        cursor = await self.db.execute(
+            "UPDATE invite_campaigns SET status = ?, next_run_at = ?, last_error = ? "
+            "WHERE id = ? AND status = 'active'",
+            (status, next_run_at, error, campaign.id),
+        )
+        return cursor.rowcount > 0
+
+    async def _notify(self, campaign: Campaign, text: str):
+        if not campaign.message_id:
+            return
+        await self.outbox.edit(campaign.chat_id, campaign.message_id, text)
+
+    def _status_text(self, campaign: Campaign, title: str) -> str:
+        return (
+            f"{title}\n\n"
+            f"📊 Группа: {campaign.group_name}\n"
+            f"✅ Успешно приглашено: {campaign.invited}\n"
+            f"❌ Ошибок: {campaign.failed}\n"
+            f"📅 Сегодня: {campaign.sent_today}/{campaign.daily_limit}"
+        )
+
+    async def run_campaign(self, campaign: Campaign):
+        """Один запуск кампании: пачка приглашений с наименее загруженного аккаунта."""
+        today = date.today().isoformat()
+        if campaign.day != today:
+            campaign = campaign._replace(day=today, sent_today=0)
+
+        try:
+            with JOBS_IN_FLIGHT.track(kind="invite_campaign"):
+                async with self.pool.acquire("invites") as session:
+                    await self._run_batch(campaign, session)
+        except NoSessionAvailable as e:
+            retry_at = e.retry_at or next_day_start()
+            await self._schedule(campaign, retry_at, error=str(e))
+            await self._notify(campaign, self._status_text(
+                campaign, "⚠️ Все аккаунты временно ограничены Telegram, рассылка продолжится позже"))
+
+    async def _run_batch(self, campaign: Campaign, session):
+        budget = min(
+            campaign.daily_limit - campaign.sent_today,
+            DAILY_INVITE_LIMIT - session.used_today("invites"),
+            BATCH_SIZE,
+        )
+        if budget <= 0:
+            await self._save_progress(campaign)
+            await self._schedule(campaign, next_day_start())
+            await self._notify(campaign, self._status_text(campaign, "⏸ Дневной лимит исчерпан, продолжу завтра"))
+            return
+
+        users = await self._next_candidates(campaign, budget)
+        if not users:
+            await self._save_progress(campaign)
+            await self._schedule(campaign, 0, status='done')
+            await self._notify(campaign, self._status_text(campaign, "✅ Рассылка инвайтов завершена!"))
+            return
+
+        client, entity_cache = session.client, session.entity_cache
+        group_entity = await entity_cache.get_input_entity(client, campaign.group_username)
+
+        for offset in range(0, len(users), INVITE_BATCH_SIZE):
+            chunk = users[offset:offset + INVITE_BATCH_SIZE]
+            # Курсор кампании идёт только по новым контактам
+            cursor = max((cid for cid, _, status in chunk if status == 'new'), default=campaign.cursor)
+            try:
+                outcomes = await self._invite_chunk(client, entity_cache, group_entity, chunk)
+            except Exception as e:
+                if isinstance(e, STALE_ERRORS):
+                    # Сохранённый access_hash группы устарел - при повторе разрешим заново
+                    await entity_cache.invalidate(campaign.group_username)
+                if not await self.pool.handle_error(session, e):
+                    raise
+                # FloodWait или блокировка: аккаунт выведен из ротации,
+                # кампания продолжится с этой пачки на другом аккаунте
+                await self._save_progress(campaign)
+                if await self._schedule(campaign, time.time(), error=str(e)):
+                    await self._notify(campaign, self._status_text(
+                        campaign, f"⚠️ Аккаунт {session.name} ограничен Telegram, переключаюсь на другой"))
+                return
+
+            # Паузу между запросами выдерживает ограничитель запросов клиента
+            campaign = await self._record(campaign, cursor, chunk, outcomes)
+            await self.pool.count(session, "invites", len(outcomes))
+
+        if await self._schedule(campaign, time.time()):
+            await self._notify(campaign, self._status_text(campaign, "🔄 Рассылка инвайтов продолжается..."))
+
+    async def _invite_chunk(self, client, entity_cache, group_entity, chunk):
+        """Приглашает пачку кандидатов одним запросом. Возвращает [(username, status), ...]."""
+        statuses = {}
+        peers = []
+        for _, username, _ in chunk:
+            try:
+                entry = await entity_cache.resolve(client, username)
+            except ValueError:
+                statuses[username] = 'failed'  # Пользователь не найден
+                continue
+            if entry.type != 'user':
+                statuses[username] = 'failed'
+                continue
+            peers.append((username, entry.input_peer()))
+
+        if peers:
+            results = await invite_users(client, group_entity, [peer for _, peer in peers])
+            for (username, _), invited in zip(peers, results):
+                statuses[username] = 'success' if invited else 'failed'
+
+        return [(username, statuses[username]) for _, username, _ in chunk]
+
+    async def _record(self, campaign: Campaign, cursor: int, chunk, outcomes) -> Campaign:
+        """Статусы пачки (в invites и contacts) и прогресс кампании - одной транзакцией."""
+        invited = sum(status == 'success' for _, status in outcomes)
+        INVITES.inc(invited, status='success')
+        INVITES.inc(len(outcomes) - invited, status='failed')
+        campaign = campaign._replace(
+            cursor=cursor,
+            sent_today=campaign.sent_today + len(outcomes),
+            invited=campaign.invited + invited,
+            failed=campaign.failed + len(outcomes) - invited,
+        )
+        async with self.db.transaction() as conn:
+            await conn.executemany(
+                # UPSERT, а не INSERT OR REPLACE: иначе не сработают триггеры счётчиков group_stats
+                "INSERT INTO invites (username, group_id, status) VALUES (?, ?, ?) "
+                "ON CONFLICT(username, group_id) DO UPDATE SET "
+                "status = excluded.status, timestamp = CURRENT_TIMESTAMP",
+                [(username, campaign.group_id, status) for username, status in outcomes],
+            )
+            retry_at = time.time() + RETRY_DELAY
+            await conn.executemany(
+                "UPDATE contacts SET status = ?, next_attempt_at = ? WHERE id = ?",
+                [
+                    ('invited', 0, contact_id) if status == 'success' else ('failed', retry_at, contact_id)
+                    for (contact_id, _, _), (_, status) in zip(chunk, outcomes)
+                ],
+            )
+            await conn.execute(
+                "UPDATE invite_campaigns SET cursor = ?, sent_today = ?, day = ?, invited = ?, failed = ? "
+                "WHERE id = ?",
+                (campaign.cursor, campaign.sent_today, campaign.day, campaign.invited, campaign.failed,
+                 campaign.id),
+            )
+        return campaign
+
+    async def _due_campaigns(self):
+        rows = await self.db.fetchall(
+            f"SELECT {CAMPAIGN_COLUMNS} FROM invite_campaigns c JOIN groups g ON g.id = c.group_id "
+            f"WHERE c.status = 'active' AND c.next_run_at <= ? ORDER BY c.next_run_at",
+            (time.time(),),
+        )
+        return [Campaign(*row) for row in rows]
+
+    async def _sleep_until_next(self):
+        row = await self.db.fetchone(
+            "SELECT MIN(next_run_at) FROM invite_campaigns WHERE status = 'active'"
+        )
+        delay = IDLE_INTERVAL if row[0] is None else min(max(row[0] - time.time(), 0), IDLE_INTERVAL)
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _loop(self):
+        while True:
+            try:
+                for campaign in await self._due_campaigns():
+                    try:
+                        await self.run_campaign(campaign)
+                    except Exception as e:
+                        logger.error(f"Ошибка в кампании {campaign.id}: {e}", exc_info=True)
+                        await self._schedule(campaign, time.time() + IDLE_INTERVAL, error=str(e))
+                await self._sleep_until_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера кампаний: {e}", exc_info=True)
+                await asyncio.sleep(IDLE_INTERVAL)
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,194 @@
+"""
+Постоянный кэш сущностей Telegram (username -> id, access_hash, тип).
+
+Каждый get_entity/get_input_entity по username - это запрос ResolveUsername,
+основной источник FloodWait. Кэш хранится в таблице entity_cache, при запуске
+целиком загружается в память и проверяется до любого сетевого запроса.
+Неудачные разрешения тоже кэшируются (на ENTITY_NEGATIVE_TTL). Одновременные
+разрешения одного username делят один запрос. Запись, access_hash которой
+Telegram отверг (STALE_ERRORS), вызывающий код удаляет через invalidate.
+
+access_hash действителен только для аккаунта, который его получил, поэтому
+записи привязаны к owner_id - ID аккаунта Telethon.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, NamedTuple, Optional
+
+from telethon.errors import (
+    ChannelInvalidError,
+    ChannelPrivateError,
+    UsernameInvalidError,
+    UsernameNotOccupiedError,
+)
+from telethon.tl.types import (
+    Channel,
+    Chat,
+    InputPeerChannel,
+    InputPeerChat,
+    InputPeerUser,
+    User,
+)
+
+from config import ENTITY_CACHE_TTL, ENTITY_NEGATIVE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых сохранённая сущность группы больше не годится
+STALE_ERRORS = (ChannelInvalidError, ChannelPrivateError)
+
+
+class CachedEntity(NamedTuple):
+    username: str
+    id: Optional[int]
+    access_hash: Optional[int]
+    type: Optional[str]  # 'user' | 'channel' | 'chat'; None - не найдено
+    fetched_at: float
+
+    @property
+    def failed(self) -> bool:
+        return self.id is None
+
+    def input_peer(self):
+        if self.type == 'user':
+            return InputPeerUser(self.id, self.access_hash)
+        if self.type == 'channel':
+            return InputPeerChannel(self.id, self.access_hash)
+        return InputPeerChat(self.id)
+
+
+def normalize_username(username: str) -> str:
+    """'@Name', 't.me/Name', 'https://t.me/Name' -> 'name'."""
+    username = username.strip()
+    if 't.me/' in username:
+        username = username.split('t.me/')[-1]
+    return username.lstrip('@').lower()
+
+
+def _peer_type(peer) -> str:
+    if isinstance(peer, (InputPeerUser, User)):
+        return 'user'
+    if isinstance(peer, (InputPeerChannel, Channel)):
+        return 'channel'
+    if isinstance(peer, (InputPeerChat, Chat)):
+        return 'chat'
+    raise TypeError(f"Неизвестный тип сущности: {type(peer).__name__}")
+
+
+def _peer_id(peer) -> int:
+    for attr in ('user_id', 'channel_id', 'chat_id', 'id'):
+        value = getattr(peer, attr, None)
+        if value is not None:
+            return value
+    raise TypeError(f"Нет ID у сущности: {type(peer).__name__}")
+
+
+class EntityCache:
+    def __init__(self, db, owner_id: int):
+        self.db = db
+        self.owner_id = owner_id
+        self._by_username: Dict[str, CachedEntity] = {}
+        self._by_id: Dict[int, CachedEntity] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def load(self):
+        """Загружает в память все неустаревшие записи аккаунта."""
+        now = time.time()
+        rows = await self.db.fetchall(
+            "SELECT username, entity_id, access_hash, type, fetched_at FROM entity_cache "
+            "WHERE owner_id = ? AND fetched_at > ?",
+            (self.owner_id, now - max(ENTITY_CACHE_TTL, ENTITY_NEGATIVE_TTL)),
+        )
+        for row in rows:
+            entry = CachedEntity(*row)
+            if not self._expired(entry, now):
+                self._put(entry)
+        logger.info(f"Кэш сущностей загружен: {len(self._by_username)} записей")
+
+    def _expired(self, entry: CachedEntity, now: float) -> bool:
+        ttl = ENTITY_NEGATIVE_TTL if entry.failed else ENTITY_CACHE_TTL
+        return now - entry.fetched_at > ttl
+
+    def _put(self, entry: CachedEntity):
+        self._by_username[entry.username] = entry
+        if not entry.failed:
+            self._by_id[entry.id] = entry
+
+    def get(self, username: str) -> Optional[CachedEntity]:
+        entry = self._by_username.get(normalize_username(username))
+        if entry and self._expired(entry, time.time()):
+            return None
+        return entry
+
+    def get_by_id(self, entity_id: int) -> Optional[CachedEntity]:
+        entry = self._by_id.get(entity_id)
+        if entry and self._expired(entry, time.time()):
+            return None
+        return entry
+
+    async def _store(self, entry: CachedEntity):
+        self._put(entry)
+        await self.db.execute(
+            "INSERT OR REPLACE INTO entity_cache "
+            "(owner_id, username, entity_id, access_hash, type, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.owner_id, entry.username, entry.id, entry.access_hash, entry.type, entry.fetched_at),
+        )
+
+    async def remember(self, username: str, entity):
+        """Сохраняет уже полученную сущность (User/Channel/Chat или InputPeer*)."""
+        entry = CachedEntity(
+            username=normalize_username(username),
+            id=_peer_id(entity),
+            access_hash=getattr(entity, 'access_hash', None),
+            type=_peer_type(entity),
+            fetched_at=time.time(),
+        )
+        await self._store(entry)
+        return entry
+
+    async def resolve(self, client, username: str) -> CachedEntity:
+        """
+        Возвращает запись кэша, при промахе разрешает username через сеть.
+
+        Для несуществующих username бросает ValueError (как и Telethon),
+        в том числе повторно из негативного кэша без запроса к Telegram.
+        """
+        key = normalize_username(username)
+        entry = self.get(key)
+        if entry is None:
+            # Одновременные промахи по одному username ждут один запрос
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = asyncio.ensure_future(self._fetch(client, key))
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            entry = await asyncio.shield(future)
+
+        if entry.failed:
+            raise ValueError(f'No user has "{key}" as username')
+        return entry
+
+    async def _fetch(self, client, key: str) -> CachedEntity:
+        try:
+            peer = await client.get_input_entity(key)
+        except (ValueError, UsernameInvalidError, UsernameNotOccupiedError) as e:
+            logger.info(f"@{key} не найден, запоминаем: {e}")
+            entry = CachedEntity(key, None, None, None, time.time())
+            await self._store(entry)
+            return entry
+        return await self.remember(key, peer)
+
+    async def get_input_entity(self, client, username: str):
+        """InputPeer для username - замена client.get_entity/get_input_entity."""
+        return (await self.resolve(client, username)).input_peer()
+
+    async def invalidate(self, username: str):
+        """Удаляет запись (например, если access_hash перестал быть действительным)."""
+        key = normalize_username(username)
+        entry = self._by_username.pop(key, None)
+        if entry and not entry.failed:
+            self._by_id.pop(entry.id, None)
+        await self.db.execute(
+            "DELETE FROM entity_cache WHERE owner_id = ? AND username = ?",
+            (self.owner_id, key),
+        )
@@ -0,0 +1,183 @@
+"""
+Кэш метаданных сохранённых групп (название, число участников, комментарии).
+
+Меню групп раньше вызывали GetFullChannelRequest для каждой группы по очереди.
+Теперь они читают значения из таблицы group_meta, а фоновая задача обновляет
+её с ограниченной параллельностью раз в GROUP_META_REFRESH_INTERVAL.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from telethon.errors import (
+    ChannelInvalidError,
+    ChannelPrivateError,
+    FloodWaitError,
+    UsernameInvalidError,
+    UsernameNotOccupiedError,
+)
+from telethon.tl.functions.channels import GetFullChannelRequest
+
+from config import GROUP_META_REFRESH_INTERVAL, GROUP_META_CONCURRENCY
+from utils.entity_cache import STALE_ERRORS
+from utils.metrics import JOBS_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+# Группа удалена, стала приватной или username занят чем-то другим
+DEAD_ERRORS = (
+    ChannelInvalidError,
+    ChannelPrivateError,
+    UsernameInvalidError,
+    UsernameNotOccupiedError,
+    ValueError,
+)
+
+
+class GroupMeta(NamedTuple):
+    group_id: int
+    title: Optional[str]
+    participants_count: Optional[int]
+    comments_enabled: bool
+    is_dead: bool
+    refreshed_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.refreshed_at
+
+
+class GroupMetaCache:
+    def __init__(self, db, client, entity_cache):
+        self.db = db
+        self.client = client
+        self.entity_cache = entity_cache
+        self._meta: Dict[int, GroupMeta] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        rows = await self.db.fetchall(
+            "SELECT group_id, title, participants_count, comments_enabled, is_dead, refreshed_at FROM group_meta"
+        )
+        for row in rows:
+            meta = GroupMeta(row[0], row[1], row[2], bool(row[3]), bool(row[4]), row[5])
+            self._meta[meta.group_id] = meta
+        logger.info(f"Кэш метаданных групп загружен: {len(self._meta)} групп")
+
+    def get(self, group_id: int) -> Optional[GroupMeta]:
+        return self._meta.get(group_id)
+
+    def request_refresh(self):
+        """Просит фоновую задачу обновить группы без данных, не дожидаясь интервала."""
+        self._wakeup.set()
+
+    async def _fetch(self, group_id: int, username: str) -> Optional[GroupMeta]:
+        try:
+            entity = await self.entity_cache.get_input_entity(self.client, username)
+            full = await self.client(GetFullChannelRequest(entity))
+        except DEAD_ERRORS as e:
+            logger.info(f"Группа @{username} недоступна: {e}")
+            if isinstance(e, STALE_ERRORS):
+                await self.entity_cache.invalidate(username)
+            old = self.get(group_id)
+            return GroupMeta(
+                group_id,
+                old.title if old else None,
+                old.participants_count if old else None,
+                old.comments_enabled if old else False,
+                True,
+                time.time(),
+            )
+
+        chat = full.chats[0] if full.chats else None
+        return GroupMeta(
+            group_id,
+            getattr(chat, 'title', None),
+            full.full_chat.participants_count,
+            bool(getattr(full.full_chat, 'linked_chat_id', None)),
+            False,
+            time.time(),
+        )
+
+    async def refresh(self, groups: Iterable[Tuple[int, str]]):
+        """Обновляет метаданные групп [(id, username), ...] с ограниченной параллельностью."""
+        semaphore = asyncio.Semaphore(GROUP_META_CONCURRENCY)
+
+        async def refresh_one(group_id, username):
+            async with semaphore:
+                try:
+                    return await self._fetch(group_id, username)
+                except FloodWaitError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении данных группы @{username}: {e}")
+                    return None
+
+        with JOBS_IN_FLIGHT.track(kind="group_meta"):
+            results = await asyncio.gather(
+                *(refresh_one(group_id, username) for group_id, username in groups),
+                return_exceptions=True,
+            )
+
+        fresh = [meta for meta in results if isinstance(meta, GroupMeta)]
+        if fresh:
+            await self.db.executemany(
+                "INSERT OR REPLACE INTO group_meta "
+                "(group_id, title, participants_count, comments_enabled, is_dead, refreshed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(m.group_id, m.title, m.participants_count, int(m.comments_enabled), int(m.is_dead), m.refreshed_at)
+                 for m in fresh],
+            )
+            for meta in fresh:
+                self._meta[meta.group_id] = meta
+
+        flood = [e for e in results if isinstance(e, FloodWaitError)]
+        if flood:
+            raise max(flood, key=lambda e: e.seconds)
+        return len(fresh)
+
+    async def refresh_stale(self):
+        """Обновляет группы без данных или с данными старше интервала."""
+        threshold = time.time() - GROUP_META_REFRESH_INTERVAL
+        groups = await self.db.fetchall("SELECT id, username FROM groups WHERE username IS NOT NULL")
+        stale = [
+            (group_id, username) for group_id, username in groups
+            if not self.get(group_id) or self.get(group_id).refreshed_at < threshold
+        ]
+        if stale:
+            updated = await self.refresh(stale)
+            logger.info(f"Метаданные групп обновлены: {updated}/{len(stale)}")
+
+    async def _loop(self):
+        while True:
+            # Сбрасываем до обновления: запрос request_refresh во время
+            # обновления не теряется и запускает следующий проход сразу
+            self._wakeup.clear()
+            try:
+                await self.refresh_stale()
+                delay = GROUP_META_REFRESH_INTERVAL
+            except FloodWaitError as e:
+                logger.warning(f"FloodWait при обновлении групп, ждём {e.seconds} секунд")
+                delay = e.seconds
+            except Exception as e:
+                logger.error(f"Ошибка фонового обновления групп: {e}", exc_info=True)
+                delay = GROUP_META_REFRESH_INTERVAL
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -30,6 +30,28 @@ def format_time_remaining(seconds: int) -> str:
         return f"{hours} ч. {minutes} мин."
     return f"{minutes} мин."
 
+def format_age(seconds: float) -> str:
+    """
+    Форматирование давности данных ("5 мин. назад")
+    """
+    seconds = int(seconds)
+    if seconds < 60:
+        return "только что"
+    if seconds < 24 * 3600:
+        return f"{format_time_remaining(seconds)} назад"
+    return f"{seconds // (24 * 3600)} дн. назад"
+
+def format_participants(meta) -> str:
+    """
+    Число участников группы из кэша метаданных с давностью значения
+    """
+    if meta is None or meta.participants_count is None:
+        return "Нет данных"
+    text = f"{meta.participants_count} (обновлено {format_age(meta.age)})"
+    if meta.is_dead:
+        text += " ⚠️ группа недоступна"
+    return text
+
 def calculate_invite_stats(
     total_users: int,
     daily_limit: int,
@@ -0,0 +1,154 @@
+"""
+Неблокирующее логирование.
+
+Хендлеры и фоновые задачи пишут только в QueueHandler: запись попадает в
+очередь, а в файл её пишет отдельный поток QueueListener, так что цикл
+событий никогда не ждёт диск. Файл - JSON Lines с ротацией по размеру,
+старые части сжимаются gzip. Уровни задаются глобально (LOG_LEVEL) и
+по логгерам (LOG_LEVELS="telethon=WARNING,handlers.group_parsing=DEBUG").
+Частые DEBUG-записи из одного места кода ограничиваются LOG_DEBUG_RATE в
+секунду, число пропущенных дописывается в следующую запись этого места.
+"""
+import atexit
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from config import (
+    LOG_BACKUP_COUNT,
+    LOG_DEBUG_RATE,
+    LOG_FILE,
+    LOG_LEVEL,
+    LOG_LEVELS,
+    LOG_MAX_BYTES,
+)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Как QueueHandler, но трейсбек не склеивается с сообщением, а идёт в поле exc."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class DebugRateLimitFilter(logging.Filter):
+    """Token bucket на каждое место вызова (файл, строка) для записей уровня DEBUG."""
+
+    def __init__(self, rate: float = LOG_DEBUG_RATE, burst: Optional[float] = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self._buckets: Dict[Tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate <= 0:
+            return True
+
+        now = time.monotonic()
+        site = (record.pathname, record.lineno)
+        bucket = self._buckets.get(site)
+        if bucket is None:
+            # [токены, время обновления, пропущено]
+            bucket = self._buckets[site] = [self.burst, now, 0]
+
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+
+        bucket[0] -= 1
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """'telethon=WARNING,aiogram=INFO' -> {'telethon': 'WARNING', 'aiogram': 'INFO'}"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Настраивает корневой логгер. Повторный вызов ничего не делает."""
+    global _listener
+    if _listener:
+        return
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    file_handler.namer = lambda name: name + ".gz"
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    # Лишние DEBUG-записи отбрасываются ещё до очереди
+    queue_handler.addFilter(DebugRateLimitFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток записи."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,179 @@
+"""
+Повторный парсинг групп только по новым участникам.
+
+После полного перебора группы сохраняется снимок: число участников, ID и
+хэш первой страницы ChannelParticipantsRecent (group_member_state). При
+следующем парсинге эта страница запрашивается с hash: если состав сверху не
+менялся, Telegram отвечает ChannelParticipantsNotModified и обновление
+стоит одного пустого ответа. Иначе Recent читается от недавно вступивших до
+известных участников (RecentScan), новые сохраняются в contacts, а в
+member_deltas записывается, сколько участников вступило и вышло (вышедшие -
+по разнице числа участников).
+
+Если список Recent упёрся в лимит выдачи раньше известных участников или
+полный перебор был давно (PARSE_FULL_INTERVAL), нужен полный парсинг.
+Фоновая задача раз в MEMBERS_REFRESH_INTERVAL подтягивает новых участников
+всех групп со снимком.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import List, NamedTuple, Optional
+
+from telethon.tl.types import ChannelParticipantsRecent
+
+from config import MEMBERS_REFRESH_INTERVAL, PARSE_FULL_INTERVAL
+from utils.metrics import JOBS_IN_FLIGHT, MEMBER_REFRESHES, PARSE_PAGES, PARSED_USERS
+from utils.participants import RecentScan, participant_ids, participants_hash
+from utils.session_pool import NoSessionAvailable, SessionPool
+
+logger = logging.getLogger(__name__)
+
+IDLE_INTERVAL = 3600  # Как часто проверять, не пора ли обновить группы
+
+
+class MemberSnapshot(NamedTuple):
+    group_id: int
+    participants_count: int
+    top_ids: List[int]
+    top_hash: int
+    full_scan_at: float
+    refreshed_at: float
+
+    @property
+    def needs_full_scan(self) -> bool:
+        return time.time() - self.full_scan_at >= PARSE_FULL_INTERVAL
+
+
+class RefreshResult(NamedTuple):
+    not_modified: bool
+    joined: int          # Вступило участников (включая ботов и без username)
+    left: Optional[int]  # Вышло - по разнице числа участников
+    saved: int           # Новых участников с username
+    new: int             # Из них новых контактов в БД
+    count: Optional[int]
+    requests: int
+
+
+class MemberSync:
+    def __init__(self, db, pool: SessionPool):
+        self.db = db
+        self.pool = pool
+        self._task: Optional[asyncio.Task] = None
+
+    async def get(self, group_id: int) -> Optional[MemberSnapshot]:
+        row = await self.db.fetchone(
+            "SELECT group_id, participants_count, top_ids, top_hash, full_scan_at, refreshed_at "
+            "FROM group_member_state WHERE group_id = ?",
+            (group_id,),
+        )
+        if not row:
+            return None
+        return MemberSnapshot(row[0], row[1], json.loads(row[2]), row[3], row[4], row[5])
+
+    async def _save(self, group_id: int, count: int, top_ids: List[int], top_hash: int, full_scan_at: float):
+        now = time.time()
+        await self.db.execute(
+            "INSERT OR REPLACE INTO group_member_state "
+            "(group_id, participants_count, top_ids, top_hash, full_scan_at, refreshed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (group_id, count, json.dumps(top_ids), top_hash, full_scan_at, now),
+        )
+
+    async def baseline(self, group_id: int, username: str):
+        """Снимок после полного перебора группы: одна страница ChannelParticipantsRecent."""
+        fetcher = self.pool.page_fetcher(username)
+        participants = await fetcher.fetch(ChannelParticipantsRecent(), 0)
+        top_ids = participant_ids(participants)
+        await self._save(group_id, participants.count, top_ids, participants_hash(top_ids), time.time())
+
+    async def refresh(self, group_id: int, username: str) -> Optional[RefreshResult]:
+        """
+        Подтягивает новых участников группы со снимком. None - снимка нет или
+        новых участников больше, чем отдаёт Recent: нужен полный парсинг.
+        """
+        snapshot = await self.get(group_id)
+        if snapshot is None:
+            return None
+
+        scan = RecentScan(self.pool.page_fetcher(username), snapshot.top_ids, snapshot.top_hash)
+        saved = new = 0
+        with JOBS_IN_FLIGHT.track(kind="member_sync"):
+            async for page in scan.pages():
+                rows = [(name, group_id) for _, name in page.records if name]
+                if rows:
+                    new += await self.db.executemany(
+                        "INSERT OR IGNORE INTO contacts (username, group_id) VALUES (?, ?)", rows
+                    )
+                saved += len(rows)
+                PARSED_USERS.inc(len(page.records))
+                PARSE_PAGES.inc(filter=page.filter_name)
+
+        if not scan.complete or scan.not_modified:
+            # Снимок остаётся прежним; фоновая задача вернётся к группе через интервал
+            await self.db.execute(
+                "UPDATE group_member_state SET refreshed_at = ? WHERE group_id = ?", (time.time(), group_id)
+            )
+        if not scan.complete:
+            MEMBER_REFRESHES.inc(result="full_needed")
+            logger.info(f"Группа {group_id}: новых участников больше, чем отдаёт Recent, нужен полный парсинг")
+            return None
+
+        if scan.not_modified:
+            MEMBER_REFRESHES.inc(result="not_modified")
+            return RefreshResult(True, 0, None, 0, 0, snapshot.participants_count, scan.requests)
+
+        MEMBER_REFRESHES.inc(result="incremental")
+        left = max(0, snapshot.participants_count + scan.joined - scan.count)
+        await self._save(group_id, scan.count, scan.top_ids, scan.top_hash, snapshot.full_scan_at)
+        await self.db.execute(
+            "INSERT INTO member_deltas (group_id, joined, left_count, participants_count, saved, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (group_id, scan.joined, left, scan.count, saved, time.time()),
+        )
+        logger.info(
+            f"Группа {group_id}: вступило {scan.joined}, вышло {left}, новых контактов {new}, "
+            f"запросов {scan.requests}"
+        )
+        return RefreshResult(False, scan.joined, left, saved, new, scan.count, scan.requests)
+
+    async def refresh_stale(self):
+        """Обновляет группы со снимком старше MEMBERS_REFRESH_INTERVAL, по одной."""
+        rows = await self.db.fetchall(
+            "SELECT g.id, g.username FROM groups g JOIN group_member_state s ON s.group_id = g.id "
+            "WHERE g.username IS NOT NULL AND s.refreshed_at < ? ORDER BY s.refreshed_at",
+            (time.time() - MEMBERS_REFRESH_INTERVAL,),
+        )
+        for group_id, username in rows:
+            try:
+                await self.refresh(group_id, username)
+            except NoSessionAvailable:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении участников группы @{username}: {e}")
+        if rows:
+            logger.info(f"Участники групп обновлены: {len(rows)}")
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh_stale()
+            except NoSessionAvailable as e:
+                logger.warning(f"Обновление участников групп отложено: {e}")
+            except Exception as e:
+                logger.error(f"Ошибка фонового обновления участников групп: {e}", exc_info=True)
+            await asyncio.sleep(min(IDLE_INTERVAL, MEMBERS_REFRESH_INTERVAL))
+
+    def start(self):
+        if MEMBERS_REFRESH_INTERVAL > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,194 @@
+"""
+Метрики в текстовом формате Prometheus.
+
+Минимальный реестр без внешних зависимостей: счётчики, gauge и гистограммы
+с метками. Все метрики обновляются из цикла событий, поэтому блокировки не
+нужны. Отдаются хендлером /metrics на aiohttp-приложении вебхука.
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._values: Dict[Tuple, object] = {}
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels):
+        """Увеличивает gauge на время выполнения блока (задачи «в работе»)."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [счётчики по корзинам, сумма, количество]
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+
+# --- Метрики бота ---
+
+UPDATE_DURATION = Histogram(
+    "bot_update_duration_seconds", "Время обработки апдейта хендлером", ["router", "handler"]
+)
+UPDATES = Counter(
+    "bot_updates_total", "Обработанные апдейты", ["router", "handler", "status"]
+)
+RPC_DURATION = Histogram(
+    "telethon_request_duration_seconds", "Время запроса MTProto, включая ожидание лимита", ["method"]
+)
+RPC_REQUESTS = Counter(
+    "telethon_requests_total", "Запросы MTProto", ["account", "method", "status"]
+)
+FLOOD_WAITS = Counter(
+    "telethon_flood_waits_total", "Полученные FloodWait", ["account", "method"]
+)
+FLOOD_WAIT_SECONDS = Counter(
+    "telethon_flood_wait_seconds_total", "Суммарная длительность FloodWait", ["account", "method"]
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Время запросов к SQLite", ["op"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+JOBS_IN_FLIGHT = Gauge(
+    "background_jobs_in_flight", "Выполняющиеся долгие задачи", ["kind"]
+)
+JOBS_QUEUED = Gauge(
+    "background_jobs_queued", "Задачи пользователей, ожидающие своей очереди", ["kind"]
+)
+INVITES = Counter(
+    "invites_total", "Отправленные приглашения", ["status"]
+)
+PARSED_USERS = Counter(
+    "parsed_users_total", "Участники, полученные парсингом", []
+)
+PARSE_PAGES = Counter(
+    "parse_pages_total", "Страницы участников, полученные парсингом", ["filter"]
+)
+STARTUP_SECONDS = Gauge(
+    "bot_startup_seconds", "Длительность этапов последнего запуска бота", ["phase"]
+)
+MEMBER_REFRESHES = Counter(
+    "member_refreshes_total", "Повторный парсинг групп только по новым участникам", ["result"]
+)
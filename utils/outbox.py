@@ -0,0 +1,260 @@
+"""
+Единая очередь исходящих запросов Bot API.
+
+Все правки сообщений (прогресс парсинга, поиска, рассылки инвайтов,
+клавиатуры выбора) проходят через Outbox:
+
+- правки одного и того же сообщения, ещё стоящие в очереди, схлопываются
+  в последнюю; промежуточный прогресс (ProgressReporter) не вытесняет
+  ожидающую обычную или итоговую правку;
+- правка, совпадающая с уже отправленным текстом и клавиатурой, не
+  отправляется вовсе (Telegram всё равно ответил бы "message is not modified");
+- соблюдается лимит на чат (OUTBOX_CHAT_INTERVAL) и общий лимит бота
+  (OUTBOX_GLOBAL_RATE), TelegramRetryAfter откладывает чат, а не теряет правку;
+- при остановке очередь досылается в пределах OUTBOX_DRAIN_TIMEOUT, чтобы
+  итоговые статусы задач, остановленных вместе с ботом, дошли до пользователя.
+
+ProgressReporter - общий для долгих задач троттлинг обновлений статуса.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from config import OUTBOX_CHAT_INTERVAL, OUTBOX_DRAIN_TIMEOUT, OUTBOX_GLOBAL_RATE, PROGRESS_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних отправленных состояний сообщений помнить для отсева дублей
+SENT_CACHE_SIZE = 1000
+# Как часто при остановке проверять, опустела ли очередь
+DRAIN_POLL_INTERVAL = 0.05
+
+Key = Tuple[int, int]
+
+
+def _fingerprint(text: str, reply_markup) -> Tuple[str, Optional[str]]:
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else None
+    return text, markup
+
+
+class _Edit:
+    def __init__(self, text: str, reply_markup, progress: bool = False):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.progress = progress
+        self.fingerprint = _fingerprint(text, reply_markup)
+        self.waiters = []
+
+    def supersedes(self, other: "_Edit") -> bool:
+        """Заменяет ли эта правка другую, ещё не отправленную: прогресс не вытесняет итог."""
+        return not self.progress or other.progress
+
+
+class Outbox:
+    def __init__(self, bot: Bot, chat_interval: float = OUTBOX_CHAT_INTERVAL,
+                 global_rate: float = OUTBOX_GLOBAL_RATE):
+        self.bot = bot
+        self.chat_interval = chat_interval
+        self.global_interval = 1.0 / global_rate
+        self.pending: "OrderedDict[Key, _Edit]" = OrderedDict()
+        self.sent: "OrderedDict[Key, tuple]" = OrderedDict()
+        self.chat_ready_at: Dict[int, float] = {}
+        self.coalesced = 0
+        self.skipped = 0
+        self._next_send = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._delivering = False
+
+    async def edit(self, chat_id: int, message_id: int, text: str, reply_markup=None, wait: bool = False,
+                   progress: bool = False):
+        """
+        Ставит правку сообщения в очередь. По умолчанию не ждёт отправки;
+        с wait=True возвращается, когда правка (или заменившая её) доставлена.
+        progress=True - промежуточный статус, который не заменяет ожидающую
+        отправки обычную правку.
+        """
+        key = (chat_id, message_id)
+        item = _Edit(text, reply_markup, progress)
+
+        previous = self.pending.get(key)
+        if previous and not item.supersedes(previous):
+            # В очереди итог - устаревший прогресс поверх него не нужен
+            self.coalesced += 1
+            item = previous
+        elif previous:
+            # Более старая правка так и не ушла - её заменяет новая
+            del self.pending[key]
+            item.waiters = previous.waiters
+            self.coalesced += 1
+            self.pending[key] = item
+        elif self.sent.get(key) == item.fingerprint:
+            self.skipped += 1
+            return
+        else:
+            self.pending[key] = item
+
+        self._wakeup.set()
+        if wait:
+            future = asyncio.get_running_loop().create_future()
+            item.waiters.append(future)
+            await future
+
+    def progress(self, chat_id: int, message_id: int, interval: float = PROGRESS_INTERVAL) -> "ProgressReporter":
+        return ProgressReporter(self, chat_id, message_id, interval)
+
+    def _next_ready(self, now: float):
+        """Первая правка в очереди, чат которой уже можно трогать, и ближайшее время готовности."""
+        earliest = None
+        for key in self.pending:
+            ready_at = self.chat_ready_at.get(key[0], 0.0)
+            if ready_at <= now:
+                return key, now
+            earliest = ready_at if earliest is None else min(earliest, ready_at)
+        return None, earliest
+
+    async def _deliver(self, key: Key, item: _Edit):
+        chat_id, message_id = key
+        try:
+            await self.bot.edit_message_text(
+                item.text, chat_id=chat_id, message_id=message_id, reply_markup=item.reply_markup
+            )
+        except TelegramRetryAfter as e:
+            logger.warning(f"Bot API: RetryAfter {e.retry_after} с для чата {chat_id}")
+            self.chat_ready_at[chat_id] = time.monotonic() + e.retry_after
+            # Если за это время пришла более новая правка, она уже в очереди:
+            # отправится одна из двух, ожидающие обеих ждут её
+            newer = self.pending.pop(key, None)
+            if newer and newer.supersedes(item):
+                newer.waiters.extend(item.waiters)
+                item = newer
+            elif newer:
+                item.waiters.extend(newer.waiters)
+            self.pending[key] = item
+            self.pending.move_to_end(key, last=False)
+            return
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.debug(f"Не удалось обновить сообщение {message_id} в чате {chat_id}: {e}")
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении сообщения {message_id} в чате {chat_id}: {e}")
+
+        self.sent[key] = item.fingerprint
+        self.sent.move_to_end(key)
+        while len(self.sent) > SENT_CACHE_SIZE:
+            self.sent.popitem(last=False)
+        for future in item.waiters:
+            if not future.done():
+                future.set_result(None)
+
+    async def _loop(self):
+        while True:
+            now = time.monotonic()
+            key, ready_at = self._next_ready(now)
+            if key is None:
+                self._wakeup.clear()
+                timeout = None if ready_at is None else ready_at - now
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Общий лимит бота
+            if self._next_send > now:
+                await asyncio.sleep(self._next_send - now)
+                continue
+
+            item = self.pending.pop(key)
+            now = time.monotonic()
+            self._next_send = now + self.global_interval
+            self.chat_ready_at[key[0]] = now + self.chat_interval
+            self._delivering = True
+            try:
+                await self._deliver(key, item)
+            finally:
+                self._delivering = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def drain(self, timeout: float = OUTBOX_DRAIN_TIMEOUT) -> bool:
+        """Ждёт отправки всех правок из очереди. False - за timeout не успели."""
+        deadline = time.monotonic() + timeout
+        while self.pending or self._delivering:
+            if not self._task or self._task.done() or time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+        return True
+
+    async def stop(self, timeout: float = OUTBOX_DRAIN_TIMEOUT):
+        """Досылает очередь (не дольше timeout секунд) и останавливает отправку."""
+        if not await self.drain(timeout):
+            logger.warning(f"Очередь Bot API не опустела за {timeout} с, отброшено правок: {len(self.pending)}")
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for item in self.pending.values():
+            for future in item.waiters:
+                future.cancel()
+        self.pending.clear()
+
+
+class ProgressReporter:
+    """
+    Троттлинг обновлений статуса одной долгой задачи: не чаще раза в interval
+    секунд, последнее состояние не теряется - оно досылается по таймеру.
+    """
+
+    def __init__(self, outbox: Outbox, chat_id: int, message_id: int, interval: float = PROGRESS_INTERVAL):
+        self.outbox = outbox
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval
+        self._last = 0.0
+        self._latest = None
+        self._timer: Optional[asyncio.Task] = None
+
+    @property
+    def due(self) -> bool:
+        """Пора ли отправлять обновление (чтобы не собирать дорогой текст впустую)."""
+        return time.monotonic() - self._last >= self.interval
+
+    async def update(self, text: str, reply_markup=None):
+        if self.due:
+            await self._push(text, reply_markup)
+            return
+        self._latest = (text, reply_markup)
+        if not self._timer:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def finish(self, text: str, reply_markup=None, wait: bool = True):
+        """Итоговое сообщение: отправляется сразу, отложенное обновление отменяется."""
+        self._cancel_timer()
+        self._latest = None
+        await self.outbox.edit(self.chat_id, self.message_id, text, reply_markup, wait=wait)
+
+    async def _push(self, text: str, reply_markup):
+        self._cancel_timer()
+        self._latest = None
+        self._last = time.monotonic()
+        await self.outbox.edit(self.chat_id, self.message_id, text, reply_markup, progress=True)
+
+    async def _flush_later(self):
+        await asyncio.sleep(max(0.0, self._last + self.interval - time.monotonic()))
+        self._timer = None
+        if self._latest:
+            await self._push(*self._latest)
+
+    def _cancel_timer(self):
+        if self._timer and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
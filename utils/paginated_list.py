@@ -0,0 +1,164 @@
+"""
+Постраничные inline-списки с выбором элементов.
+
+Выбор хранится битовой маской (int): бит i установлен - элемент i выбран.
+Нажатие на кнопку перерисовывает только текущую страницу, а готовая
+разметка кэшируется по (список, страница, биты выбора этой страницы),
+поэтому повторные переключения и листание обходятся без сборки клавиатуры.
+
+Callback data списка с префиксом prefix:
+    {prefix}_select_{i}    - переключить элемент i
+    {prefix}_select_all    - выбрать все
+    {prefix}_deselect_all  - снять выбор
+    {prefix}_page_{n}      - перейти на страницу n
+"""
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, Sequence, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import LIST_PAGE_SIZE
+
+# Сколько отрисованных страниц держать в памяти (на все списки)
+KEYBOARD_CACHE_SIZE = 512
+# Длинные названия обрезаются, чтобы кнопка оставалась читаемой
+MAX_BUTTON_TEXT = 60
+
+
+def new_list_id() -> str:
+    """Идентификатор конкретного списка (для ключа кэша разметки)."""
+    return uuid.uuid4().hex[:12]
+
+
+def toggle(selection: int, index: int) -> int:
+    return selection ^ (1 << index)
+
+
+def select_all(total: int) -> int:
+    return (1 << total) - 1
+
+
+def is_selected(selection: int, index: int) -> bool:
+    return bool(selection >> index & 1)
+
+
+def selected_count(selection: int) -> int:
+    return bin(selection).count("1")
+
+
+def selected_indices(selection: int, total: int) -> List[int]:
+    return [i for i in range(total) if selection >> i & 1]
+
+
+def page_count(total: int, page_size: int = LIST_PAGE_SIZE) -> int:
+    return max(1, (total + page_size - 1) // page_size)
+
+
+def nav_row(prefix: str, page: int, pages: int) -> List[InlineKeyboardButton]:
+    """Кнопки листания; пустой список, если страница одна."""
+    if pages <= 1:
+        return []
+    return [
+        InlineKeyboardButton(text="◀️", callback_data=f"{prefix}_page_{(page - 1) % pages}"),
+        InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data=f"{prefix}_page_{page}"),
+        InlineKeyboardButton(text="▶️", callback_data=f"{prefix}_page_{(page + 1) % pages}"),
+    ]
+
+
+def _shorten(text: str) -> str:
+    return text if len(text) <= MAX_BUTTON_TEXT else text[:MAX_BUTTON_TEXT - 1] + "…"
+
+
+class PaginatedList:
+    """
+    Описание списка: как подписать элемент и какие кнопки действий добавить
+    под страницей. В текстах действий можно использовать {count} - число
+    выбранных элементов.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        item_text: Callable[[dict], str],
+        actions: Sequence[Tuple[str, str]] = (),
+        page_size: int = LIST_PAGE_SIZE,
+    ):
+        self.prefix = prefix
+        self.item_text = item_text
+        self.actions = actions
+        self.page_size = page_size
+        self._cache: "OrderedDict[tuple, InlineKeyboardMarkup]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def owns(self, data: str) -> bool:
+        """Относится ли callback к выбору или листанию этого списка."""
+        return (
+            data.startswith(f"{self.prefix}_select_")
+            or data.startswith(f"{self.prefix}_page_")
+            or data == f"{self.prefix}_deselect_all"
+        )
+
+    def handle(self, data: str, selection: int, page: int, total: int) -> Tuple[int, int]:
+        """Применяет нажатие к (выбор, страница) и возвращает новое состояние."""
+        if data == f"{self.prefix}_select_all":
+            return select_all(total), page
+        if data == f"{self.prefix}_deselect_all":
+            return 0, page
+        if data.startswith(f"{self.prefix}_page_"):
+            target = int(data.rsplit("_", 1)[1])
+            return selection, min(max(target, 0), page_count(total, self.page_size) - 1)
+        index = int(data.rsplit("_", 1)[1])
+        if index >= total:
+            return selection, page
+        return toggle(selection, index), page
+
+    def markup(self, list_id: str, items: Sequence[dict], page: int, selection: int) -> InlineKeyboardMarkup:
+        total = len(items)
+        pages = page_count(total, self.page_size)
+        page = min(page, pages - 1)
+        start = page * self.page_size
+        end = min(start + self.page_size, total)
+
+        # От выбора зависят только биты этой страницы и счётчик в кнопках действий
+        page_bits = selection >> start & ((1 << (end - start)) - 1)
+        key = (list_id, page, total, page_bits, selected_count(selection))
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        rows = []
+        for i in range(start, end):
+            checkbox = "✅" if is_selected(selection, i) else "⬜️"
+            rows.append([InlineKeyboardButton(
+                text=_shorten(f"{checkbox} {self.item_text(items[i])}"),
+                callback_data=f"{self.prefix}_select_{i}",
+            )])
+
+        navigation = nav_row(self.prefix, page, pages)
+        if navigation:
+            rows.append(navigation)
+        rows.append([
+            InlineKeyboardButton(text="✅ Выбрать все", callback_data=f"{self.prefix}_select_all"),
+            InlineKeyboardButton(text="❌ Снять выбор", callback_data=f"{self.prefix}_deselect_all"),
+        ])
+        count = selected_count(selection)
+        for text, callback_data in self.actions:
+            rows.append([InlineKeyboardButton(text=text.format(count=count), callback_data=callback_data)])
+
+        result = InlineKeyboardMarkup(inline_keyboard=rows)
+        self._cache[key] = result
+        while len(self._cache) > KEYBOARD_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
+
+    def page_text(self, title: str, page: int, total: int, selection: int) -> str:
+        pages = page_count(total, self.page_size)
+        text = f"{title}\nВыбрано: {selected_count(selection)} из {total}"
+        if pages > 1:
+            text += f" · страница {min(page, pages - 1) + 1}/{pages}"
+        return text
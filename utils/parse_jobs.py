@@ -0,0 +1,140 @@
+"""
+Задания парсинга участников с контрольными точками.
+
+Состояние задания - группа, курсор перебора (фильтр и смещение или фронт
+префиксов, см. ParticipantPage.cursor) и счётчики - хранится в parse_jobs и
+обновляется одной транзакцией с записью очередной страницы в contacts.
+Там же в parse_job_users запоминаются ID учтённых пользователей: продолженное
+задание не считает повторно тех, кого уже видело до перерыва. Задание, прерванное перезапуском или падением бота, при следующем запуске
+продолжается с последней сохранённой страницы. Задание, завершившееся
+ошибкой, продолжается с того же места при повторном запросе парсинга группы.
+
+Статусы: running (в очереди или выполняется), done, failed, cancelled.
+"""
+import json
+import logging
+import time
+from typing import List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+JOB_COLUMNS = "id, group_id, user_id, chat_id, message_id, cursor, total, saved, new"
+
+
+class ParseJob:
+    def __init__(self, job_id: int, group_id: int, user_id: int, chat_id: int, message_id: int,
+                 cursor: Optional[str] = None, total: int = 0, saved: int = 0, new: int = 0):
+        self.id = job_id
+        self.group_id = group_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.cursor: Optional[dict] = json.loads(cursor) if cursor else None
+        self.total = total
+        self.saved = saved
+        self.new = new
+
+    @property
+    def resumed(self) -> bool:
+        """Задание продолжает ранее начатый перебор."""
+        return self.cursor is not None
+
+
+class ParseJobs:
+    def __init__(self, db):
+        self.db = db
+
+    async def create(self, group_id: int, user_id: int, chat_id: int, message_id: int) -> ParseJob:
+        """
+        Новое задание. Если прошлый парсинг группы завершился ошибкой, он
+        продолжается с сохранённого курсора.
+        """
+        now = time.time()
+        row = await self.db.fetchone(
+            f"SELECT {JOB_COLUMNS} FROM parse_jobs WHERE group_id = ? AND status = 'failed' "
+            f"AND cursor IS NOT NULL AND id = (SELECT MAX(id) FROM parse_jobs WHERE group_id = ?)",
+            (group_id, group_id),
+        )
+        if row:
+            job = ParseJob(*row)
+            job.user_id, job.chat_id, job.message_id = user_id, chat_id, message_id
+            await self.db.execute(
+                "UPDATE parse_jobs SET status = 'running', user_id = ?, chat_id = ?, message_id = ?, "
+                "last_error = NULL, updated_at = ? WHERE id = ?",
+                (user_id, chat_id, message_id, now, job.id),
+            )
+            logger.info(f"Задание парсинга #{job.id} группы {group_id} продолжается после ошибки")
+            return job
+
+        # Прошлые задания группы уже не продолжатся - их учтённые пользователи не нужны
+        await self.db.execute(
+            "DELETE FROM parse_job_users WHERE job_id IN "
+            "(SELECT id FROM parse_jobs WHERE group_id = ? AND status != 'running')",
+            (group_id,),
+        )
+        cursor = await self.db.execute(
+            "INSERT INTO parse_jobs (group_id, user_id, chat_id, message_id, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (group_id, user_id, chat_id, message_id, now, now),
+        )
+        return ParseJob(cursor.lastrowid, group_id, user_id, chat_id, message_id)
+
+    async def seen(self, job: ParseJob) -> Set[int]:
+        """ID пользователей, уже учтённых заданием до перерыва."""
+        rows = await self.db.fetchall("SELECT user_id FROM parse_job_users WHERE job_id = ?", (job.id,))
+        return {row[0] for row in rows}
+
+    async def checkpoint(self, job: ParseJob, rows, user_ids: List[int], cursor: Optional[dict]) -> int:
+        """
+        Сохраняет страницу (rows - пары (username, group_id), user_ids - все
+        учтённые на ней пользователи) и курсор одной транзакцией. Возвращает
+        число новых контактов.
+        """
+        records = len(user_ids)
+        async with self.db.transaction(op="executemany") as conn:
+            new = 0
+            if rows:
+                result = await conn.executemany(
+                    "INSERT OR IGNORE INTO contacts (username, group_id) VALUES (?, ?)", rows
+                )
+                new = result.rowcount
+            if user_ids:
+                await conn.executemany(
+                    "INSERT OR IGNORE INTO parse_job_users (job_id, user_id) VALUES (?, ?)",
+                    [(job.id, user_id) for user_id in user_ids],
+                )
+            await conn.execute(
+                "UPDATE parse_jobs SET cursor = ?, total = total + ?, saved = saved + ?, new = new + ?, "
+                "updated_at = ? WHERE id = ?",
+                (json.dumps(cursor, ensure_ascii=False) if cursor else None,
+                 records, len(rows), new, time.time(), job.id),
+            )
+        job.cursor = cursor
+        job.total += records
+        job.saved += len(rows)
+        job.new += new
+        return new
+
+    async def finish(self, job: ParseJob, status: str, error: Optional[str] = None):
+        async with self.db.transaction() as conn:
+            await conn.execute(
+                "UPDATE parse_jobs SET status = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job.id),
+            )
+            if status != 'failed':
+                # Продолжить можно только задание с ошибкой
+                await conn.execute("DELETE FROM parse_job_users WHERE job_id = ?", (job.id,))
+
+    async def discard(self, job: ParseJob):
+        """Задание не удалось поставить в очередь: новое удаляется, продолженное снова ждёт повтора."""
+        if job.resumed:
+            await self.finish(job, 'failed')
+        else:
+            await self.db.execute("DELETE FROM parse_jobs WHERE id = ?", (job.id,))
+
+    async def unfinished(self) -> List[ParseJob]:
+        """Задания, прерванные остановкой бота."""
+        rows = await self.db.fetchall(
+            f"SELECT {JOB_COLUMNS} FROM parse_jobs WHERE status = 'running' ORDER BY id"
+        )
+        return [ParseJob(*row) for row in rows]
@@ -0,0 +1,360 @@
+"""
+Потоковый парсинг участников групп.
+
+Участники отдаются постранично асинхронным генератором в виде компактных
+записей (user_id, username). Дубли между фильтрами отсекаются по ID, поэтому
+в памяти не копятся объекты User и каждую страницу можно сразу писать в БД.
+
+Для больших групп поиск с пустой строкой упирается в серверный лимит выдачи
+(PARSE_QUERY_CAP). В этом случае участники перебираются поиском по префиксам
+из QUERY_ALPHABET: префикс, выдача которого упёрлась в лимит, рекурсивно
+уточняется следующим символом.
+
+Каждая страница несёт курсор - состояние перебора после неё: номер фильтра
+и смещение или фронт префиксов (префикс -> смещение). С сохранённого курсора
+перебор можно продолжить после перезапуска (см. utils/parse_jobs.py).
+
+Для повторного парсинга есть RecentScan: ChannelParticipantsRecent отдаёт
+участников от недавно вступивших к давним, поэтому новых можно получить, не
+перебирая всю группу (см. utils/member_sync.py).
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.channels import GetParticipantsRequest
+from telethon.tl.types import ChannelParticipantsSearch, ChannelParticipantsRecent
+from telethon.tl.types.channels import ChannelParticipantsNotModified
+
+from config import PARSE_QUERY_CAP, PARSE_CONCURRENCY, PARSE_MAX_PREFIX_DEPTH
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 200  # Максимум пользователей за один запрос
+# Столько известных участников подряд в ChannelParticipantsRecent - дальше только
+# давние участники (одиночный известный может оказаться вернувшимся)
+KNOWN_RUN = 3
+
+QUERY_ALPHABET = (
+    "abcdefghijklmnopqrstuvwxyz"
+    "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+    "0123456789"
+)
+
+# Компактная запись пользователя: (user_id, username)
+ParticipantRecord = Tuple[int, Optional[str]]
+
+
+class ParticipantPage(NamedTuple):
+    filter_name: str
+    records: List[ParticipantRecord]
+    # Откуда продолжать перебор, когда эта страница сохранена
+    cursor: Optional[dict] = None
+
+
+class PrefixStep(NamedTuple):
+    """Результат запроса по префиксу: следующее смещение (None - префикс пройден) и дочерние префиксы."""
+    prefix: str
+    offset: Optional[int]
+    children: List[str]
+    page: Optional[ParticipantPage]
+
+
+def default_filters():
+    return [
+        ChannelParticipantsSearch(''),  # Все пользователи
+        ChannelParticipantsRecent(),    # Недавние пользователи
+    ]
+
+
+def to_records(users, seen: set) -> List[ParticipantRecord]:
+    """Отбрасывает уже встреченных пользователей, ботов и администраторов."""
+    records = []
+    for user in users:
+        if user.id in seen:
+            continue
+        seen.add(user.id)
+        if not user.bot and not getattr(user, 'admin_rights', None):
+            records.append((user.id, user.username))
+    return records
+
+
+def participant_ids(participants) -> List[int]:
+    """
+    ID участников страницы в порядке выдачи сервера. participants.users -
+    только справочник: в нём нет повторов, порядок не гарантирован, а ещё там
+    пригласившие, назначившие и исключившие, которых может не быть на странице.
+    """
+    ids = []
+    for participant in participants.participants:
+        peer = getattr(participant, 'peer', None)
+        user_id = getattr(participant, 'user_id', None) or getattr(peer, 'user_id', None)
+        if user_id:
+            ids.append(user_id)
+    return ids
+
+
+def participants_hash(user_ids) -> int:
+    """
+    Хэш страницы участников для параметра hash (общий алгоритм кэширования
+    Telegram по ID участников в порядке выдачи, см. participant_ids). Если
+    страница не изменилась, сервер отвечает ChannelParticipantsNotModified
+    без списка участников.
+    """
+    acc = 0
+    for user_id in user_ids:
+        acc ^= acc >> 21
+        acc ^= (acc << 35) & 0xFFFFFFFFFFFFFFFF
+        acc ^= acc >> 4
+        acc = (acc + user_id) & 0xFFFFFFFFFFFFFFFF
+    return acc - (1 << 64) if acc >= (1 << 63) else acc
+
+
+def participants_request(entity, filter_type, offset, page_hash=0):
+    return GetParticipantsRequest(
+        channel=entity,
+        filter=filter_type,
+        offset=offset,
+        limit=PAGE_SIZE,
+        hash=page_hash
+    )
+
+
+class PageFetcher:
+    """Получение страниц участников через один клиент Telethon."""
+
+    def __init__(self, client, entity):
+        self.client = client
+        self.entity = entity
+
+    async def fetch(self, filter_type, offset, page_hash=0):
+        """
+        Один запрос GetParticipantsRequest. Темп задаёт ограничитель запросов
+        клиента; здесь пережидаем только длинные FloodWait, которые он пробросил.
+        """
+        while True:
+            try:
+                return await self.client(participants_request(self.entity, filter_type, offset, page_hash))
+            except FloodWaitError as e:
+                logger.warning(f"Необходимо подождать {e.seconds} секунд.")
+                await asyncio.sleep(e.seconds)
+
+
+def is_saturated(filter_type, participants) -> bool:
+    """Упёрлась ли выдача поискового запроса в серверный лимит."""
+    return (
+        isinstance(filter_type, ChannelParticipantsSearch)
+        and participants.count >= PARSE_QUERY_CAP
+    )
+
+
+async def iter_participant_pages(fetcher, filters=None, cursor: Optional[dict] = None,
+                                 seen: Optional[set] = None) -> AsyncIterator[ParticipantPage]:
+    """
+    Постранично отдаёт новых участников группы (без ботов и администраторов).
+
+    `fetcher` - объект с методом fetch(filter_type, offset, page_hash=0): PageFetcher для
+    одного аккаунта или PooledPageFetcher для пула сессий. `cursor` - курсор
+    последней сохранённой страницы, с него перебор продолжается; `seen` - ID
+    пользователей, отданных до него (их повторно не отдаём).
+
+    Если поиск с пустой строкой упирается в лимит выдачи, дальше участники
+    перебираются по префиксам (iter_participants_by_prefix).
+    ChatAdminRequiredError пробрасывается вызывающему коду.
+    """
+    seen = set() if seen is None else seen
+    cursor = cursor or {}
+
+    if "prefixes" in cursor:
+        async for page in iter_participants_by_prefix(fetcher, seen=seen, frontier=cursor["prefixes"]):
+            yield page
+        return
+
+    filters = filters or default_filters()
+    start = cursor.get("filter", 0)
+    for index in range(start, len(filters)):
+        filter_type = filters[index]
+        filter_name = filter_type.__class__.__name__
+        offset = cursor.get("offset", 0) if index == start else 0
+
+        while True:
+            participants = await fetcher.fetch(filter_type, offset)
+            if not participants.participants:
+                break
+
+            records = to_records(participants.users, seen)
+            if offset == 0 and is_saturated(filter_type, participants):
+                # Перебор по префиксам покрывает и остальные фильтры
+                logger.info(f"Выдача упёрлась в лимит ({participants.count} участников), перебор по префиксам")
+                frontier = {char: 0 for char in QUERY_ALPHABET}
+                yield ParticipantPage(filter_name, records, {"prefixes": frontier})
+                async for page in iter_participants_by_prefix(fetcher, seen=seen, frontier=frontier):
+                    yield page
+                return
+
+            # Смещение - по строкам выдачи сервера: оно попадает в курсор задания
+            offset += len(participants.participants)
+            yield ParticipantPage(filter_name, records, {"filter": index, "offset": offset})
+
+
+class RecentScan:
+    """
+    Новые участники группы по ChannelParticipantsRecent.
+
+    known_ids - ID участников с верха списка при прошлом обновлении,
+    page_hash - хэш той страницы. Перебор идёт от недавно вступивших и
+    останавливается на KNOWN_RUN известных участниках подряд. После pages():
+
+    - not_modified - первая страница не изменилась, новых участников нет;
+    - complete - новые участники получены все; False - список упёрся в лимит
+      выдачи раньше, чем нашлись известные участники, нужен полный перебор;
+    - count, top_ids, top_hash - число участников и новая отметка верха списка;
+    - joined - сколько участников вступило (включая ботов и без username);
+    - requests - сколько было запросов.
+    """
+
+    def __init__(self, fetcher, known_ids, page_hash: int = 0):
+        self.fetcher = fetcher
+        self.known_ids = set(known_ids)
+        self.page_hash = page_hash
+        self.not_modified = False
+        self.complete = False
+        self.count: Optional[int] = None
+        self.top_ids: List[int] = []
+        self.top_hash = 0
+        self.joined = 0
+        self.requests = 0
+
+    async def pages(self) -> AsyncIterator[ParticipantPage]:
+        filter_type = ChannelParticipantsRecent()
+        filter_name = filter_type.__class__.__name__
+        stop_after = min(KNOWN_RUN, len(self.known_ids))
+        seen = set()
+        offset = 0
+        run = 0
+
+        while True:
+            participants = await self.fetcher.fetch(filter_type, offset, self.page_hash if offset == 0 else 0)
+            self.requests += 1
+            if isinstance(participants, ChannelParticipantsNotModified):
+                self.not_modified = self.complete = True
+                return
+            ids = participant_ids(participants)
+            if offset == 0:
+                self.count = participants.count
+                self.top_ids = ids
+                self.top_hash = participants_hash(ids)
+            if not participants.participants:
+                self.complete = offset >= participants.count
+                return
+
+            fresh = []
+            for user_id in ids:
+                if user_id not in self.known_ids:
+                    run = 0
+                    fresh.append(user_id)
+                    continue
+                run += 1
+                if run >= stop_after:
+                    self.complete = True
+                    break
+            self.joined += len(fresh)
+            users = {user.id: user for user in participants.users}
+            yield ParticipantPage(filter_name, to_records([users[i] for i in fresh if i in users], seen))
+
+            offset += len(participants.participants)
+            if self.complete:
+                return
+            if offset >= participants.count:
+                # Весь список просмотрен
+                self.complete = True
+                return
+
+
+async def iter_participants_by_prefix(
+    fetcher,
+    alphabet: str = QUERY_ALPHABET,
+    concurrency: int = PARSE_CONCURRENCY,
+    max_depth: int = PARSE_MAX_PREFIX_DEPTH,
+    seen: Optional[set] = None,
+    frontier: Optional[Dict[str, int]] = None,
+) -> AsyncIterator[ParticipantPage]:
+    """
+    Перебор участников поиском по префиксам с ограниченной параллельностью.
+
+    Запросы выполняют `concurrency` воркеров, результаты сливаются в один
+    поток страниц без дублей. Очередь страниц ограничена, поэтому воркеры
+    не обгоняют запись в БД.
+
+    `frontier` - непройденные префиксы и смещения в них (по умолчанию все
+    символы alphabet с нуля). Фронт обновляется по мере того, как страницы
+    отдаются вызывающему коду, и попадает в курсор каждой страницы.
+    """
+    seen = set() if seen is None else seen
+    frontier = dict(frontier) if frontier is not None else {char: 0 for char in alphabet}
+    prefixes = asyncio.Queue()
+    pages = asyncio.Queue(maxsize=concurrency * 2)
+    for prefix, offset in frontier.items():
+        prefixes.put_nowait((prefix, offset))
+
+    async def scan(prefix, offset):
+        filter_type = ChannelParticipantsSearch(prefix)
+        filter_name = f"ChannelParticipantsSearch('{prefix}')"
+        while True:
+            participants = await fetcher.fetch(filter_type, offset)
+            if not participants.participants:
+                await pages.put(PrefixStep(prefix, None, [], None))
+                return
+
+            page = ParticipantPage(filter_name, to_records(participants.users, seen))
+
+            if offset == 0 and is_saturated(filter_type, participants) and len(prefix) < max_depth:
+                # Префикс слишком общий - уточняем, дочерние префиксы покроют остальное.
+                # Шаг родителя ставится в очередь раньше шагов дочерних префиксов.
+                children = [prefix + char for char in alphabet]
+                await pages.put(PrefixStep(prefix, None, children, page))
+                for child in children:
+                    prefixes.put_nowait((child, 0))
+                return
+
+            offset += len(participants.participants)
+            done = offset >= participants.count
+            await pages.put(PrefixStep(prefix, None if done else offset, [], page))
+            if done:
+                return
+
+    async def worker():
+        while True:
+            prefix, offset = await prefixes.get()
+            try:
+                await scan(prefix, offset)
+            except Exception as e:
+                await pages.put(e)
+            finally:
+                prefixes.task_done()
+
+    async def finish():
+        await prefixes.join()
+        await pages.put(None)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    tasks.append(asyncio.create_task(finish()))
+    try:
+        while True:
+            item = await pages.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if item.offset is None:
+                frontier.pop(item.prefix, None)
+            else:
+                frontier[item.prefix] = item.offset
+            for child in item.children:
+                frontier[child] = 0
+            if item.page is not None:
+                yield item.page._replace(cursor={"prefixes": dict(frontier)})
+    finally:
+        for task in tasks:
+            task.cancel()
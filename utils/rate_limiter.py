@@ -0,0 +1,188 @@
+"""
+Общий адаптивный ограничитель частоты запросов MTProto.
+
+Для каждого аккаунта и каждого метода TL (GetParticipantsRequest,
+InviteToChannelRequest, ...) заводится token bucket. Все задачи, работающие
+через один клиент, делят одни и те же bucket'ы. Скорость подстраивается по
+принципу AIMD: FloodWaitError уменьшает её вдвое и блокирует метод на
+e.seconds, каждый успешный запрос понемногу её увеличивает. Выученные
+скорости и блокировки хранятся в таблице rate_limits и переживают перезапуск.
+
+Клиент RateLimitedClient пропускает через ограничитель все запросы, включая
+вызовы внутри get_entity, iter_messages и других методов Telethon.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+from config import INVITE_DELAY, RATE_LIMIT_MAX_SLEEP
+from utils.metrics import FLOOD_WAITS, FLOOD_WAIT_SECONDS, RPC_DURATION, RPC_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Начальная скорость (запросов в секунду) для методов; остальные - DEFAULT_RATE
+DEFAULT_RATE = 1.0
+INITIAL_RATES = {
+    "GetParticipantsRequest": 1.0,
+    "GetFullChannelRequest": 1.0,
+    "GetHistoryRequest": 1.0,
+    "SearchRequest": 0.5,
+    "ResolveUsernameRequest": 0.2,
+    "InviteToChannelRequest": 1.0 / max(INVITE_DELAY, 1),
+}
+MIN_RATE_FACTOR = 0.05  # Ниже этой доли от начальной скорости не опускаемся
+MAX_RATE_FACTOR = 3.0   # Выше этой доли не разгоняемся
+DECREASE = 0.5          # Множитель скорости после FloodWait
+INCREASE = 0.01         # Прирост (доля начальной скорости) за успешный запрос
+
+
+class TokenBucket:
+    def __init__(self, method: str, rate: Optional[float] = None, blocked_until: float = 0.0,
+                 scale: float = 1.0):
+        self.method = method
+        self.base_rate = INITIAL_RATES.get(method, DEFAULT_RATE) * scale
+        self.rate = rate or self.base_rate
+        self.blocked_until = blocked_until
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        # Сколько секунд запросы ждали токенов и сколько - конца FloodWait
+        self.paced_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Lock выстраивает ожидающих в очередь, токены выдаются по порядку
+        async with self._lock:
+            while True:
+                delay = self.blocked_until - time.time()
+                if delay > 0:
+                    self.blocked_seconds += delay
+                    await asyncio.sleep(delay)
+                    continue
+
+                now = time.monotonic()
+                self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                delay = (1.0 - self.tokens) / self.rate
+                self.paced_seconds += delay
+                await asyncio.sleep(delay)
+
+    def on_flood(self, seconds: int):
+        self.rate = max(self.rate * DECREASE, self.base_rate * MIN_RATE_FACTOR)
+        self.blocked_until = max(self.blocked_until, time.time() + seconds)
+        self.tokens = 0.0
+
+    def on_success(self):
+        self.rate = min(self.rate + self.base_rate * INCREASE, self.base_rate * MAX_RATE_FACTOR)
+
+
+class RateLimiter:
+    """
+    Bucket'ы одного аккаунта. scale умножает начальные скорости - бенчмарки
+    ускоряют им лимиты, чтобы не ждать реальные паузы.
+    """
+
+    def __init__(self, db, account: str, scale: float = 1.0):
+        self.db = db
+        self.account = account
+        self.scale = scale
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    async def load(self):
+        rows = await self.db.fetchall(
+            "SELECT method, rate, blocked_until FROM rate_limits WHERE account = ?",
+            (self.account,),
+        )
+        for method, rate, blocked_until in rows:
+            self.buckets[method] = TokenBucket(method, rate, blocked_until, self.scale)
+
+    def bucket(self, method: str) -> TokenBucket:
+        if method not in self.buckets:
+            self.buckets[method] = TokenBucket(method, scale=self.scale)
+        return self.buckets[method]
+
+    @property
+    def paced_seconds(self) -> float:
+        return sum(b.paced_seconds for b in self.buckets.values())
+
+    @property
+    def blocked_seconds(self) -> float:
+        return sum(b.blocked_seconds for b in self.buckets.values())
+
+    async def _save(self, buckets):
+        await self.db.executemany(
+            "INSERT OR REPLACE INTO rate_limits (account, method, rate, blocked_until) VALUES (?, ?, ?, ?)",
+            [(self.account, b.method, b.rate, b.blocked_until) for b in buckets],
+        )
+
+    async def flush(self):
+        if self.buckets:
+            await self._save(self.buckets.values())
+
+    async def call(self, func, sender, request, ordered):
+        """Выполняет запрос(ы) Telethon с учётом лимитов; короткие FloodWait пережидает сам."""
+        requests = request if isinstance(request, (list, tuple)) else (request,)
+        buckets = [self.bucket(type(r).__name__) for r in requests]
+
+        while True:
+            # Длинную блокировку не пережидаем: вызывающий код (пул аккаунтов)
+            # переключится на другой аккаунт, как при обычном FloodWait
+            blocked = max(b.blocked_until for b in buckets) - time.time()
+            if blocked > RATE_LIMIT_MAX_SLEEP:
+                raise FloodWaitError(requests[0], capture=int(blocked) + 1)
+
+            for bucket in buckets:
+                await bucket.acquire()
+            try:
+                # flood_sleep_threshold=0: Telethon не спит сам, FloodWait приходит сюда
+                result = await func(sender, request, ordered, 0)
+            except FloodWaitError as e:
+                FLOOD_WAITS.inc(account=self.account, method=buckets[0].method)
+                FLOOD_WAIT_SECONDS.inc(e.seconds, account=self.account, method=buckets[0].method)
+                for bucket in buckets:
+                    bucket.on_flood(e.seconds)
+                logger.warning(
+                    f"[{self.account}] FloodWait {e.seconds} с на {buckets[0].method}, "
+                    f"скорость снижена до {buckets[0].rate:.3f} запр/с"
+                )
+                await self._save(buckets)
+                if e.seconds > RATE_LIMIT_MAX_SLEEP:
+                    raise
+                continue
+
+            for bucket in buckets:
+                bucket.on_success()
+            return result
+
+
+class RateLimitedClient(TelegramClient):
+    """TelegramClient, все запросы которого проходят через RateLimiter."""
+
+    rate_limiter: Optional[RateLimiter] = None
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        first = request[0] if isinstance(request, (list, tuple)) else request
+        method = type(first).__name__
+        account = self.rate_limiter.account if self.rate_limiter else "unknown"
+        status = "ok"
+        started = time.perf_counter()
+        try:
+            if self.rate_limiter is None:
+                return await super()._call(sender, request, ordered, flood_sleep_threshold)
+            return await self.rate_limiter.call(super()._call, sender, request, ordered)
+        except FloodWaitError:
+            status = "flood"
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            RPC_DURATION.observe(time.perf_counter() - started, method=method)
+            RPC_REQUESTS.inc(account=account, method=method, status=status)
@@ -0,0 +1,175 @@
+"""
+Постоянный кэш глобального поиска групп.
+
+Хранит два отображения:
+  - ключевое слово -> ID найденных чатов (таблица search_cache);
+  - ID чата -> результат проверки: комментарии, сообщения пользователей
+    (таблица chat_classification).
+
+Записи живут SEARCH_KEYWORD_TTL / SEARCH_CHAT_TTL секунд. В памяти держатся
+последние использованные записи (LRU), лишнее вытесняется и из памяти, и из
+БД. Результат по ключевому слову используется, только если все его чаты
+проверены недавно, иначе поиск повторяется.
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import (
+    SEARCH_KEYWORD_TTL,
+    SEARCH_CHAT_TTL,
+    SEARCH_CACHE_MAX_KEYWORDS,
+    SEARCH_CACHE_MAX_CHATS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+
+class SearchCache:
+    def __init__(self, db):
+        self.db = db
+        # keyword -> (chat_ids, cached_at)
+        self._keywords: "OrderedDict[str, tuple]" = OrderedDict()
+        # chat_id -> данные группы в формате global_search + checked_at
+        self._chats: "OrderedDict[int, dict]" = OrderedDict()
+        self._dirty_keywords = set()
+        self._dirty_chats = set()
+        self.hits = {"keyword": 0, "chat": 0}
+        self.misses = {"keyword": 0, "chat": 0}
+
+    async def load(self):
+        """Загружает в память последние использованные записи."""
+        rows = await self.db.fetchall(
+            "SELECT chat_id, title, username, comments_enabled, has_user_messages, checked_at "
+            "FROM chat_classification WHERE checked_at > ? ORDER BY last_used DESC LIMIT ?",
+            (time.time() - SEARCH_CHAT_TTL, SEARCH_CACHE_MAX_CHATS),
+        )
+        # Строки идут от новых к старым, в LRU кладём от старых к новым
+        for chat_id, title, username, comments_enabled, has_messages, checked_at in reversed(rows):
+            self._chats[chat_id] = {
+                "id": chat_id,
+                "title": title,
+                "username": username,
+                "comments_enabled": bool(comments_enabled),
+                "has_user_messages": bool(has_messages),
+                "checked_at": checked_at,
+            }
+
+        rows = await self.db.fetchall(
+            "SELECT keyword, chat_ids, cached_at FROM search_cache "
+            "WHERE cached_at > ? ORDER BY last_used DESC LIMIT ?",
+            (time.time() - SEARCH_KEYWORD_TTL, SEARCH_CACHE_MAX_KEYWORDS),
+        )
+        for keyword, chat_ids, cached_at in reversed(rows):
+            self._keywords[keyword] = (json.loads(chat_ids), cached_at)
+
+        logger.info(f"Кэш поиска загружен: {len(self._keywords)} запросов, {len(self._chats)} чатов")
+
+    def _fresh_chat(self, chat_id: int) -> Optional[dict]:
+        chat = self._chats.get(chat_id)
+        if chat is None or time.time() - chat["checked_at"] > SEARCH_CHAT_TTL:
+            return None
+        self._chats.move_to_end(chat_id)
+        self._dirty_chats.add(chat_id)
+        return chat
+
+    def get_keyword(self, keyword: str) -> Optional[List[dict]]:
+        """Проверенные чаты по ключевому слову или None, если нужен новый поиск."""
+        keyword = normalize_keyword(keyword)
+        entry = self._keywords.get(keyword)
+        chats = None
+        if entry and time.time() - entry[1] <= SEARCH_KEYWORD_TTL:
+            chats = [self._fresh_chat(chat_id) for chat_id in entry[0]]
+            if not all(chats):
+                chats = None
+
+        if chats is None:
+            self.misses["keyword"] += 1
+            return None
+        self.hits["keyword"] += 1
+        self._keywords.move_to_end(keyword)
+        self._dirty_keywords.add(keyword)
+        return chats
+
+    def get_chat(self, chat_id: int) -> Optional[dict]:
+        chat = self._fresh_chat(chat_id)
+        if chat is None:
+            self.misses["chat"] += 1
+        else:
+            self.hits["chat"] += 1
+        return chat
+
+    def put_keyword(self, keyword: str, chat_ids: List[int]):
+        keyword = normalize_keyword(keyword)
+        self._keywords[keyword] = (list(chat_ids), time.time())
+        self._keywords.move_to_end(keyword)
+        self._dirty_keywords.add(keyword)
+        while len(self._keywords) > SEARCH_CACHE_MAX_KEYWORDS:
+            self._keywords.popitem(last=False)
+
+    def put_chat(self, chat, comments_enabled: bool, has_user_messages: bool):
+        self._chats[chat.id] = {
+            "id": chat.id,
+            "title": chat.title,
+            "username": chat.username,
+            "comments_enabled": bool(comments_enabled),
+            "has_user_messages": bool(has_user_messages),
+            "checked_at": time.time(),
+        }
+        self._chats.move_to_end(chat.id)
+        self._dirty_chats.add(chat.id)
+        while len(self._chats) > SEARCH_CACHE_MAX_CHATS:
+            self._chats.popitem(last=False)
+
+    async def flush(self):
+        """Записывает изменения в БД одной транзакцией и вытесняет старые записи."""
+        now = time.time()
+        keywords = [k for k in self._dirty_keywords if k in self._keywords]
+        chats = [c for c in self._dirty_chats if c in self._chats]
+        self._dirty_keywords.clear()
+        self._dirty_chats.clear()
+        if not keywords and not chats:
+            return
+
+        async with self.db.transaction() as conn:
+            await conn.executemany(
+                "INSERT OR REPLACE INTO search_cache (keyword, chat_ids, cached_at, last_used) VALUES (?, ?, ?, ?)",
+                [(k, json.dumps(self._keywords[k][0]), self._keywords[k][1], now) for k in keywords],
+            )
+            await conn.executemany(
+                "INSERT OR REPLACE INTO chat_classification "
+                "(chat_id, title, username, comments_enabled, has_user_messages, checked_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (c["id"], c["title"], c["username"], int(c["comments_enabled"]),
+                     int(c["has_user_messages"]), c["checked_at"], now)
+                    for c in (self._chats[chat_id] for chat_id in chats)
+                ],
+            )
+            # LRU-вытеснение в БД
+            await conn.execute(
+                "DELETE FROM search_cache WHERE keyword NOT IN "
+                "(SELECT keyword FROM search_cache ORDER BY last_used DESC LIMIT ?)",
+                (SEARCH_CACHE_MAX_KEYWORDS,),
+            )
+            await conn.execute(
+                "DELETE FROM chat_classification WHERE chat_id NOT IN "
+                "(SELECT chat_id FROM chat_classification ORDER BY last_used DESC LIMIT ?)",
+                (SEARCH_CACHE_MAX_CHATS,),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "keyword_hits": self.hits["keyword"],
+            "keyword_misses": self.misses["keyword"],
+            "chat_hits": self.hits["chat"],
+            "chat_misses": self.misses["chat"],
+            "keywords": len(self._keywords),
+            "chats": len(self._chats),
+        }
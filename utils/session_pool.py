@@ -0,0 +1,296 @@
+"""
+Пул авторизованных аккаунтов Telethon.
+
+Основной аккаунт (STRING_SESSION) дополняется сессиями из каталога
+SESSIONS_DIR (файлы *.session или *.txt со StringSession) и из колонки
+users.session_file. Запросы парсинга и пачки инвайтов распределяются между
+аккаунтами: выбирается наименее загруженный. Аккаунт под FloodWait
+исключается из ротации до окончания ожидания, заблокированный - насовсем,
+а аккаунт без доступа к закрытой группе - для страниц этой группы.
+Состояние и дневные счётчики аккаунтов хранятся в таблице telethon_sessions;
+счётчик страниц парсинга пишется в БД не после каждого запроса, а раз в
+COUNTERS_FLUSH_INTERVAL секунд и при остановке пула.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Dict, List, Optional
+
+from telethon.errors import (
+    AuthKeyUnregisteredError,
+    ChannelPrivateError,
+    ChatAdminRequiredError,
+    FloodWaitError,
+    PeerFloodError,
+    SessionRevokedError,
+    UserDeactivatedBanError,
+    UserDeactivatedError,
+)
+from telethon.sessions import StringSession
+
+from config import API_ID, API_HASH, SESSIONS_DIR
+from utils.entity_cache import STALE_ERRORS, EntityCache
+from utils.participants import participants_request
+from utils.rate_limiter import RateLimitedClient, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых аккаунт больше нельзя использовать
+BANNED_ERRORS = (
+    AuthKeyUnregisteredError,
+    SessionRevokedError,
+    UserDeactivatedBanError,
+    UserDeactivatedError,
+)
+# Ошибки доступа одного аккаунта к группе: другой аккаунт может её видеть
+ACCESS_ERRORS = (ChannelPrivateError, ChatAdminRequiredError)
+PEER_FLOOD_BACKOFF = 24 * 3600  # Спам-ограничение аккаунта снимается примерно через сутки
+COUNTERS_FLUSH_INTERVAL = 30  # Как часто сохранять счётчик страниц парсинга, секунды
+
+
+class NoSessionAvailable(Exception):
+    """Все аккаунты заблокированы или ждут окончания FloodWait."""
+
+    def __init__(self, retry_at: Optional[float]):
+        super().__init__("Нет доступных аккаунтов Telethon")
+        self.retry_at = retry_at
+
+
+class PooledSession:
+    def __init__(self, name: str, client: RateLimitedClient, entity_cache: EntityCache):
+        self.name = name
+        self.client = client
+        self.entity_cache = entity_cache
+        self.flood_until = 0.0
+        self.banned = False
+        self.in_flight = 0
+        self.day = date.today().isoformat()
+        self.counters: Dict[str, int] = {"invites": 0, "parse_pages": 0}
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    @property
+    def available(self) -> bool:
+        return not self.banned and self.flood_until <= time.time()
+
+    def count(self, kind: str, amount: int = 1):
+        today = date.today().isoformat()
+        if self.day != today:
+            self.day = today
+            self.counters = {key: 0 for key in self.counters}
+        self.counters[kind] = self.counters.get(kind, 0) + amount
+        self.dirty = True
+
+    def used_today(self, kind: str) -> int:
+        return self.counters.get(kind, 0) if self.day == date.today().isoformat() else 0
+
+
+async def _open_client(session) -> Optional[RateLimitedClient]:
+    client = RateLimitedClient(session, API_ID, API_HASH)
+    await client.connect()
+    if not await client.is_user_authorized():
+        await client.disconnect()
+        return None
+    return client
+
+
+class SessionPool:
+    def __init__(self, db):
+        self.db = db
+        self.sessions: List[PooledSession] = []
+
+    @property
+    def primary(self) -> PooledSession:
+        return self.sessions[0]
+
+    async def add(self, name: str, client: RateLimitedClient) -> PooledSession:
+        if isinstance(client, RateLimitedClient):
+            # Все задачи этого аккаунта делят один набор лимитов
+            client.rate_limiter = RateLimiter(self.db, name)
+            await client.rate_limiter.load()
+        me = await client.get_me(input_peer=True)
+        entity_cache = EntityCache(self.db, me.user_id)
+        await entity_cache.load()
+        session = PooledSession(name, client, entity_cache)
+
+        row = await self.db.fetchone(
+            "SELECT flood_until, banned, day, invites_today, parse_pages_today FROM telethon_sessions WHERE name = ?",
+            (name,),
+        )
+        if row:
+            session.flood_until, banned, session.day, invites, pages = row
+            session.banned = bool(banned)
+            session.counters = {"invites": invites, "parse_pages": pages}
+        self.sessions.append(session)
+        return session
+
+    def _session_sources(self):
+        """Пары (имя, сессия Telethon) из каталога SESSIONS_DIR."""
+        if not SESSIONS_DIR or not os.path.isdir(SESSIONS_DIR):
+            return
+        for filename in sorted(os.listdir(SESSIONS_DIR)):
+            path = os.path.join(SESSIONS_DIR, filename)
+            if filename.endswith(".session"):
+                yield filename[:-len(".session")], path[:-len(".session")]
+            elif filename.endswith(".txt"):
+                with open(path, encoding="utf-8") as f:
+                    yield filename[:-len(".txt")], StringSession(f.read().strip())
+
+    async def load(self):
+        """Подключает дополнительные аккаунты из каталога и таблицы users."""
+        sources = list(self._session_sources())
+        rows = await self.db.fetchall("SELECT user_id, session_file FROM users WHERE session_file IS NOT NULL")
+        for user_id, session_file in rows:
+            if os.path.exists(session_file) or os.path.exists(f"{session_file}.session"):
+                sources.append((f"user_{user_id}", session_file.replace(".session", "")))
+
+        # Аккаунты подключаются параллельно - запуск бота не ждёт их по очереди
+        known = {session.name for session in self.sessions}
+        pending = {}
+        for name, session in sources:
+            if name not in known:
+                pending.setdefault(name, session)
+        await asyncio.gather(*(self._connect(name, session) for name, session in pending.items()))
+
+        names = sorted(session.name for session in self.sessions)
+        logger.info(f"Пул аккаунтов Telethon: {len(self.sessions)} ({', '.join(names)})")
+
+    async def _connect(self, name: str, session):
+        try:
+            client = await _open_client(session)
+        except Exception as e:
+            logger.error(f"Не удалось подключить сессию {name}: {e}")
+            return
+        if client is None:
+            logger.warning(f"Сессия {name} не авторизована, пропускаем")
+            return
+        await self.add(name, client)
+
+    async def _save(self, session: PooledSession):
+        await self.db.execute(
+            "INSERT OR REPLACE INTO telethon_sessions "
+            "(name, flood_until, banned, day, invites_today, parse_pages_today) VALUES (?, ?, ?, ?, ?, ?)",
+            (session.name, session.flood_until, int(session.banned), session.day,
+             session.used_today("invites"), session.used_today("parse_pages")),
+        )
+        session.dirty = False
+        session.saved_at = time.monotonic()
+
+    async def flush(self):
+        """Сохраняет несохранённые счётчики аккаунтов."""
+        for session in self.sessions:
+            if session.dirty:
+                await self._save(session)
+
+    def pick(self, kind: str, exclude=()) -> PooledSession:
+        """Наименее загруженный доступный аккаунт; exclude - имена аккаунтов, которые не подходят."""
+        candidates = [session for session in self.sessions if session.name not in exclude]
+        available = [session for session in candidates if session.available]
+        if not available:
+            waiting = [session.flood_until for session in candidates if not session.banned]
+            raise NoSessionAvailable(min(waiting) if waiting else None)
+        return min(available, key=lambda session: (session.in_flight, session.used_today(kind)))
+
+    def usable(self, exclude=()) -> bool:
+        """Есть ли незаблокированный аккаунт не из exclude (возможно, под FloodWait)."""
+        return any(not session.banned and session.name not in exclude for session in self.sessions)
+
+    @asynccontextmanager
+    async def acquire(self, kind: str, exclude=()):
+        session = self.pick(kind, exclude)
+        session.in_flight += 1
+        try:
+            yield session
+        finally:
+            session.in_flight -= 1
+
+    async def count(self, session: PooledSession, kind: str, amount: int = 1):
+        session.count(kind, amount)
+        await self._save(session)
+
+    async def report_flood(self, session: PooledSession, seconds: int):
+        session.flood_until = max(session.flood_until, time.time() + seconds)
+        logger.warning(f"Аккаунт {session.name} выведен из ротации на {seconds} секунд (FloodWait)")
+        await self._save(session)
+
+    async def report_banned(self, session: PooledSession, error: Exception):
+        session.banned = True
+        logger.error(f"Аккаунт {session.name} заблокирован и выведен из ротации: {error}")
+        await self._save(session)
+
+    async def handle_error(self, session: PooledSession, error: Exception) -> bool:
+        """Учитывает ошибку аккаунта. True - запрос можно повторить на другом аккаунте."""
+        if isinstance(error, FloodWaitError):
+            await self.report_flood(session, error.seconds)
+            return True
+        if isinstance(error, PeerFloodError):
+            await self.report_flood(session, PEER_FLOOD_BACKOFF)
+            return True
+        if isinstance(error, BANNED_ERRORS):
+            await self.report_banned(session, error)
+            return True
+        return False
+
+    def page_fetcher(self, username: str) -> "PooledPageFetcher":
+        return PooledPageFetcher(self, username)
+
+    async def close(self):
+        await self.flush()
+        for session in self.sessions:
+            limiter = getattr(session.client, 'rate_limiter', None)
+            if limiter:
+                await limiter.flush()
+        # Основной клиент отключает main.py
+        for session in self.sessions[1:]:
+            await session.client.disconnect()
+
+
+class PooledPageFetcher:
+    """
+    Страницы участников группы через пул: каждый запрос - на наименее
+    загруженном аккаунте. Аккаунты без доступа к группе (закрытая группа,
+    аккаунт не участник) дальше не используются для этой группы; ошибка
+    пробрасывается, только когда группу не видит ни один аккаунт.
+    """
+
+    def __init__(self, pool: SessionPool, username: str):
+        self.pool = pool
+        self.username = username
+        self.denied = set()
+
+    async def fetch(self, filter_type, offset, page_hash=0):
+        while True:
+            try:
+                async with self.pool.acquire("parse_pages", exclude=self.denied) as session:
+                    try:
+                        # access_hash у каждого аккаунта свой
+                        entity = await session.entity_cache.get_input_entity(session.client, self.username)
+                        result = await session.client(participants_request(entity, filter_type, offset, page_hash))
+                    except ACCESS_ERRORS as e:
+                        if isinstance(e, STALE_ERRORS):
+                            await session.entity_cache.invalidate(self.username)
+                        self.denied.add(session.name)
+                        if not self.pool.usable(exclude=self.denied):
+                            raise
+                        logger.warning(f"Аккаунт {session.name} не видит группу @{self.username}: {e}")
+                        continue
+                    except Exception as e:
+                        if isinstance(e, STALE_ERRORS):
+                            await session.entity_cache.invalidate(self.username)
+                        if await self.pool.handle_error(session, e):
+                            continue
+                        raise
+                # Счётчик страниц копится в памяти и сохраняется периодически
+                session.count("parse_pages")
+                if time.monotonic() - session.saved_at >= COUNTERS_FLUSH_INTERVAL:
+                    await self.pool._save(session)
+                return result
+            except NoSessionAvailable as e:
+                if e.retry_at is None:
+                    raise
+                delay = max(e.retry_at - time.time(), 1)
+                logger.warning(f"Все аккаунты ждут окончания FloodWait, пауза {int(delay)} секунд")
+                await asyncio.sleep(delay)
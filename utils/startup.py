@@ -0,0 +1,142 @@
+"""
+Быстрый запуск бота.
+
+Cron перезапускает бота каждые 15 минут, поэтому время до готового сервера
+важно. Порт вебхука слушается с первых миллисекунд (DeferredWebhook), тяжёлые
+модули (aiogram, Telethon, хендлеры) импортируются в отдельном потоке, пока
+открывается БД. Вебхук и команды бота регистрируются в Telegram, только если
+они изменились, и без сброса накопившихся апдейтов. Длительность каждого
+этапа пишется в лог и в метрику bot_startup_seconds.
+"""
+import asyncio
+import hashlib
+import importlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+from utils.metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Длительность этапов запуска; этапы могут выполняться параллельно."""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - begin
+            self.phases.append((name, seconds))
+            STARTUP_SECONDS.set(seconds, phase=name)
+            logger.debug(f"Этап запуска {name}: {seconds * 1000:.0f} мс")
+
+    async def measure(self, name: str, awaitable):
+        with self.phase(name):
+            return await awaitable
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def finish(self, name: str = "total") -> float:
+        """Отмечает готовность и пишет сводку по этапам в лог."""
+        total = self.elapsed()
+        STARTUP_SECONDS.set(total, phase=name)
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f}" for phase, seconds in self.phases)
+        logger.info(f"Бот готов за {total * 1000:.0f} мс ({phases}; мс)")
+        return total
+
+
+class DeferredWebhook:
+    """
+    Обработчик вебхука, который можно зарегистрировать до сборки диспетчера.
+    Пока диспетчер не подключён, запросы Telegram ждут: ответ не отправлен,
+    поэтому при сбое запуска Telegram доставит апдейт повторно.
+    """
+
+    def __init__(self):
+        self._handler = None
+        self._ready = asyncio.Event()
+
+    def attach(self, handler):
+        self._handler = handler
+        self._ready.set()
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        await self._ready.wait()
+        return await self._handler(request)
+
+
+def import_modules(names: Iterable[str]):
+    """Импортирует модули заранее (для asyncio.to_thread)."""
+    for name in names:
+        importlib.import_module(name)
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+
+async def _get_state(db, key: str) -> Optional[str]:
+    row = await db.fetchone("SELECT value FROM bot_state WHERE key = ?", (key,))
+    return row[0] if row else None
+
+
+async def _set_state(db, key: str, value: str):
+    await db.execute(
+        "INSERT OR REPLACE INTO bot_state (key, value, updated_at) VALUES (?, ?, ?)",
+        (key, value, time.time()),
+    )
+
+
+async def sync_webhook(bot, db, url: str, certificate: Optional[str] = None) -> bool:
+    """
+    Регистрирует вебхук, только если Telegram знает другой адрес или
+    сертификат. Накопившиеся апдейты не сбрасываются. True - вебхук обновлён.
+    """
+    from aiogram.types import FSInputFile
+
+    if certificate and not os.path.exists(certificate):
+        certificate = None
+    fingerprint = None
+    if certificate:
+        with open(certificate, "rb") as f:
+            fingerprint = hashlib.sha256(f.read()).hexdigest()
+    digest = _digest(url, fingerprint)
+
+    info = await bot.get_webhook_info()
+    if (
+        info.url == url
+        and info.has_custom_certificate == bool(certificate)
+        and await _get_state(db, "webhook") == digest
+    ):
+        logger.info(f"Вебхук уже зарегистрирован, ожидающих апдейтов: {info.pending_update_count}")
+        return False
+
+    await bot.set_webhook(url=url, certificate=FSInputFile(certificate) if certificate else None)
+    await _set_state(db, "webhook", digest)
+    logger.info(f"Вебхук зарегистрирован: {url}, ожидающих апдейтов: {info.pending_update_count}")
+    return True
+
+
+async def sync_commands(bot, db, commands) -> bool:
+    """Устанавливает команды бота, только если список изменился. True - обновлены."""
+    digest = _digest([(command.command, command.description) for command in commands])
+    if await _get_state(db, "commands") == digest:
+        return False
+    await bot.set_my_commands(commands)
+    await _set_state(db, "commands", digest)
+    logger.info("Команды бота обновлены")
+    return True
@@ -0,0 +1,229 @@
+"""
+Фоновые задачи пользователей.
+
+Долгая работа (парсинг участников, поиск групп) не выполняется внутри
+обработки апдейта: хендлер проверяет запрос, ставит задачу в TaskManager и
+сразу отвечает. Менеджер:
+
+- не запускает одну и ту же операцию дважды (ключ задачи, например
+  ("parse", group_id)) - повторный запрос получает DuplicateTask;
+- выполняет задачи одного пользователя по очереди, поэтому вторая долгая
+  операция ждёт первую, а не конкурирует с ней за аккаунты Telethon;
+- ограничивает число одновременных задач: всего (TASKS_MAX_CONCURRENT) и
+  по видам (TASKS_MAX_PARSE, TASKS_MAX_SEARCH);
+- помнит последние задачи каждого пользователя для команд /status и /cancel.
+
+Функция задачи получает объект Task и может писать в task.progress
+короткий текст о ходе работы - его показывает /status. При остановке бота
+выставляется task.stopping: задача должна сохранить состояние и завершиться
+на ближайшей безопасной точке, иначе через TASKS_DRAIN_TIMEOUT её отменят.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from config import (
+    TASKS_DRAIN_TIMEOUT,
+    TASKS_MAX_CONCURRENT,
+    TASKS_MAX_PARSE,
+    TASKS_MAX_PER_USER,
+    TASKS_MAX_SEARCH,
+)
+from utils.metrics import JOBS_QUEUED
+
+logger = logging.getLogger(__name__)
+
+# Сколько завершённых задач помнить (для /status)
+HISTORY_SIZE = 200
+
+STATUS_TEXT = {
+    'queued': "⏳ в очереди",
+    'running': "🔄 выполняется",
+    'done': "✅ завершена",
+    'failed': "❌ ошибка",
+    'cancelled': "⛔ отменена",
+}
+
+
+def default_limits() -> Dict[str, int]:
+    return {"parse": TASKS_MAX_PARSE, "search": TASKS_MAX_SEARCH}
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes} мин {seconds} с" if minutes else f"{seconds} с"
+
+
+class DuplicateTask(Exception):
+    """Такая операция уже выполняется или стоит в очереди."""
+
+    def __init__(self, task: "Task"):
+        super().__init__(f"Задача уже выполняется: {task.title}")
+        self.task = task
+
+
+class TooManyTasks(Exception):
+    """У пользователя уже TASKS_MAX_PER_USER незавершённых задач."""
+
+
+class Task:
+    def __init__(self, task_id: int, kind: str, user_id: int, title: str, key: Optional[Hashable]):
+        self.id = task_id
+        self.kind = kind
+        self.user_id = user_id
+        self.title = title
+        self.key = key
+        self.status = 'queued'
+        self.progress = ""
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Бот останавливается - пора сохранить состояние и выйти
+        self.stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def describe(self) -> str:
+        """Строка для /status."""
+        text = f"#{self.id} {self.title} - {STATUS_TEXT[self.status]}"
+        if self.status == 'running':
+            text += f" {format_duration(time.time() - self.started_at)}"
+        if self.progress and self.active:
+            text += f"\n    {self.progress}"
+        if self.error:
+            text += f"\n    {self.error}"
+        return text
+
+    def cancel(self) -> bool:
+        if not self.active or self._task is None:
+            return False
+        self._task.cancel()
+        return True
+
+    async def wait(self):
+        """Дождаться завершения задачи (её исключения не пробрасываются)."""
+        if self._task:
+            await asyncio.wait({self._task})
+
+
+class TaskManager:
+    def __init__(self, max_concurrent: int = TASKS_MAX_CONCURRENT, limits: Optional[Dict[str, int]] = None,
+                 max_per_user: int = TASKS_MAX_PER_USER):
+        self.max_per_user = max_per_user
+        self._global = asyncio.Semaphore(max_concurrent)
+        self._kinds = {kind: asyncio.Semaphore(n) for kind, n in (limits or default_limits()).items()}
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._by_key: Dict[Hashable, Task] = {}
+        self.tasks: "OrderedDict[int, Task]" = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def submit(self, kind: str, user_id: int, title: str, func: Callable[[Task], Awaitable[None]],
+               key: Optional[Hashable] = None, serial: bool = True,
+               on_cancel: Optional[Callable[[Task], Awaitable[None]]] = None) -> Task:
+        """
+        Ставит задачу в очередь и сразу возвращает её. serial=True - задача
+        ждёт окончания предыдущих задач этого пользователя. on_cancel
+        вызывается, если задачу отменил пользователь (в том числе пока она
+        ждала в очереди), но не при остановке бота.
+        """
+        if key is not None and key in self._by_key:
+            raise DuplicateTask(self._by_key[key])
+        if len(self.user_tasks(user_id, active_only=True)) >= self.max_per_user:
+            raise TooManyTasks(f"Не больше {self.max_per_user} задач одновременно")
+
+        task = Task(next(self._ids), kind, user_id, title, key)
+        self.tasks[task.id] = task
+        if key is not None:
+            self._by_key[key] = task
+        task._task = asyncio.create_task(self._run(task, func, serial, on_cancel))
+        logger.info(f"Задача #{task.id} ({kind}) пользователя {user_id} поставлена в очередь: {title}")
+        return task
+
+    async def _run(self, task: Task, func, serial: bool, on_cancel=None):
+        JOBS_QUEUED.inc(kind=task.kind)
+        queued = True
+        try:
+            async with AsyncExitStack() as stack:
+                # Сначала очередь пользователя, потом общие лимиты: ожидающая
+                # своей очереди задача не занимает общий слот
+                if serial:
+                    await stack.enter_async_context(self._user_locks.setdefault(task.user_id, asyncio.Lock()))
+                if task.kind in self._kinds:
+                    await stack.enter_async_context(self._kinds[task.kind])
+                await stack.enter_async_context(self._global)
+
+                JOBS_QUEUED.dec(kind=task.kind)
+                queued = False
+                task.status = 'running'
+                task.started_at = time.time()
+                await func(task)
+            task.status = 'done'
+        except asyncio.CancelledError:
+            task.status = 'cancelled'
+            logger.info(f"Задача #{task.id} отменена")
+            if on_cancel and not task.stopping:
+                try:
+                    await on_cancel(task)
+                except Exception as e:
+                    logger.error(f"Ошибка при отмене задачи #{task.id}: {e}", exc_info=True)
+        except Exception as e:
+            task.status = 'failed'
+            task.error = str(e)
+            logger.error(f"Ошибка в задаче #{task.id} ({task.title}): {e}", exc_info=True)
+        finally:
+            if queued:
+                JOBS_QUEUED.dec(kind=task.kind)
+            task.finished_at = time.time()
+            if task.key is not None and self._by_key.get(task.key) is task:
+                del self._by_key[task.key]
+            self._forget_finished()
+
+    def _forget_finished(self):
+        finished = [task_id for task_id, task in self.tasks.items() if not task.active]
+        for task_id in finished[:max(0, len(finished) - HISTORY_SIZE)]:
+            del self.tasks[task_id]
+
+    def user_tasks(self, user_id: int, active_only: bool = False) -> List[Task]:
+        return [
+            task for task in self.tasks.values()
+            if task.user_id == user_id and (task.active or not active_only)
+        ]
+
+    def cancel(self, user_id: int, task_id: Optional[int] = None) -> List[Task]:
+        """Отменяет незавершённые задачи пользователя (или одну - task_id)."""
+        cancelled = []
+        for task in self.user_tasks(user_id, active_only=True):
+            if (task_id is None or task.id == task_id) and task.cancel():
+                cancelled.append(task)
+        return cancelled
+
+    async def stop(self, timeout: float = TASKS_DRAIN_TIMEOUT):
+        """
+        Остановка при выключении бота: задачи в очереди отменяются сразу,
+        выполняющиеся получают task.stopping и до timeout секунд на то, чтобы
+        сохранить состояние; оставшиеся отменяются.
+        """
+        active = [task for task in self.tasks.values() if task.active and task._task]
+        for task in active:
+            task.stopping = True
+            if task.status == 'queued':
+                task._task.cancel()
+
+        running = [task._task for task in active if task.status == 'running']
+        if running and timeout > 0:
+            logger.info(f"Ожидание сохранения состояния задач: {len(running)}")
+            await asyncio.wait(running, timeout=timeout)
+
+        jobs = [task._task for task in active]
+        for job in jobs:
+            job.cancel()
+        if jobs:
+            await asyncio.gather(*jobs, return_exceptions=True)